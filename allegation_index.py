@@ -0,0 +1,260 @@
+"""
+Cross-complaint index of allegations, searchable by product, defendant and text.
+
+Every finished job's allegation rows are also written to a local SQLite index, so a
+question like "every Carbamazepine allegation naming Taro" is one query instead of
+opening each report. Product, category, complaint and defendant filters use B-tree
+indexes on lower-cased keys; the summary text is searched through an FTS5 table.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dedupe import NON_ALLEGATION_PRODUCTS, entity_name_key, split_entity_names
+from job_store import job_store
+from local_state import LOCAL_STATE_DIR, connect_sqlite, env_flag
+from observability import logger, timed_stage
+
+ALLEGATION_INDEX_ENABLED = env_flag("ALLEGATION_INDEX_ENABLED", True)
+ALLEGATION_INDEX_DB_PATH = os.getenv("ALLEGATION_INDEX_DB_PATH", os.path.join(LOCAL_STATE_DIR, "allegations.sqlite3"))
+ALLEGATION_SEARCH_DEFAULT_PAGE_SIZE = 50
+ALLEGATION_SEARCH_MAX_PAGE_SIZE = 500
+ALLEGATION_INDEX_SCHEMA_VERSION = 1 # Bumped when defendant keys change; older keys are rebuilt on open
+
+
+def entity_keys(value):
+    """
+    Defendant keys for a defendants field, normalized the same way dedupe compares names
+    ("Teva USA, Inc., Mylan" -> ["teva usa inc", "mylan"]).
+    """
+    keys = []
+    for name in split_entity_names(value or ""):
+        key = entity_name_key(name)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def fts_match_expression(query):
+    """
+    Turns free text into a safe FTS5 MATCH expression: every word (or "quoted phrase")
+    must appear, and a trailing * keeps prefix matching ("carbamaz*").
+    """
+    terms = []
+    for token in re.findall(r'"[^"]+"|\S+', query):
+        prefix = token.endswith("*") and not token.startswith('"')
+        text = token.strip('"').rstrip("*").replace('"', '""')
+        if text.strip():
+            terms.append(f'"{text}"' + ("*" if prefix else ""))
+    return " AND ".join(terms)
+
+
+class AllegationIndex:
+    """SQLite store of allegation rows from every finished job, with filter and full-text search."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS allegations (
+                allegation_id INTEGER PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                complaint_name TEXT,
+                complaint_key TEXT,
+                product_name TEXT,
+                product_key TEXT,
+                allegation_category TEXT,
+                category_key TEXT,
+                defendants TEXT,
+                other_entities TEXT,
+                summary TEXT,
+                pin_cite_page TEXT,
+                pin_cite_paragraph TEXT,
+                indexed_at REAL NOT NULL
+            )""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS allegation_defendants (
+                defendant_key TEXT NOT NULL,
+                allegation_id INTEGER NOT NULL,
+                PRIMARY KEY (defendant_key, allegation_id)
+            ) WITHOUT ROWID""")
+        conn.execute("CREATE TABLE IF NOT EXISTS indexed_jobs (job_id TEXT PRIMARY KEY, row_count INTEGER, indexed_at REAL)")
+        for column in ("job_id", "product_key", "category_key", "complaint_key"):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_allegations_{column} ON allegations({column})")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_allegation_defendants_id ON allegation_defendants(allegation_id)")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS allegations_fts USING fts5(summary, tokenize='porter unicode61')")
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 fall back to LIKE scans for q
+            logger.warning(f"SQLite FTS5 unavailable, allegation text search will scan: {e}")
+            self.fts_enabled = False
+        conn.commit()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < ALLEGATION_INDEX_SCHEMA_VERSION:
+            self._rebuild_defendant_keys(conn)
+
+    def _rebuild_defendant_keys(self, conn):
+        """Re-keys every indexed row's defendants with entity_keys (keys from older versions kept punctuation)."""
+        with conn:
+            conn.execute("DELETE FROM allegation_defendants")
+            for row in conn.execute("SELECT allegation_id, defendants FROM allegations").fetchall():
+                conn.executemany("INSERT OR IGNORE INTO allegation_defendants (defendant_key, allegation_id) VALUES (?, ?)",
+                                 [(key, row["allegation_id"]) for key in entity_keys(row["defendants"])])
+            conn.execute(f"PRAGMA user_version = {ALLEGATION_INDEX_SCHEMA_VERSION}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_sqlite(self.db_path)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def replace_job(self, job_id, rows):
+        """Indexes a job's report rows, replacing anything indexed for it before (e.g. after a resume)."""
+        conn = self._conn()
+        now = time.time()
+        indexed = 0
+        with conn:
+            self._delete_job(conn, job_id)
+            for row in rows:
+                if row.get("Product_Name") in NON_ALLEGATION_PRODUCTS:
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO allegations (job_id, complaint_name, complaint_key, product_name, product_key, "
+                    "allegation_category, category_key, defendants, other_entities, summary, pin_cite_page, "
+                    "pin_cite_paragraph, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, row.get("Complaint_Name"), str(row.get("Complaint_Name", "")).strip().lower(),
+                     row.get("Product_Name"), str(row.get("Product_Name", "")).strip().lower(),
+                     row.get("Allegation_Category"), str(row.get("Allegation_Category", "")).strip().lower(),
+                     row.get("Involved_Defendants_CoConspirators"), row.get("Other_Named_Entities"),
+                     row.get("Specific_Allegation_Summary"), str(row.get("Pin_Cite_Page", "")),
+                     str(row.get("Pin_Cite_Paragraph", "")), now))
+                allegation_id = cursor.lastrowid
+                conn.executemany("INSERT OR IGNORE INTO allegation_defendants (defendant_key, allegation_id) VALUES (?, ?)",
+                                 [(key, allegation_id) for key in entity_keys(row.get("Involved_Defendants_CoConspirators"))])
+                if self.fts_enabled:
+                    conn.execute("INSERT INTO allegations_fts (rowid, summary) VALUES (?, ?)",
+                                 (allegation_id, row.get("Specific_Allegation_Summary") or ""))
+                indexed += 1
+            conn.execute("INSERT OR REPLACE INTO indexed_jobs (job_id, row_count, indexed_at) VALUES (?, ?, ?)",
+                         (job_id, indexed, now))
+        return indexed
+
+    def _delete_job(self, conn, job_id):
+        ids = [(row[0],) for row in conn.execute("SELECT allegation_id FROM allegations WHERE job_id = ?", (job_id,))]
+        if not ids:
+            return
+        conn.executemany("DELETE FROM allegation_defendants WHERE allegation_id = ?", ids)
+        if self.fts_enabled:
+            conn.executemany("DELETE FROM allegations_fts WHERE rowid = ?", ids)
+        conn.execute("DELETE FROM allegations WHERE job_id = ?", (job_id,))
+
+    def indexed_job_ids(self):
+        return {row[0] for row in self._conn().execute("SELECT job_id FROM indexed_jobs")}
+
+    def search(self, q=None, product=None, defendant=None, category=None, complaint=None, job_id=None,
+               page=1, page_size=ALLEGATION_SEARCH_DEFAULT_PAGE_SIZE):
+        """
+        Returns (total, rows) for one page of matches. product and defendant match by
+        case-insensitive prefix ("carbamazepine" finds "Carbamazepine ER (Tegretol XR)"),
+        category and complaint exactly (ignoring case), q by full text over the summary.
+        Text matches are ordered by relevance, everything else by complaint, product and cite.
+        """
+        clauses, params, join = [], [], ""
+        if product:
+            clauses.append("a.product_key >= ? AND a.product_key < ?")
+            params += prefix_range(product)
+        if category:
+            clauses.append("a.category_key = ?")
+            params.append(category.strip().lower())
+        if complaint:
+            clauses.append("a.complaint_key = ?")
+            params.append(complaint.strip().lower())
+        if job_id:
+            clauses.append("a.job_id = ?")
+            params.append(job_id)
+        defendant_key = entity_name_key(defendant) if defendant else ""
+        if defendant_key:
+            # Keys are stored normalized (see entity_keys), so "Teva USA, Inc." finds "Teva USA Inc"
+            clauses.append("a.allegation_id IN (SELECT allegation_id FROM allegation_defendants "
+                           "WHERE defendant_key >= ? AND defendant_key < ?)")
+            params += prefix_range(defendant_key)
+
+        select = "a.*, NULL AS snippet"
+        order = "a.complaint_key, a.product_key, a.allegation_id"
+        match = fts_match_expression(q) if q else ""
+        if match and self.fts_enabled:
+            join = "JOIN allegations_fts ON allegations_fts.rowid = a.allegation_id"
+            clauses.append("allegations_fts MATCH ?")
+            params.append(match)
+            select = "a.*, snippet(allegations_fts, 0, '[', ']', ' ... ', 24) AS snippet"
+            order = "bm25(allegations_fts), a.allegation_id"
+        elif q:
+            for term in q.split():
+                clauses.append("a.summary LIKE ?")
+                params.append(f"%{term.strip('*')}%")
+
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM allegations a {join} {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {select} FROM allegations a {join} {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size]).fetchall()
+        return total, [{
+            "allegation_id": row["allegation_id"],
+            "job_id": row["job_id"],
+            "Product_Name": row["product_name"],
+            "Allegation_Category": row["allegation_category"],
+            "Specific_Allegation_Summary": row["summary"],
+            "Involved_Defendants_CoConspirators": row["defendants"],
+            "Other_Named_Entities": row["other_entities"],
+            "Pin_Cite_Page": row["pin_cite_page"],
+            "Pin_Cite_Paragraph": row["pin_cite_paragraph"],
+            "Complaint_Name": row["complaint_name"],
+            "snippet": row["snippet"]
+        } for row in rows]
+
+
+def prefix_range(value):
+    """[low, high) bounds that select keys starting with value, so the B-tree index does the prefix match."""
+    low = value.strip().lower()
+    return [low, low + "\uffff"]
+
+
+allegation_index = None
+if ALLEGATION_INDEX_ENABLED:
+    try:
+        allegation_index = AllegationIndex(ALLEGATION_INDEX_DB_PATH)
+    except Exception as e:
+        logger.warning(f"Allegation index unavailable, search is disabled: {e}")
+
+
+def index_job_allegations(job_id, rows):
+    """Adds a finished job's rows to the cross-complaint index. Failures never fail the job."""
+    if not allegation_index:
+        return
+    try:
+        with timed_stage("allegation_index", job_id):
+            indexed = allegation_index.replace_job(job_id, rows)
+        logger.info(f"  [Index] Indexed {indexed} allegations from job '{job_id}'.")
+    except Exception as e:
+        logger.warning(f"Could not index allegations for job '{job_id}': {e}", exc_info=True)
+
+
+def backfill_allegation_index():
+    """Indexes succeeded jobs that finished before the index existed (or while it was failing)."""
+    if not allegation_index:
+        return
+    try:
+        indexed_jobs = allegation_index.indexed_job_ids()
+        for job_id in job_store.succeeded_job_ids():
+            if job_id not in indexed_jobs:
+                job = job_store.get(job_id)
+                index_job_allegations(job_id, json.loads(job["results_json"] or "[]"))
+    except Exception as e:
+        logger.warning(f"Allegation index backfill failed: {e}")
@@ -0,0 +1,93 @@
+"""
+The allegation extraction prompt sent with every Gemini call, and the sanitizer its
+page text goes through first.
+"""
+import re
+
+# --- NEW: Text Sanitization Function for LLM Input ---
+def sanitize_text_for_json(text):
+    """
+    Sanitizes text to ensure it's safe for inclusion in a JSON string value.
+    This replaces problematic characters like unescaped backslashes, double quotes,
+    and certain control characters, preparing text before sending to the LLM.
+    """
+    if not isinstance(text, str):
+        return str(text) # Ensure the input is a string
+
+    # Escape backslashes: replace single '\' with double '\\'.
+    # This must be done carefully to avoid double-escaping already escaped characters.
+    # Simplest reliable way is to escape all backslashes first, then quotes.
+    # The LLM is then expected to convert standard newlines (\n) to \\n, etc.
+    # If the original text contains 'C:\Users\Docs', it should become 'C:\\Users\\Docs' in JSON.
+    text = text.replace('\\', '\\\\')
+
+    # Escape double quotes: replace '"' with '\"'.
+    text = text.replace('"', '\\"')
+    
+    # Replace common control characters (ASCII 0-31, 127) that are problematic in JSON
+    # except for standard whitespace that JSON handles ('\t', '\n', '\r').
+    # These non-standard control characters are not allowed unescaped in JSON strings.
+    # They should ideally be \\uXXXX escaped, but simpler to remove/replace for LLM input robustness.
+    # Removing them ensures the LLM doesn't attempt to copy invalid chars verbatim.
+    text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
+
+    return text
+
+
+# --- Allegation Extraction Prompt ---
+# Kept at module level so its content can be fingerprinted for the result cache.
+# Rendered with str.format(); literal braces are doubled as in an f-string.
+ALLEGATION_PROMPT_TEMPLATE = """
+    You are a highly precise legal assistant analyzing a page/chunk of a legal complaint.
+    Your absolute priority is to identify and extract **ALL specific, distinct allegations of anticompetitive conduct** that are *directly tied to a NAMED generic drug* found *within this page/chunk*.
+
+    Your entire response MUST be a single JSON object with one top-level key: "allegations".
+    The value of "allegations" MUST be a list of JSON objects. Each object in the list MUST represent ONE DISTINCT allegation related to a specific drug.
+
+    Each allegation object MUST have these 7 keys: # CHANGED: From 6 to 7 keys for Item 4
+    1.  "Product_Name": THIS IS MANDATORY. Provide the specific generic drug name(s) (and brand name in parentheses if available, e.g., "Carbamazepine ER (Tegretol XR)") that is the subject of THIS specific allegation. If multiple drugs are involved in the *same single distinct action*, list them comma-separated. If NO specific drug is mentioned in the immediate context of a general anticompetitive discussion, that discussion SHOULD NOT be included in the output. Every row MUST be tied to a specific drug.
+    2.  "Allegation_Category": Categorize the primary anticompetitive conduct for THIS allegation (e.g., "Market Allocation", "Price Fixing", "Bid Rigging", "Information Exchange", "Refusal to Compete", "Fair Share Conspiracy", "Other Anticompetitive Conduct"). Choose the most fitting.
+    3.  "Specific_Allegation_Summary": Quote the **full, entire relevant paragraphs verbatim** from the source text that contain the core details of the alleged anticompetitive conduct. Ensure the quoted text directly supports the identified allegation and mentions the specific drug involved. Do not summarize. Include all text of *each* paragraph that is truly relevant. Prioritize completeness over brevity for this field. # MODIFIED: For Item 5 (Full Paragraph Text)
+    4.  "Involved_Defendants_CoConspirators": List ONLY the company names (e.g., "Sandoz, Taro") explicitly mentioned in the text associated with THIS SPECIFIC allegation as participating in or directly affected by the conduct.
+    5.  "Pin_Cite_Page": The SEGMENT ID (e.g., "S1", "S2") of the segment containing the quoted text. The text below is divided into segments (a page, or part of a page), each introduced by a marker line such as "=== SEGMENT S1 ===". Use the ID from the nearest marker ABOVE where the quoted paragraph begins. Do NOT use page numbers printed in the document itself.
+    6.  "Pin_Cite_Paragraph": The PARAGRAPH NUMBER from the original document if it's explicitly visible (e.g., "251") *within the text you are quoting for "Specific_Allegation_Summary"*. If a paragraph number (e.g., "251.") is visible as a prefix to a quoted paragraph, you MUST extract and provide it here. If paragraph numbers are not explicit or cannot be clearly determined from the provided text chunk, state "N/A". # MODIFIED: For Item 6 (Pin Cites N/A)
+    7.  "Other_Named_Entities": List any other relevant individuals or companies (not already listed in "Involved_Defendants_CoConspirators") who are explicitly mentioned in the text of THIS specific allegation and are relevant to it, comma-separated. If none are explicitly mentioned, state "N/A". # ADDED: For Item 4
+
+    GUIDELINES:
+    - THOROUGHNESS: Scan *only* the provided text from this page/chunk for allegations that name a specific drug.
+    - GRANULARITY: Each distinct allegation (e.g., a specific agreement, a specific bid rigging instance, a specific price increase for a drug) should be a SEPARATE JSON object, even if for the same drug.
+    - STRICT PRODUCT NAME: DO NOT output any allegation where a specific drug name is not clearly and directly identifiable in the text of the allegation itself. General conspiracy discussions without a drug name should be omitted.
+    - PRECISION: Ensure "Involved_Defendants_CoConspirators" and "Specific_Allegation_Summary" are strictly derived from the text supporting THAT particular allegation.
+    - JSON FORMAT: The final output MUST be a valid JSON object with the "allegations" key. All string values within the JSON MUST be properly escaped for JSON syntax. For example, literal newline characters (Python's '\n') must be escaped as '\\n', double quotes (Python's '"') inside a string value must be escaped as '\"', and literal backslashes (Python's '\') must be escaped as '\\\\'. This is crucial for correctly representing verbatim text in JSON.
+    
+    Example (Desired Structure for a chunk of two segments with multiple allegations for one drug):
+    {{
+      "allegations": [
+        {{
+          "Product_Name": "Carbamazepine ER (Tegretol XR)",
+          "Allegation_Category": "Market Allocation",
+          "Specific_Allegation_Summary": "\"251. In 2009, Sandoz and Taro conspired to divide the market for Carbamazepine ER, which included 'discussing who would target Walmart.'\"",
+          "Involved_Defendants_CoConspirators": "Sandoz, Taro, Walmart",
+          "Pin_Cite_Page": "S1",
+          "Pin_Cite_Paragraph": "251",
+          "Other_Named_Entities": "N/A" # ADDED: For Item 4 in example
+        }},
+        {{
+          "Product_Name": "Carbamazepine ER (Tegretol XR)",
+          "Allegation_Category": "Price Protection / Market Allocation",
+          "Specific_Allegation_Summary": "\"273. In 2014, Sandoz 'declined repeated bid requests from Walmart' to protect Taro’s price increase on Carbamazepine ER.\\\\nThis is a line with a backslash: C:\\\\Users\\\\Doc.\"", # Example with escaped newline and backslash for clarity
+          "Involved_Defendants_CoConspirators": "Sandoz, Taro, Walmart",
+          "Pin_Cite_Page": "S2",
+          "Pin_Cite_Paragraph": "273",
+          "Other_Named_Entities": "John Doe (CEO)" # ADDED: For Item 4 in example
+        }}
+      ]
+    }}
+
+    Analyze the following text (one or more segments):
+    ---BEGIN PAGE TEXT---
+    {text_chunk}
+    ---END PAGE TEXT---
+    
+    Your entire response MUST be a single JSON object structured as {{"allegations": [...]}}.
+    """
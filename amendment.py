@@ -0,0 +1,207 @@
+"""
+Aligns an amended complaint with the filing it replaces.
+
+An amended complaint usually rewrites a handful of numbered paragraphs while the
+pagination shifts underneath, so page-keyed reuse (the result cache, checkpoints)
+misses. In amendment mode both versions are split into numbered paragraphs, the
+paragraph hashes are aligned with difflib, and only new or changed paragraphs go to the
+LLM. Baseline allegations whose paragraphs are unchanged carry over with their paragraph
+and page cites renumbered.
+"""
+import difflib
+import hashlib
+import os
+import re
+from collections import namedtuple
+
+import pdf_extraction
+from dedupe import join_unique, pin_cite_sort_key
+from pdf_pool import PDF_EXTRACTION_BATCH_PAGES, get_pdf_extraction_pool
+
+PARAGRAPH_START_PATTERN = re.compile(r"^[ \t]*(\d{1,4})\.[ \t]+(?=\S)", re.MULTILINE)
+PARAGRAPH_MAX_NUMBER_GAP = int(os.getenv("PARAGRAPH_MAX_NUMBER_GAP", "25")) # "12." after para 500 is a list item, not a paragraph
+# Page furniture that moves when pagination shifts: bare page numbers and ECF headers
+PAGE_FURNITURE_PATTERN = re.compile(
+    r"^[ \t]*(?:(?:page[ \t]+)?\d+(?:[ \t]+of[ \t]+\d+)?|Case[ \t]+\S+.*\bPage[ \t]+\d+[ \t]+of[ \t]+\d+.*)[ \t]*$",
+    re.IGNORECASE | re.MULTILINE)
+AMENDMENT_CARRYOVER_PAGE_ID = "amendment_carryover" # job_page_results key for carried-over rows
+MAX_CITED_PARAGRAPH_RANGE = 50
+
+NumberedParagraph = namedtuple("NumberedParagraph", ["number", "digest", "pieces"]) # pieces: [(page, text)]
+AmendmentPlan = namedtuple("AmendmentPlan", ["pages_to_send", "carried_pages", "carried_rows", "stats"])
+
+
+def paragraph_digest(text):
+    """Hash of a paragraph's wording, ignoring its number, line wrapping and page furniture."""
+    body = PAGE_FURNITURE_PATTERN.sub(" ", text)
+    body = PARAGRAPH_START_PATTERN.sub("", body, count=1)
+    body = " ".join(body.split())
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+
+def split_numbered_paragraphs(pages):
+    """
+    Splits [(page, text)] (in document order) into NumberedParagraphs. A paragraph runs
+    from its "251." line to the next paragraph start, across page breaks; text before
+    the first paragraph (caption, headings) comes back with number None. Numbers must
+    increase by at most PARAGRAPH_MAX_NUMBER_GAP, so nested numbered lists and years at
+    the start of a line are not mistaken for paragraphs.
+    """
+    paragraphs = []
+    number, pieces = None, []
+
+    def close():
+        if any(text.strip() for _, text in pieces):
+            paragraphs.append(NumberedParagraph(number, paragraph_digest("".join(text for _, text in pieces)), pieces))
+
+    for page, text in pages:
+        position = 0
+        for match in PARAGRAPH_START_PATTERN.finditer(text):
+            candidate = int(match.group(1))
+            if not (number or 0) < candidate <= (number or 0) + PARAGRAPH_MAX_NUMBER_GAP:
+                continue
+            if match.start() > position:
+                pieces.append((page, text[position:match.start()]))
+            close()
+            number, pieces, position = candidate, [], match.start()
+        if position < len(text):
+            pieces.append((page, text[position:]))
+    close()
+    return paragraphs
+
+
+def cited_paragraph_numbers(cite):
+    """Paragraph numbers in a Pin_Cite_Paragraph value ("251", "251-253", "12, 14")."""
+    numbers = []
+    for start, end, single in re.findall(r"(\d+)\s*(?:-|–|to)\s*(\d+)|(\d+)", str(cite)):
+        if single:
+            numbers.append(int(single))
+        elif 0 <= int(end) - int(start) <= MAX_CITED_PARAGRAPH_RANGE:
+            numbers.extend(range(int(start), int(end) + 1))
+        else:
+            numbers.extend((int(start), int(end)))
+    return numbers
+
+
+def load_document_pages(path, filename):
+    """Raw text of a PDF as [(page_number, text)], or of a DOCX as [(None, paragraph)]."""
+    if filename.lower().endswith(".pdf"):
+        num_pages = pdf_extraction.count_pages(path)
+        pages = []
+        for batch in pdf_extraction.iter_page_batches(path, num_pages, pool=get_pdf_extraction_pool(),
+                                                      batch_pages=PDF_EXTRACTION_BATCH_PAGES):
+            pages.extend(batch)
+        return sorted(pages)
+    if filename.lower().endswith(".docx"):
+        from docx import Document
+        return [(None, p.text + "\n") for p in Document(path).paragraphs if p.text.strip()]
+    raise ValueError("Unsupported file type. Please upload a PDF or DOCX file.")
+
+
+def plan_amendment(baseline_pages, baseline_rows, new_pages, complaint_name):
+    """
+    Aligns the amended document (new_pages) with its baseline and returns an AmendmentPlan:
+    the text still to analyze as [(page, text)], pages with text but nothing to send,
+    the baseline rows carried over (with cites rewritten) and alignment stats.
+    """
+    old = split_numbered_paragraphs(baseline_pages)
+    new = split_numbered_paragraphs(new_pages)
+    matcher = difflib.SequenceMatcher(None, [p.digest for p in old], [p.digest for p in new], autojunk=False)
+    old_to_new = {}
+    for tag, i1, i2, j1, _ in matcher.get_opcodes():
+        if tag == "equal":
+            old_to_new.update((i1 + k, j1 + k) for k in range(i2 - i1))
+
+    # Text before the first numbered paragraph is always re-read: allegations found there
+    # can't be tied to a paragraph number, so they can't be carried over
+    resend = {index for index, paragraph in enumerate(new)
+              if paragraph.number is None or index not in old_to_new.values()}
+    old_index_by_number = {}
+    old_indices_by_page = {}
+    for index, paragraph in enumerate(old):
+        if paragraph.number is not None:
+            old_index_by_number.setdefault(paragraph.number, index)
+        for page, _ in paragraph.pieces:
+            old_indices_by_page.setdefault(str(page), []).append(index)
+
+    # An allegation is carried over only if every paragraph it cites is unchanged. If some
+    # of them changed, its unchanged paragraphs are re-sent too so the LLM sees the
+    # allegation whole. Paragraph cites that can't be found (or a row without any) fall
+    # back to the paragraphs on its cited pages. A row tied to no text at all (no page
+    # or paragraph cite, e.g. from a DOCX) is carried over as it was.
+    candidates = []
+    rows_considered = rows_resent = 0
+    carried_rows = []
+    for row in baseline_rows:
+        if row.get("Product_Name") in ("N/A", "No Data"):
+            continue
+        rows_considered += 1
+        numbers = [] if row.get("Product_Name") == "ERROR" else cited_paragraph_numbers(row.get("Pin_Cite_Paragraph", ""))
+        old_indices = [old_index_by_number.get(number) for number in numbers]
+        if numbers and all(index in old_to_new for index in old_indices):
+            candidates.append((row, old_indices))
+            continue
+        old_indices = [index for index in old_indices if index is not None]
+        if len(old_indices) < len(numbers) or not numbers:
+            old_indices += [index for page in re.split(r"[,;]", str(row.get("Pin_Cite_Page", "")))
+                            for index in old_indices_by_page.get(page.strip(), [])]
+        if not old_indices:
+            carried_rows.append(dict(row, Complaint_Name=complaint_name))
+            continue
+        # Paragraphs that changed were re-sent above as their amended versions
+        resend.update(old_to_new[index] for index in old_indices if index in old_to_new)
+        rows_resent += 1
+    rows_carried_as_is = len(carried_rows)
+
+    for row, old_indices in candidates:
+        new_indices = [old_to_new[index] for index in old_indices]
+        if resend.intersection(new_indices):
+            rows_resent += 1
+            continue
+        renumber = {old[index].number: new[new_index].number for index, new_index in zip(old_indices, new_indices)}
+        carried = dict(row, Complaint_Name=complaint_name)
+        carried["Pin_Cite_Paragraph"] = re.sub(
+            r"\d+", lambda m: str(renumber.get(int(m.group()), m.group())), str(row.get("Pin_Cite_Paragraph", "")))
+        summary = str(row.get("Specific_Allegation_Summary", ""))
+        for old_number, new_number in renumber.items():
+            if old_number != new_number:
+                summary = re.sub(rf"(?<![\d.$]){old_number}\.(?=\s)", f"{new_number}.", summary)
+        carried["Specific_Allegation_Summary"] = summary
+        first_page = {new[new_index].number: str(new[new_index].pieces[0][0])
+                      for new_index in new_indices if new[new_index].pieces[0][0] is not None}
+        # Merged rows pair "; "-separated paragraph groups with page groups (see merge_pin_cites)
+        page_groups = [join_unique((first_page.get(number) for number in cited_paragraph_numbers(group)
+                                    if number in first_page), sort_key=pin_cite_sort_key)
+                       for group in carried["Pin_Cite_Paragraph"].split(";")]
+        carried["Pin_Cite_Page"] = "; ".join(page_groups) if any(group != "N/A" for group in page_groups) else "N/A"
+        carried_rows.append(carried)
+
+    pages_to_send = []
+    for index in sorted(resend):
+        for page, text in new[index].pieces:
+            if not text.strip():
+                continue
+            if pages_to_send and pages_to_send[-1][0] == page:
+                pages_to_send[-1] = (page, pages_to_send[-1][1] + text)
+            else:
+                pages_to_send.append((page, text))
+    sent_pages = {page for page, _ in pages_to_send}
+    carried_pages = [page for page, text in new_pages if text.strip() and page is not None and page not in sent_pages]
+    # Pages without any text still go through, so they get their "no text extracted" row
+    pages_to_send.extend((page, text) for page, text in new_pages if page is not None and not text.strip())
+
+    unchanged = len(old_to_new)
+    stats = {
+        "baseline_paragraphs": len(old),
+        "amended_paragraphs": len(new),
+        "unchanged_paragraphs": unchanged,
+        "new_or_changed_paragraphs": len(new) - unchanged,
+        "paragraphs_sent": len(resend),
+        "rows_carried_over": len(carried_rows),
+        "rows_carried_as_is": rows_carried_as_is, # Tied to no text, so kept with their baseline cites
+        "rows_resent": rows_resent, # Their paragraphs (or pages) are analyzed again
+        "rows_dropped": rows_considered - len(carried_rows) - rows_resent, # Always 0
+        "chars_sent": sum(len(text) for _, text in pages_to_send),
+        "chars_total": sum(len(text) for _, text in new_pages)
+    }
+    return AmendmentPlan(pages_to_send, carried_pages, carried_rows, stats)
@@ -0,0 +1,620 @@
+"""
+The analysis pipeline: runs queued jobs from upload to finished report.
+
+Analyses run as background jobs so uploads don't hold a server thread (or the HTTP
+connection) for the whole run. A job extracts its document's pages, packs them into
+chunks, sends them through the shared Gemini scheduler, checkpoints every chunk and page
+result in the job store, and streams the merged rows into the report. Jobs are
+recorded in the job store (job_store.py) and run on the pools below.
+"""
+import itertools
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import clients
+import pdf_extraction
+from allegation_index import index_job_allegations
+from allegation_prompt import sanitize_text_for_json
+from amendment import AMENDMENT_CARRYOVER_PAGE_ID, load_document_pages, plan_amendment
+from chunk_ordering import CHUNK_ORDERING, estimate_chunk_cost, predicted_makespan
+from chunk_planning import ChunkPlanner, LEGACY_DOCX_PARAS_PER_CHUNK
+from clients import OUTPUT_CONTAINER_NAME, UPLOAD_CONTAINER_NAME, clients_ready
+from dedupe import DEDUPE_ENABLED, merge_near_duplicate_allegations
+from gemini_extraction import analyze_text_chunk_with_gemini
+from job_store import job_store
+from observability import StageTimings, active_job_timings, logger, metrics, record_stage, timed_iter, timed_stage
+from pdf_pool import PDF_EXTRACTION_BATCH_PAGES, PDF_EXTRACTION_PROCESSES, get_pdf_extraction_pool
+from relevance_prefilter import format_page_ranges, get_relevance_prefilter, prefilter_skip_record
+from reports import (
+    REPORT_FORMATS, REPORT_FORMAT_DEFAULT, stream_report_to_blob, upload_report_streaming, write_batch_xlsx_report
+)
+from scheduling import GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE, gemini_scheduler
+from spooling import (
+    archive_input_document, archive_upload_executor, release_spooled_input, retain_spooled_input,
+    spool_to_local_file
+)
+
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "900")) # Running jobs with no progress this long are requeued at startup
+BATCH_DOCUMENT_WORKERS = int(os.getenv("BATCH_DOCUMENT_WORKERS", "8"))
+analysis_job_executor = ThreadPoolExecutor(max_workers=ANALYSIS_JOB_WORKERS, thread_name_prefix="analysis-job")
+# Batch documents get their own, wider pool: each worker only extracts and feeds pages to
+# the shared Gemini scheduler, so many documents in flight keep the quota saturated.
+batch_document_executor = ThreadPoolExecutor(max_workers=BATCH_DOCUMENT_WORKERS, thread_name_prefix="batch-document")
+
+# Streaming mode for very large filings: extraction runs at most two batches ahead per
+# worker, and a new chunk is only queued for Gemini once fewer than MAX_PAGES_IN_FLIGHT
+# pages are waiting on the LLM (finished chunks are collected first to make room). Page
+# text is dropped as soon as its results are recorded, so peak memory depends on these
+# windows rather than on page count.
+STREAMING_EXTRACTION_MIN_PAGES = int(os.getenv("STREAMING_EXTRACTION_MIN_PAGES", "300")) # 0 = always stream
+MAX_PAGES_IN_FLIGHT = int(os.getenv("MAX_PAGES_IN_FLIGHT", "200"))
+STREAMING_EXTRACTION_BATCHES_AHEAD = 2 * max(1, PDF_EXTRACTION_PROCESSES)
+
+
+def plan_amendment_for_job(job_id, baseline_job_id, input_path, original_filename, complaint_name):
+    """Re-reads the baseline job's archived upload (no LLM calls) and aligns this job's document with it."""
+    baseline_job = job_store.get(baseline_job_id)
+    if not baseline_job or baseline_job["status"] != "succeeded":
+        raise ValueError(f"Baseline job '{baseline_job_id}' is missing or did not finish successfully.")
+
+    baseline_filename = baseline_job["original_filename"]
+    baseline_blob_client = clients.blob_service_client.get_container_client(UPLOAD_CONTAINER_NAME).get_blob_client(
+        baseline_job["input_blob_name"])
+    with timed_stage("amendment_baseline_fetch", job_id):
+        baseline_path = spool_to_local_file(baseline_blob_client.download_blob(),
+                                            suffix=os.path.splitext(baseline_filename)[1].lower())
+    try:
+        with timed_stage("amendment_extraction", job_id):
+            baseline_pages = load_document_pages(baseline_path, baseline_filename)
+            new_pages = load_document_pages(input_path, original_filename)
+    finally:
+        release_spooled_input(baseline_path)
+
+    with timed_stage("amendment_alignment", job_id):
+        plan = plan_amendment(baseline_pages, job_store.job_rows(baseline_job_id), new_pages, complaint_name)
+    return plan._replace(stats=dict(plan.stats, baseline_job_id=baseline_job_id))
+
+
+def analysis_options_from_form(form):
+    """Per-upload analysis options shared by /analyze and /analyze_batch. Raises ValueError for bad input."""
+    report_format = form.get("report_format", REPORT_FORMAT_DEFAULT).lower()
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format. Choose one of: {', '.join(REPORT_FORMATS)}.")
+    return {
+        # "bypass_cache" forces fresh Gemini calls (results still refresh the cache)
+        "use_cache": form.get("bypass_cache", "").lower() not in ("1", "true", "yes", "on"),
+        # "prefilter=off" turns page scoring off for this upload (see relevance_prefilter.PREFILTER_MODE)
+        "use_prefilter": form.get("prefilter", "").lower() not in ("0", "false", "no", "off"),
+        "report_format": report_format,
+    }
+
+
+def queue_document_job(job_id, original_filename, input_path, options, spool_seconds=0.0, batch_id=None):
+    """Records a job for a spooled document and starts archiving it; the caller enqueues the job."""
+    input_blob_name = f"{job_id}_{original_filename}" # Unique name for the uploaded blob
+    record_stage("upload_spool", spool_seconds)
+
+    # Two holders of the spooled file: the archival upload and the analysis job
+    retain_spooled_input(input_path, holders=2)
+    archive_upload_executor.submit(archive_input_document, input_path, input_blob_name)
+
+    job_store.create(job_id, original_filename, input_blob_name, dict(options, input_path=input_path), batch_id=batch_id)
+    job_store.merge_stats(job_id, upload={"spool_seconds": round(spool_seconds, 3),
+                                          "bytes": os.path.getsize(input_path)})
+
+
+def process_analysis_job(job_id, job):
+    """
+    Runs the extraction -> LLM -> Excel pipeline for a queued job.
+    Returns (results_for_json, excel_blob_name). Progress is written to the job store.
+
+    Every planned chunk and every collected result is checkpointed in the job store, so a
+    job that is resumed (after a crash, or via /jobs/<id>/resume) only calls the LLM for
+    chunks that are missing or came back as ERROR rows. Once the plan is complete, a
+    resumed job skips extraction entirely and works from the stored chunk text.
+    """
+    original_filename = job["original_filename"]
+    input_blob_name = job["input_blob_name"]
+    unique_id = job_id
+    use_cache = job["options"].get("use_cache", True)
+    report_format = job["options"].get("report_format", REPORT_FORMAT_DEFAULT)
+    # Amendment mode sends diff fragments, not whole pages, so they are never pre-filtered
+    use_prefilter = job["options"].get("use_prefilter", True) and not job["options"].get("baseline_job_id")
+    prefilter = get_relevance_prefilter() if use_prefilter else None
+    prefilter_enforced = prefilter is not None and prefilter.mode == "enforce"
+
+    # Extract complaint name from original filename for Item 3
+    complaint_name = os.path.splitext(original_filename)[0] # ADDED: For Item 3
+
+    # Get blob client for the output container
+    output_container_client = clients.blob_service_client.get_container_client(OUTPUT_CONTAINER_NAME)
+
+    # Checkpoint left by an earlier attempt at this job (empty for a fresh job)
+    plan_complete = job["stats"].get("plan_complete", False)
+    settled_page_ids = job_store.settled_page_ids(job_id)
+    input_path = job["options"].get("input_path")
+
+    try:
+        prefilter_skipped = [] # Pages the relevance pre-filter kept away from the LLM (or, in audit mode, would have)
+        pages_scored = 0
+        chunks_reused = 0
+        # Pages go through the shared process-wide scheduler, queued under this job's id
+        futures = {} # future -> PlannedChunk, until the result is collected
+        chunk_positions = itertools.count()
+        chunks_submitted = 0
+        tasks_collected = 0
+        rows_collected = 0
+        streaming = False # Set for large PDFs (see STREAMING_EXTRACTION_MIN_PAGES)
+        pages_in_flight = 0
+        peak_pages_in_flight = 0
+        backpressure_waits = 0
+        chunk_costs = [] # ChunkCost of every chunk sent to the LLM, for the completion-time prediction
+        chunk_arrivals = [] # Seconds after the first submission that each of those chunks was queued
+        first_submit_time = None
+        rate_budget_at_first_submit = (None, None) # (requests, tokens) left in the scheduler's buckets
+
+        def collect_result(future):
+            """Records one finished chunk's rows (or its error) and drops the chunk."""
+            nonlocal tasks_collected, rows_collected, pages_in_flight
+            chunk = futures.pop(future)
+            pages_in_flight -= len(chunk.pages)
+            tasks_collected += 1
+            page_id = chunk.chunk_id
+            page_rows = []
+            try:
+                extracted_allegations_list = future.result()
+                page_errors = 0
+                for item in extracted_allegations_list:
+                    if "Error" in item:
+                        page_errors += 1
+                        error_page_id = "N/A"
+                        if "for page '" in item.get("Error", ""):
+                            try:
+                                error_page_id = item["Error"].split("for page '", 1)[1].split("'", 1)[0]
+                            except IndexError:
+                                pass
+
+                        page_rows.append({
+                            "Product_Name": "ERROR",
+                            "Allegation_Category": item.get("Error", "Unknown LLM Error"),
+                            "Specific_Allegation_Summary": item.get("Content_Snippet", "")[:500] + f" ... (Full Error: {item.get('Error', 'N/A')})",
+                            "Involved_Defendants_CoConspirators": "N/A",
+                            "Other_Named_Entities": "N/A", # ADDED: For Item 4
+                            "Pin_Cite_Page": error_page_id,
+                            "Pin_Cite_Paragraph": "Error processing",
+                            "Complaint_Name": complaint_name # ADDED: For Item 3
+                        })
+                    else:
+                        page_rows.append({
+                            "Product_Name": item.get("Product_Name", "N/A"),
+                            "Allegation_Category": item.get("Allegation_Category", "N/A"),
+                            "Specific_Allegation_Summary": item.get("Specific_Allegation_Summary", "N/A"),
+                            "Involved_Defendants_CoConspirators": item.get(
+                                "Involved_Defendants_CoConspirators", "N/A"),
+                            "Other_Named_Entities": item.get("Other_Named_Entities", "N/A"), # ADDED: For Item 4
+                            "Pin_Cite_Page": item.get("Pin_Cite_Page", "N/A"),
+                            "Pin_Cite_Paragraph": item.get("Pin_Cite_Paragraph", "N/A"),
+                            "Complaint_Name": complaint_name # ADDED: For Item 3
+                        })
+                rows_collected += len(page_rows)
+                job_store.record_page_result(job_id, page_id, page_rows)
+                job_store.increment(job_id, pages_collected=len(chunk.final_pages), errors=page_errors)
+                logger.info(
+                    f"  [Collected] Task {tasks_collected}/{chunks_submitted} complete. Total allegations so far: {rows_collected} entries.")
+            except Exception as e:
+                logger.error(f"  [Collection Critical Error] Error collecting future result {tasks_collected}/{chunks_submitted}: {e}",
+                             exc_info=True)
+                job_store.increment(job_id, pages_collected=len(chunk.final_pages), errors=1)
+                error_row = {
+                    "Product_Name": "ERROR",
+                    "Allegation_Category": "Future Result Collection Error",
+                    "Specific_Allegation_Summary": str(e)[:500],
+                    "Involved_Defendants_CoConspirators": "N/A",
+                    "Other_Named_Entities": "N/A", # ADDED: For Item 4
+                    "Pin_Cite_Page": page_id,
+                    "Pin_Cite_Paragraph": "N/A",
+                    "Complaint_Name": complaint_name # ADDED: For Item 3
+                }
+                rows_collected += 1
+                job_store.record_page_result(job_id, page_id, [error_row])
+
+        def submit_chunk(chunk, checkpoint=True):
+            nonlocal chunks_reused, chunks_submitted, pages_in_flight, peak_pages_in_flight, backpressure_waits
+            nonlocal first_submit_time, rate_budget_at_first_submit
+            if checkpoint:
+                job_store.record_chunk(job_id, next(chunk_positions), chunk)
+            if chunk.chunk_id in settled_page_ids:
+                # Already collected by an earlier attempt; its stored rows go into the report as-is
+                chunks_reused += 1
+                job_store.increment(job_id, pages_submitted=len(chunk.final_pages), pages_collected=len(chunk.final_pages))
+                return
+            # Backpressure: make room by collecting finished chunks (one chunk always fits)
+            while streaming and futures and pages_in_flight + len(chunk.pages) > MAX_PAGES_IN_FLIGHT:
+                backpressure_waits += 1
+                with timed_stage("backpressure_wait", job_id):
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect_result(future)
+            chunks_submitted += 1
+            pages_in_flight += len(chunk.pages)
+            peak_pages_in_flight = max(peak_pages_in_flight, pages_in_flight)
+            cost = estimate_chunk_cost(chunk)
+            chunk_costs.append(cost)
+            if first_submit_time is None:
+                first_submit_time = time.perf_counter()
+                rate_budget_at_first_submit = (gemini_scheduler.request_bucket.available(),
+                                               gemini_scheduler.token_bucket.available())
+            chunk_arrivals.append(time.perf_counter() - first_submit_time)
+            futures[gemini_scheduler.submit(
+                job_id,
+                analyze_text_chunk_with_gemini,
+                chunk.text, # Sanitized text with segment markers
+                chunk.chunk_id,
+                original_filename,
+                use_cache,
+                chunk.segment_labels,
+                job_id=job_id,
+                cost=cost.seconds if CHUNK_ORDERING == "lpt" else 0.0 # Longest first within this job
+            )] = chunk
+            job_store.increment(job_id, pages_submitted=len(chunk.final_pages))
+            logger.info(f"  [Submitted] Chunk {chunk.chunk_id} ({len(chunk.pages)} page(s), ~{chunk.tokens} tokens) for LLM analysis.")
+
+        def record_empty_page(page_id):
+            if page_id in settled_page_ids:
+                return
+            logger.info(f"  [Skipped] Page {page_id} (no text extracted).")
+            skipped_row = {
+                "Product_Name": "N/A",
+                "Allegation_Category": "N/A",
+                "Specific_Allegation_Summary": f"No text extracted from PDF page {page_id}.",
+                "Involved_Defendants_CoConspirators": "N/A",
+                "Other_Named_Entities": "N/A", # ADDED: For Item 4 (for skipped/error rows)
+                "Pin_Cite_Page": page_id, # Ensure consistent with LLM output for pages
+                "Pin_Cite_Paragraph": "N/A",
+                "Complaint_Name": complaint_name # ADDED: For Item 3 (for skipped/error rows)
+            }
+            job_store.record_page_result(job_id, page_id, [skipped_row])
+
+        if plan_complete:
+            # Resuming: the stored chunk plan replaces extraction, pre-filtering and packing
+            planned_chunks = job_store.planned_chunks(job_id)
+            prefilter_skipped = job["stats"].get("prefilter_skipped_pages", [])
+            logger.info(f"--- Resuming job '{job_id}' from its checkpoint: {len(planned_chunks)} planned chunks, "
+                        f"{len(settled_page_ids)} pages/chunks already collected ---")
+            for chunk in planned_chunks:
+                submit_chunk(chunk, checkpoint=False)
+        else:
+            # Parse from the locally spooled upload. If it's gone (e.g. the job was requeued
+            # after a restart and the spool was cleaned up), fall back to the archived blob.
+            if not input_path or not os.path.exists(input_path):
+                logger.warning(f"Spooled input for job '{job_id}' not found; fetching archived blob '{input_blob_name}'.")
+                input_blob_client = clients.blob_service_client.get_container_client(UPLOAD_CONTAINER_NAME).get_blob_client(input_blob_name)
+                with timed_stage("input_fetch", job_id):
+                    input_path = spool_to_local_file(input_blob_client.download_blob(), suffix=os.path.splitext(original_filename)[1].lower())
+
+            planner = ChunkPlanner()
+
+            # Amendment mode: only paragraphs that are new or changed since the baseline job go
+            # to the LLM; the baseline's allegations for unchanged paragraphs carry over
+            amendment = None
+            if job["options"].get("baseline_job_id"):
+                amendment = plan_amendment_for_job(
+                    job_id, job["options"]["baseline_job_id"], input_path, original_filename, complaint_name)
+                job_store.record_page_result(job_id, AMENDMENT_CARRYOVER_PAGE_ID, amendment.carried_rows)
+                job_store.merge_stats(job_id, amendment=amendment.stats)
+                logger.info(f"--- Amendment: {amendment.stats['new_or_changed_paragraphs']} new/changed paragraphs, "
+                            f"{amendment.stats['rows_carried_over']} allegations carried over from job "
+                            f"'{amendment.stats['baseline_job_id']}' ---")
+
+            if original_filename.lower().endswith('.pdf'):
+                # Extraction workers open the PDF by path (file-backed, never fully buffered in memory)
+                num_pages_to_process = pdf_extraction.count_pages(input_path)
+                job_store.update(job_id, pages_total=num_pages_to_process)
+                streaming = not amendment and num_pages_to_process >= STREAMING_EXTRACTION_MIN_PAGES
+                logger.info(f"--- Starting concurrent processing of {num_pages_to_process} PDF pages"
+                            + (f" (streaming, at most {MAX_PAGES_IN_FLIGHT} pages in flight)" if streaming else "") + " ---")
+                # Pages are scored, packed and submitted as soon as their extraction batch finishes,
+                # so the first LLM calls go out while later pages are still being parsed
+                if amendment:
+                    # Pages whose paragraphs all carried over are passed to the planner empty
+                    for page_number in amendment.carried_pages:
+                        for chunk in planner.add_page(page_number, ""):
+                            submit_chunk(chunk)
+                    page_batches = [amendment.pages_to_send]
+                else:
+                    page_batches = pdf_extraction.iter_page_batches(
+                        input_path, num_pages_to_process,
+                        pool=get_pdf_extraction_pool(), batch_pages=PDF_EXTRACTION_BATCH_PAGES,
+                        max_pending=STREAMING_EXTRACTION_BATCHES_AHEAD if streaming else None)
+                for batch in timed_iter(page_batches, "pdf_extraction", job_id): # Time spent waiting on extraction
+                    # Score the batch's non-empty pages in one vectorized pass
+                    texts_to_score = [text for _, text in batch if text.strip()]
+                    with timed_stage("prefilter", job_id):
+                        batch_scores = iter(prefilter.score(texts_to_score) if prefilter else [])
+                    pages_scored += len(texts_to_score) if prefilter else 0
+
+                    for page_number, text in batch:
+                        page_id = str(page_number)
+                        if not text.strip():
+                            planner.add_page(page_number, "")
+                            record_empty_page(page_id)
+                            continue
+
+                        prefilter_score = next(batch_scores, None)
+                        if prefilter_score is not None and not prefilter_score.relevant:
+                            prefilter_skipped.append(prefilter_skip_record(page_id, text, prefilter_score, prefilter_enforced))
+                            if prefilter_enforced:
+                                planner.add_page(page_number, "")
+                                logger.info(f"  [Pre-filter] Skipped page {page_id} (score {prefilter_score.score:.2f}).")
+                                continue
+                            logger.info(f"  [Pre-filter] Page {page_id} would be skipped (score {prefilter_score.score:.2f}); "
+                                        f"analyzing it anyway (audit mode).")
+
+                        # NEW: Sanitize text before sending to LLM for robustness against JSON errors
+                        for chunk in planner.add_page(page_number, sanitize_text_for_json(text)):
+                            submit_chunk(chunk)
+                for chunk in planner.flush():
+                    submit_chunk(chunk)
+                baseline_calls = planner.units_in # One call per non-empty page before packing
+
+            elif original_filename.lower().endswith('.docx'):
+                if amendment:
+                    all_paragraphs = [sanitize_text_for_json(line) for _, text in amendment.pages_to_send
+                                      for line in text.split("\n") if line.strip()]
+                else:
+                    from docx import Document
+                    with timed_stage("docx_extraction", job_id):
+                        doc = Document(input_path) # Read straight from the spooled file
+                        # NEW: Sanitize text before sending to LLM for robustness against JSON errors
+                        all_paragraphs = [sanitize_text_for_json(p.text) for p in doc.paragraphs if p.text.strip()]
+                chunks = planner.pack_paragraphs(all_paragraphs)
+                if prefilter:
+                    # The whole document is already in memory, so score every chunk at once
+                    with timed_stage("prefilter", job_id):
+                        chunk_scores = prefilter.score([chunk.text for chunk in chunks])
+                    pages_scored = len(chunks)
+                    relevant_chunks = []
+                    for chunk, prefilter_score in zip(chunks, chunk_scores):
+                        if prefilter_score.relevant:
+                            relevant_chunks.append(chunk)
+                            continue
+                        prefilter_skipped.append(
+                            prefilter_skip_record(chunk.chunk_id, chunk.text, prefilter_score, prefilter_enforced))
+                        if prefilter_enforced:
+                            logger.info(f"  [Pre-filter] Skipped {chunk.chunk_id} (score {prefilter_score.score:.2f}).")
+                        else:
+                            relevant_chunks.append(chunk)
+                            logger.info(f"  [Pre-filter] {chunk.chunk_id} would be skipped (score "
+                                        f"{prefilter_score.score:.2f}); analyzing it anyway (audit mode).")
+                    chunks = relevant_chunks
+
+                job_store.update(job_id, pages_total=len(chunks))
+                logger.info(f"--- Starting concurrent processing of {len(chunks)} DOCX chunks ---")
+                for chunk in chunks:
+                    submit_chunk(chunk)
+                baseline_calls = -(-len(all_paragraphs) // LEGACY_DOCX_PARAS_PER_CHUNK) # Fixed 20-paragraph chunks
+
+            else:
+                raise ValueError("Unsupported file type. Please upload a PDF or DOCX file.")
+
+            packing = planner.packing_stats(baseline_calls)
+            flagged_ranges = format_page_ranges([record["Page/Chunk"] for record in prefilter_skipped])
+            # From here on the stored plan is enough to finish the job without the source document
+            job_store.merge_stats(job_id, plan_complete=True, prefilter_skipped_pages=prefilter_skipped,
+                                  packing=packing, prefilter={
+                "enabled": prefilter is not None,
+                "mode": prefilter.mode if prefilter else "off",
+                "threshold": prefilter.threshold if prefilter else None,
+                "pages_scored": pages_scored,
+                "pages_skipped": len(prefilter_skipped) if prefilter_enforced else 0,
+                "pages_flagged": len(prefilter_skipped), # Below the threshold, whether or not they were sent
+                "skipped_page_ranges": flagged_ranges if prefilter_enforced else "",
+                "flagged_page_ranges": flagged_ranges
+            })
+            if prefilter:
+                logger.info(f"--- Pre-filter ({prefilter.mode}): {len(prefilter_skipped)} of {pages_scored} scored "
+                            f"pages/chunks below the threshold{f' ({flagged_ranges})' if flagged_ranges else ''} ---")
+            logger.info(f"--- Chunk packing: {packing['before']['calls']} calls / ~{packing['before']['prompt_tokens']} prompt tokens "
+                        f"before, {packing['after']['calls']} calls / ~{packing['after']['prompt_tokens']} after ---")
+
+        job_store.merge_stats(job_id, checkpoint={
+            "resumed_from_plan": plan_complete,
+            "chunks_reused": chunks_reused,
+            "chunks_submitted": chunks_submitted
+        })
+        job_store.merge_stats(job_id, streaming={
+            "enabled": streaming,
+            "max_pages_in_flight": MAX_PAGES_IN_FLIGHT if streaming else None,
+            "peak_pages_in_flight": peak_pages_in_flight,
+            "backpressure_waits": backpressure_waits
+        })
+        if chunks_reused:
+            logger.info(f"--- Reused {chunks_reused} chunks collected by an earlier attempt; {chunks_submitted} sent to the LLM ---")
+
+        # Predicted from the chunk estimates on the scheduler's current concurrency, with each
+        # chunk queued when extraction actually produced it and the rate buckets as full as
+        # they were at that first submission, so predicted and actual both run from the
+        # first submission to the last result. Other documents sharing the scheduler will
+        # make it optimistic.
+        predicted_seconds = predicted_makespan(
+            [cost.seconds for cost in chunk_costs], gemini_scheduler.concurrency_limit(),
+            GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE, sum(cost.input_tokens for cost in chunk_costs),
+            arrivals=chunk_arrivals, longest_first=CHUNK_ORDERING == "lpt",
+            requests_available=rate_budget_at_first_submit[0], tokens_available=rate_budget_at_first_submit[1])
+
+        # --- Collect Results from Futures ---
+        logger.info("--- Collecting results from concurrent LLM calls ---")
+        # Time blocked here, after submission finished, is time spent waiting on Gemini
+        for future in timed_iter(as_completed(list(futures)), "collect_wait", job_id):
+            collect_result(future)
+        logger.info(f"--- Finished collecting all {chunks_submitted} submitted results. ---")
+
+        actual_seconds = time.perf_counter() - first_submit_time if first_submit_time is not None else 0.0
+        job_store.merge_stats(job_id, schedule={
+            "ordering": CHUNK_ORDERING,
+            "chunks": len(chunk_costs),
+            "estimated_input_tokens": sum(cost.input_tokens for cost in chunk_costs),
+            "estimated_output_tokens": sum(cost.output_tokens for cost in chunk_costs),
+            "estimated_call_seconds": round(sum(cost.seconds for cost in chunk_costs), 3),
+            "longest_chunk_seconds": round(max((cost.seconds for cost in chunk_costs), default=0.0), 3),
+            # Both from the first submission to the last result
+            "predicted_completion_seconds": round(predicted_seconds, 3),
+            "actual_completion_seconds": round(actual_seconds, 3),
+            "submission_seconds": round(chunk_arrivals[-1], 3) if chunk_arrivals else 0.0, # Until the last chunk was queued
+            "prediction_ratio": round(actual_seconds / predicted_seconds, 3) if predicted_seconds else None
+        })
+        if chunk_costs:
+            logger.info(f"--- LLM phase took {actual_seconds:.1f}s; predicted {predicted_seconds:.1f}s "
+                        f"({CHUNK_ORDERING} ordering, {len(chunk_costs)} chunks) ---")
+
+        # The report is always rebuilt from the checkpointed rows, so reused and freshly
+        # collected pages end up in it the same way
+        all_extracted_data = job_store.job_rows(job_id)
+
+        if DEDUPE_ENABLED:
+            rows_before = len(all_extracted_data)
+            try:
+                with timed_stage("dedupe", job_id):
+                    all_extracted_data, merged_away = merge_near_duplicate_allegations(all_extracted_data)
+            except Exception as e:
+                logger.warning(f"Near-duplicate merging failed, keeping all rows: {e}", exc_info=True)
+                merged_away = 0
+            job_store.merge_stats(job_id, dedupe={
+                "rows_before": rows_before, "rows_after": len(all_extracted_data), "merged": merged_away})
+            logger.info(f"--- Merged {merged_away} near-duplicate allegations ({rows_before} -> {len(all_extracted_data)} rows) ---")
+
+        # --- Generate Report ---
+        if job.get("batch_id"):
+            # Batch documents go into the batch's combined workbook instead (see finalize_batch)
+            excel_blob_name = None
+        else:
+            # Streamed straight into the output blob as it is written (see upload_report_streaming)
+            file_name_without_extension = os.path.splitext(original_filename)[0]
+            excel_blob_name = f"{unique_id}_{file_name_without_extension}-analysis.{report_format}" # Unique name for output blob
+            output_blob_client = output_container_client.get_blob_client(excel_blob_name)
+
+            with timed_stage("report_write_upload", job_id):
+                report_bytes = upload_report_streaming(
+                    output_blob_client, report_format, all_extracted_data, prefilter_skipped, complaint_name,
+                    cache_name=excel_blob_name)
+            logger.info(f"--- {report_format.upper()} report ({report_bytes} bytes) generated and uploaded to blob: "
+                        f"'{excel_blob_name}' in container '{OUTPUT_CONTAINER_NAME}' ---")
+
+        # Prepare results for JSON response
+        results_for_json = all_extracted_data
+        if not results_for_json:
+            results_for_json = [{"Product_Name": "No Data", "Allegation_Category": "N/A",
+                                "Specific_Allegation_Summary": "No specific allegations identified by the LLM or no processable text found.",
+                                "Involved_Defendants_CoConspirators": "N/A",
+                                "Other_Named_Entities": "N/A", # ADDED: For Item 4
+                                "Pin_Cite_Page": "N/A",
+                                "Pin_Cite_Paragraph": "N/A",
+                                "Complaint_Name": "N/A" # ADDED: For Item 3
+                                }]
+
+        index_job_allegations(job_id, results_for_json)
+        return results_for_json, excel_blob_name
+    finally:
+        # Drop anything still queued if the job failed part-way
+        cancelled = gemini_scheduler.cancel_pending(job_id)
+        if cancelled:
+            logger.info(f"Cancelled {cancelled} queued LLM calls for job '{job_id}'.")
+        if input_path:
+            release_spooled_input(input_path)
+
+
+def run_analysis_job(job_id):
+    """Worker entry point: claims a queued job and records its outcome in the job store."""
+    clients_ready.wait() # Jobs requeued at startup can reach a worker before the clients exist
+    if not job_store.claim(job_id):
+        logger.info(f"Job '{job_id}' is no longer queued (claimed elsewhere or finished); skipping.")
+        return
+    job = job_store.get(job_id)
+    logger.info(f"=== Job '{job_id}' started for '{job['original_filename']}' ===")
+    timings = active_job_timings[job_id] = StageTimings()
+    job_start = time.perf_counter()
+    try:
+        try:
+            results_for_json, excel_blob_name = process_analysis_job(job_id, job)
+        finally:
+            # Record the breakdown before the final status, so it's there when clients see "succeeded"
+            record_stage("job_total", time.perf_counter() - job_start, job_id)
+            active_job_timings.pop(job_id, None)
+            job_store.merge_stats(job_id, timings=timings.summary())
+        job_store.update(
+            job_id,
+            status="succeeded",
+            excel_filename=excel_blob_name,
+            results_json=json.dumps(results_for_json),
+            finished_at=time.time(),
+            message="Analysis complete."
+        )
+        metrics.inc("analysis_jobs_total", status="succeeded")
+        logger.info(f"=== Job '{job_id}' succeeded ===")
+    except Exception as e:
+        logger.error(f"--- ERROR in analysis job '{job_id}' (main processing loop): {e} ---", exc_info=True)
+        metrics.inc("analysis_jobs_total", status="failed")
+        job_store.update(job_id, status="failed", finished_at=time.time(), message=f"Processing error: {str(e)}")
+    if job.get("batch_id"):
+        # Whichever document finishes last builds the combined workbook
+        finalize_batch(job["batch_id"])
+
+
+def finalize_batch(batch_id):
+    """Builds and uploads the batch's combined workbook once all of its documents have finished."""
+    clients_ready.wait() # Finalization can be scheduled at startup, before blob storage is set up
+    if not job_store.claim_batch_finalization(batch_id):
+        return
+    logger.info(f"=== Batch '{batch_id}': all documents finished, building combined workbook ===")
+    try:
+        documents, skipped_pages = [], []
+        for job in job_store.batch_jobs(batch_id, include_results=True):
+            complaint_name = os.path.splitext(job["original_filename"])[0]
+            rows = [row for row in job.get("results", []) if row.get("Product_Name") != "No Data"]
+            if job["status"] != "succeeded":
+                rows = [{"Product_Name": "ERROR", "Allegation_Category": "Document Failed",
+                         "Specific_Allegation_Summary": job["message"] or "Analysis failed.",
+                         "Complaint_Name": complaint_name, "Pin_Cite_Page": "N/A", "Pin_Cite_Paragraph": "N/A"}]
+            documents.append({"complaint_name": complaint_name, "original_filename": job["original_filename"],
+                              "status": job["status"], "pages": job["pages_total"], "errors": job["errors"],
+                              "message": job["message"], "rows": rows,
+                              "prefilter_skipped_ranges": job["stats"].get("prefilter", {}).get("skipped_page_ranges")})
+            skipped_pages.extend(dict(record, **{"Complaint Name": complaint_name})
+                                 for record in job["stats"].get("prefilter_skipped_pages", []))
+
+        excel_blob_name = f"{batch_id}_batch-analysis.xlsx"
+        output_blob_client = clients.blob_service_client.get_container_client(OUTPUT_CONTAINER_NAME).get_blob_client(excel_blob_name)
+        with timed_stage("batch_report_write_upload"):
+            report_bytes = stream_report_to_blob(
+                output_blob_client, REPORT_FORMATS["xlsx"],
+                lambda stream: write_batch_xlsx_report(stream, documents, skipped_pages),
+                cache_name=excel_blob_name)
+        failed = sum(1 for document in documents if document["status"] != "succeeded")
+        job_store.update_batch(batch_id, status="succeeded", excel_filename=excel_blob_name, finished_at=time.time(),
+                               message=f"Batch complete ({len(documents) - failed} succeeded, {failed} failed).")
+        logger.info(f"=== Batch '{batch_id}' combined workbook ({report_bytes} bytes) uploaded to '{excel_blob_name}' ===")
+    except Exception as e:
+        logger.error(f"--- ERROR finalizing batch '{batch_id}': {e} ---", exc_info=True)
+        job_store.update_batch(batch_id, status="failed", finished_at=time.time(), message=f"Combined workbook failed: {e}")
+
+
+def enqueue_analysis_job(job_id, batch_id=None):
+    """Hands a job to the bounded background worker pool (batch documents use the batch pool)."""
+    executor = batch_document_executor if batch_id else analysis_job_executor
+    executor.submit(run_analysis_job, job_id)
+
+
+def resume_pending_jobs():
+    """Picks up jobs that were queued (or interrupted) before this process started."""
+    try:
+        for pending_job_id in job_store.requeue_interrupted(JOB_STALE_SECONDS):
+            logger.info(f"Resuming queued analysis job '{pending_job_id}'.")
+            enqueue_analysis_job(pending_job_id, batch_id=job_store.get(pending_job_id)["batch_id"])
+        # Batches whose last document finished while the workbook was being built (or never got built)
+        for batch_id in job_store.unfinished_batches():
+            analysis_job_executor.submit(finalize_batch, batch_id)
+    except Exception as e:
+        logger.warning(f"Could not requeue pending analysis jobs: {e}")
@@ -0,0 +1,79 @@
+"""
+Peak memory versus document size, with and without streaming extraction.
+
+Usage:
+    python benchmarks/bench_memory.py [--pages 250,1000,2000] [--max-pages-in-flight 200]
+                                      [--latency-ms 200] [--concurrency 16]
+
+Each (size, mode) pair is one run_benchmark.py --single child (in-memory blob store,
+fake Gemini, fresh LOCAL_STATE_DIR). "buffered" forces the old behaviour (every chunk
+queued for Gemini as soon as it is extracted); "streaming" sets
+STREAMING_EXTRACTION_MIN_PAGES=0 so every document uses the bounded windows.
+
+Reported per run: peak RSS of the app process (ru_maxrss), the most pages that were
+waiting on the LLM at once, and how often submission had to wait for room. With
+streaming, peak RSS and pages in flight should stay roughly flat as pages grow.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+MODES = {
+    "buffered": {"STREAMING_EXTRACTION_MIN_PAGES": str(10 ** 9)},
+    "streaming": {"STREAMING_EXTRACTION_MIN_PAGES": "0"},
+}
+
+
+def run_once(pages, mode, args):
+    with tempfile.TemporaryDirectory(prefix="bench_memory_") as state_dir:
+        env = dict(os.environ,
+                   AZURE_STORAGE_BACKEND="memory",
+                   GEMINI_BACKEND="fake",
+                   LOCAL_STATE_DIR=state_dir,
+                   LLM_CACHE_ENABLED="0",
+                   DEDUPE_ENABLED="0", # Keeps the embedding model out of the numbers
+                   GEMINI_MAX_CONCURRENCY=str(args.concurrency),
+                   GEMINI_INITIAL_CONCURRENCY=str(args.concurrency),
+                   FAKE_GEMINI_LATENCY_MS=str(args.latency_ms),
+                   MAX_PAGES_IN_FLIGHT=str(args.max_pages_in_flight),
+                   **MODES[mode])
+        child = subprocess.run(
+            [sys.executable, os.path.join(BENCH_DIR, "run_benchmark.py"), "--single", "--pages", str(pages),
+             "--concurrency", str(args.concurrency)],
+            env=env, cwd=REPO_ROOT, capture_output=True, text=True)
+    result_lines = [line for line in child.stdout.splitlines() if line.startswith("{")]
+    if child.returncode != 0 or not result_lines:
+        raise RuntimeError(f"exit {child.returncode}:\n{child.stderr[-2000:]}")
+    return json.loads(result_lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="250,1000,2000", help="Comma-separated document sizes")
+    parser.add_argument("--max-pages-in-flight", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Median fake Gemini latency")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'mode':>10} {'wall (s)':>9} {'RSS MB':>7} {'in flight':>9} {'waits':>6}")
+    for pages in [int(p) for p in args.pages.split(",") if p.strip()]:
+        for mode in MODES:
+            try:
+                r = run_once(pages, mode, args)
+            except RuntimeError as e:
+                print(f"{pages:>6} {mode:>10} run failed ({e})")
+                continue
+            streaming = r.get("streaming", {})
+            print(f"{pages:>6} {mode:>10} {r['wall_seconds']:>9.2f} {r['peak_rss_mb']:>7.0f} "
+                  f"{streaming.get('peak_pages_in_flight', 0):>9} {streaming.get('backpressure_waits', 0):>6}"
+                  + ("" if r["status"] == "succeeded" else f"  (job {r['status']})"))
+
+
+if __name__ == "__main__":
+    main()
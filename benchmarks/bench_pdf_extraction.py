@@ -0,0 +1,68 @@
+"""
+Benchmarks PDF text extraction wall time against the number of worker processes.
+
+Usage:
+    python benchmarks/bench_pdf_extraction.py path/to/complaint.pdf [--cores 1,2,4,8] [--batch-pages 8] [--repeat 3]
+
+For each core count it reports the time until the first page is available (the
+point at which the first Gemini call can be submitted) and the total wall time
+to extract every page. One core means in-process extraction, as with
+PDF_EXTRACTION_PROCESSES=1.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_extraction  # noqa: E402
+
+
+def run_once(pdf_path, num_pages, pool, batch_pages):
+    start = time.perf_counter()
+    first_page_at = None
+    pages_seen = 0
+    for batch in pdf_extraction.iter_page_batches(pdf_path, num_pages, pool=pool, batch_pages=batch_pages):
+        if first_page_at is None:
+            first_page_at = time.perf_counter() - start
+        pages_seen += len(batch)
+    return first_page_at or 0.0, time.perf_counter() - start, pages_seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_path")
+    parser.add_argument("--cores", default=",".join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})),
+                        help="Comma-separated process counts to try")
+    parser.add_argument("--batch-pages", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    num_pages = pdf_extraction.count_pages(args.pdf_path)
+    print(f"{args.pdf_path}: {num_pages} pages, batch size {args.batch_pages}, {args.repeat} runs each\n")
+    print(f"{'cores':>5} {'first page (s)':>15} {'total (s)':>10} {'pages/s':>9} {'speedup':>8}")
+
+    baseline = None
+    for cores in [int(c) for c in args.cores.split(",") if c.strip()]:
+        pool = None
+        if cores > 1:
+            pool = ProcessPoolExecutor(max_workers=cores, mp_context=multiprocessing.get_context("spawn"))
+            # Start the workers before timing; the app keeps its pool alive between jobs
+            list(pool.map(abs, range(cores)))
+        try:
+            runs = [run_once(args.pdf_path, num_pages, pool, args.batch_pages) for _ in range(args.repeat)]
+        finally:
+            if pool:
+                pool.shutdown()
+        first_page = statistics.median(r[0] for r in runs)
+        total = statistics.median(r[1] for r in runs)
+        baseline = baseline or total
+        print(f"{cores:>5} {first_page:>15.3f} {total:>10.3f} {num_pages / total:>9.1f} {baseline / total:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Startup benchmark: how long `import app` takes and how long a fresh server needs to
+answer its first requests.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--server waitress|gunicorn] [--live] [--top 10]
+
+For each run, in fresh processes:
+  * import: wall time of `python -c "import app"` (with -X importtime, whose report
+    is used to list the slowest top-level imports of the last run)
+  * first response: server process start until GET / returns 200
+  * ready: server process start until GET /ready returns 200 (clients initialized)
+  * first analysis: server process start until a 1-page synthetic PDF posted to
+    /analyze has finished
+
+By default the in-memory blob store and the fake Gemini backend are used with a
+throwaway LOCAL_STATE_DIR, so the numbers measure the app rather than the network;
+--live keeps the current environment (real Azure and Gemini settings).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_complaints import generate_complaint  # noqa: E402
+
+STARTUP_TIMEOUT_SECONDS = 120
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(env):
+    """Returns (seconds, [(cumulative_us, module)]) for one cold `import app`."""
+    start = time.perf_counter()
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app; import os; os._exit(0)"],
+                           env=env, cwd=REPO_ROOT, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if child.returncode != 0:
+        raise SystemExit(f"import app failed:\n{child.stderr[-2000:]}")
+    top_level = []
+    for line in child.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"; top-level modules aren't indented
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            top_level.append((int(cumulative), name.strip()))
+    return seconds, sorted(top_level, reverse=True)
+
+
+def get_status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def post_document(url, path):
+    boundary = "----bench-startup-boundary"
+    with open(path, "rb") as document:
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{os.path.basename(path)}\"\r\n"
+                f"Content-Type: application/pdf\r\n\r\n").encode() + document.read() + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def wait_until(predicate, deadline):
+    while time.perf_counter() < deadline:
+        if predicate():
+            return time.perf_counter()
+        time.sleep(0.02)
+    return None
+
+
+def measure_server(env, server, document_path):
+    """Starts a server and returns seconds to first response, readiness and first finished analysis."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "app:app"]
+    else:
+        command = [sys.executable, "-c",
+                   f"import app; from waitress import serve; app.start_background_services(); "
+                   f"serve(app.app, host='127.0.0.1', port={port}, threads=10)"]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, env=env, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        deadline = start + STARTUP_TIMEOUT_SECONDS
+        first_response = wait_until(lambda: get_status(f"{base_url}/") == 200, deadline)
+        ready = wait_until(lambda: get_status(f"{base_url}/ready") == 200, deadline)
+        first_analysis = None
+        if ready:
+            job_id = post_document(f"{base_url}/analyze", document_path)["job_id"]
+
+            def job_finished():
+                with urllib.request.urlopen(f"{base_url}/jobs/{job_id}", timeout=5) as response:
+                    return json.loads(response.read())["job_status"] in ("succeeded", "failed")
+            first_analysis = wait_until(job_finished, deadline)
+        return {name: (moment - start if moment else None) for name, moment in
+                (("first_response", first_response), ("ready", ready), ("first_analysis", first_analysis))}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return "   timeout"
+    return f"{statistics.median(values):>9.3f}  (min {min(values):.3f}, max {max(values):.3f})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", choices=("waitress", "gunicorn"), default="waitress")
+    parser.add_argument("--live", action="store_true", help="Use the real Azure/Gemini settings from the environment")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list")
+    args = parser.parse_args()
+
+    results = {"import": [], "first_response": [], "ready": [], "first_analysis": []}
+    slowest_imports = []
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as work_dir:
+        document_path = generate_complaint(os.path.join(work_dir, "one_page.pdf"), 1)
+        for run in range(args.runs):
+            env = dict(os.environ)
+            if not args.live:
+                env.update(AZURE_STORAGE_BACKEND="memory", GEMINI_BACKEND="fake", FAKE_GEMINI_LATENCY_MS="50",
+                           LLM_CACHE_ENABLED="0")
+            env["LOCAL_STATE_DIR"] = os.path.join(work_dir, f"state_{run}") # Cold state every run
+            import_seconds, slowest_imports = measure_import(env)
+            results["import"].append(import_seconds)
+            for name, seconds in measure_server(env, args.server, document_path).items():
+                results[name].append(seconds)
+
+    print(f"Startup over {args.runs} runs ({args.server}, {'live clients' if args.live else 'offline backends'}); "
+          f"median seconds:")
+    for name, label in (("import", "import app"), ("first_response", "first response (GET /)"),
+                        ("ready", "ready (GET /ready)"), ("first_analysis", "first analysis (1 page)")):
+        print(f"  {label:<26} {summarize(results[name])}")
+    print(f"\nSlowest top-level imports (last run):")
+    for cumulative_us, module in slowest_imports[:args.top]:
+        print(f"  {cumulative_us / 1e6:>8.3f}s  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+End-to-end /analyze benchmark, fully offline.
+
+Usage:
+    python benchmarks/run_benchmark.py [--pages 10,50,200] [--concurrency 4,16,50] [--format pdf]
+                                       [--latency-ms 800] [--latency-sigma 0.5] [--rate-429 0.02]
+                                       [--error-rate 0.01] [--truncate-rate 0.01] [--stall-rate 0.01]
+                                       [--no-hedge]
+
+Each (document size, concurrency) pair runs in a fresh subprocess with the in-memory
+blob store (AZURE_STORAGE_BACKEND=memory), the fake Gemini backend (GEMINI_BACKEND=fake),
+a throwaway LOCAL_STATE_DIR and the result cache disabled. A synthetic complaint is
+posted to /analyze through Flask's test client and the job is followed to completion.
+
+Reported per run: end-to-end wall time, pages/sec, p50/p95/p99 latency of each LLM
+call (one packed chunk, including retries), and peak RSS of the app process and of
+its largest extraction worker.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_complaints import generate_complaint  # noqa: E402
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def run_single(args):
+    """Child mode: one /analyze run in this process. Prints a JSON line with the measurements."""
+    import app  # Imported here so the parent's environment settings apply
+    import analysis_jobs
+    from job_store import job_store
+    app.start_background_services()
+
+    call_latencies = []
+    analyze_chunk = analysis_jobs.analyze_text_chunk_with_gemini
+
+    def timed_analyze_chunk(*call_args, **call_kwargs):
+        start = time.perf_counter()
+        try:
+            return analyze_chunk(*call_args, **call_kwargs)
+        finally:
+            call_latencies.append(time.perf_counter() - start)
+
+    # process_analysis_job looks the function up at submit time, so this times every call
+    analysis_jobs.analyze_text_chunk_with_gemini = timed_analyze_chunk
+
+    document_path = os.path.join(os.environ["LOCAL_STATE_DIR"], f"synthetic_{args.pages}.{args.format}")
+    generate_complaint(document_path, args.pages)
+    client = app.app.test_client()
+
+    start = time.perf_counter()
+    with open(document_path, "rb") as document:
+        response = client.post("/analyze", data={"file": (document, os.path.basename(document_path))},
+                               content_type="multipart/form-data")
+    if response.status_code != 202:
+        raise SystemExit(f"/analyze returned {response.status_code}: {response.get_data(as_text=True)}")
+    job_id = response.get_json()["job_id"]
+    while True:
+        job = job_store.get(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.05)
+    wall_seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        "status": job["status"],
+        "pages": args.pages,
+        "concurrency": args.concurrency,
+        "wall_seconds": wall_seconds,
+        "pages_per_second": args.pages / wall_seconds if wall_seconds else 0.0,
+        "llm_calls": len(call_latencies),
+        "errors": job["errors"],
+        "p50": percentile(call_latencies, 50),
+        "p95": percentile(call_latencies, 95),
+        "p99": percentile(call_latencies, 99),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "peak_worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0,
+        "streaming": job["stats"].get("streaming", {}),
+    }))
+    os._exit(0) # Skip waiting on the app's idle worker pools
+
+
+def run_matrix(args):
+    print(f"Fake Gemini: median {args.latency_ms:.0f} ms (sigma {args.latency_sigma}), 429 rate {args.rate_429}, "
+          f"error rate {args.error_rate}, truncate rate {args.truncate_rate}, stall rate {args.stall_rate}; "
+          f"hedging {'off' if args.no_hedge else 'on'}; format {args.format}\n")
+    print(f"{'pages':>6} {'conc':>5} {'wall (s)':>9} {'pages/s':>8} {'calls':>6} {'errors':>6} "
+          f"{'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'RSS MB':>7} {'worker MB':>9}")
+
+    for pages in [int(p) for p in args.pages.split(",") if p.strip()]:
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            with tempfile.TemporaryDirectory(prefix="bench_state_") as state_dir:
+                env = dict(os.environ,
+                           AZURE_STORAGE_BACKEND="memory",
+                           GEMINI_BACKEND="fake",
+                           LOCAL_STATE_DIR=state_dir,
+                           LLM_CACHE_ENABLED="0",
+                           GEMINI_MAX_CONCURRENCY=str(concurrency),
+                           GEMINI_INITIAL_CONCURRENCY=str(concurrency),
+                           FAKE_GEMINI_LATENCY_MS=str(args.latency_ms),
+                           FAKE_GEMINI_LATENCY_SIGMA=str(args.latency_sigma),
+                           FAKE_GEMINI_429_RATE=str(args.rate_429),
+                           FAKE_GEMINI_ERROR_RATE=str(args.error_rate),
+                           FAKE_GEMINI_TRUNCATE_RATE=str(args.truncate_rate),
+                           FAKE_GEMINI_STALL_RATE=str(args.stall_rate),
+                           GEMINI_HEDGE_ENABLED="0" if args.no_hedge else "1",
+                           FAKE_GEMINI_SEED=str(args.seed))
+                child = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--single", "--pages", str(pages),
+                     "--concurrency", str(concurrency), "--format", args.format],
+                    env=env, cwd=REPO_ROOT, capture_output=True, text=True)
+            result_lines = [line for line in child.stdout.splitlines() if line.startswith("{")]
+            if child.returncode != 0 or not result_lines:
+                print(f"{pages:>6} {concurrency:>5} run failed (exit {child.returncode}):\n{child.stderr[-2000:]}")
+                continue
+            r = json.loads(result_lines[-1])
+            print(f"{pages:>6} {concurrency:>5} {r['wall_seconds']:>9.2f} {r['pages_per_second']:>8.1f} "
+                  f"{r['llm_calls']:>6} {r['errors']:>6} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} "
+                  f"{r['peak_rss_mb']:>7.0f} {r['peak_worker_rss_mb']:>9.0f}"
+                  + ("" if r["status"] == "succeeded" else f"  (job {r['status']})"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,50,200", help="Comma-separated document sizes")
+    parser.add_argument("--concurrency", default="4,16,50", help="Comma-separated Gemini concurrency levels")
+    parser.add_argument("--format", choices=("pdf", "docx"), default="pdf")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Median fake Gemini latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latency")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of calls that take 20x the latency")
+    parser.add_argument("--no-hedge", action="store_true", help="Disable hedged requests (for before/after runs)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        args.pages, args.concurrency = int(args.pages), int(args.concurrency)
+        run_single(args)
+    else:
+        run_matrix(args)
+
+
+if __name__ == "__main__":
+    main()
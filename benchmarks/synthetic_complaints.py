@@ -0,0 +1,150 @@
+"""
+Generates synthetic antitrust complaints (PDF or DOCX) for offline benchmarks.
+
+Usage:
+    python benchmarks/synthetic_complaints.py out.pdf [--pages 50] [--relevant-fraction 0.7] [--seed 7]
+    python benchmarks/synthetic_complaints.py out.docx [--pages 50]
+
+Pages mix numbered allegation paragraphs that name generic drugs and defendants
+(what FakeGeminiBackend extracts) with the boilerplate the pre-filter should skip:
+caption, jurisdiction, parties and a prayer for relief. The PDF writer is a small
+hand-rolled one, so nothing beyond the app's own requirements is needed.
+"""
+import argparse
+import os
+import random
+import textwrap
+
+DRUGS = [
+    "Digoxin", "Carbamazepine", "Clobetasol", "Doxycycline", "Pravastatin", "Nystatin", "Fluocinonide",
+    "Glyburide", "Propranolol", "Ursodiol", "Baclofen", "Fosinopril", "Ketoconazole", "Nadolol",
+    "Lidocaine", "Enalapril", "Warfarin", "Tobramycin", "Amiloride", "Desonide"
+]
+DEFENDANTS = ["Teva", "Mylan", "Sandoz", "Taro", "Perrigo", "Actavis", "Lannett", "Par", "Glenmark", "Zydus"]
+CONDUCT = [
+    "{a} and {b} agreed to raise the price of {drug} and followed each other's WAC increases within days.",
+    "Executives at {a} and {b} spoke by phone before {a} declined to bid on a large customer for {drug}, "
+    "leaving that account to {b} as its fair share.",
+    "In an effort to allocate customers for {drug}, {a} told {b} it would not compete for accounts {b} already held.",
+    "{a} texted a senior sales executive at {b} to confirm the {drug} price increase before it took effect, "
+    "and {b} matched the supracompetitive price the following week.",
+]
+BOILERPLATE = [
+    "This Court has subject matter jurisdiction under 28 U.S.C. 1331 and 1337 and Section 16 of the Clayton Act.",
+    "Venue is proper in this District because a substantial part of the events giving rise to the claims occurred here.",
+    "Plaintiff is a corporation organized under the laws of the State of Delaware with its principal place of business "
+    "in Philadelphia, Pennsylvania.",
+    "Defendant is headquartered in New Jersey and is incorporated under the laws of the State of New Jersey.",
+    "Plaintiffs bring this action on behalf of themselves and all others similarly situated pursuant to Rule 23.",
+    "WHEREFORE, Plaintiffs respectfully request that the Court enter judgment in their favor and award damages.",
+    "Plaintiffs demand a trial by jury on all claims so triable.",
+]
+LINES_PER_PAGE = 46
+WRAP_COLUMNS = 95
+
+
+def complaint_pages(num_pages, relevant_fraction=0.7, seed=7):
+    """Returns a list of pages, each a list of numbered paragraphs (strings)."""
+    rng = random.Random(seed)
+    pages = []
+    paragraph_number = 1
+    for page_index in range(num_pages):
+        relevant = rng.random() < relevant_fraction and 0 < page_index < num_pages - 1
+        paragraphs, lines_used = [], 0
+        while True:
+            if relevant:
+                a, b = rng.sample(DEFENDANTS, 2)
+                body = rng.choice(CONDUCT).format(a=a, b=b, drug=rng.choice(DRUGS))
+            else:
+                body = rng.choice(BOILERPLATE)
+            paragraph = f"{paragraph_number}. {body}"
+            lines = len(textwrap.wrap(paragraph, WRAP_COLUMNS)) + 1
+            if paragraphs and lines_used + lines > LINES_PER_PAGE:
+                break
+            paragraphs.append(paragraph)
+            lines_used += lines
+            paragraph_number += 1
+        pages.append(paragraphs)
+    return pages
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(pages, path):
+    """Writes one text page per entry using a built-in Helvetica font (PDF 1.4, no compression)."""
+    objects = [] # Object bodies; object number = index + 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(None) # Filled in once the page tree exists
+    pages_id = add(None)
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    page_ids = []
+    for page_number, paragraphs in enumerate(pages, start=1):
+        lines = []
+        for paragraph in paragraphs:
+            lines.extend(textwrap.wrap(paragraph, WRAP_COLUMNS))
+            lines.append("")
+        operators = ["BT", "/F1 10 Tf", "13 TL", "54 748 Td"]
+        operators += [f"({_pdf_escape(line)}) Tj T*" for line in lines]
+        operators += ["ET", "BT", "/F1 9 Tf", f"296 30 Td ({page_number}) Tj", "ET"]
+        stream = "\n".join(operators).encode("cp1252", errors="replace")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 %d 0 R >> >> "
+            b"/Contents %d 0 R >>" % (pages_id, font_id, content_id)))
+
+    objects[catalog_id - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref_offset)
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(output)
+
+
+def write_docx(pages, path):
+    from docx import Document
+    document = Document()
+    for paragraphs in pages:
+        for paragraph in paragraphs:
+            document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def generate_complaint(path, num_pages, relevant_fraction=0.7, seed=7):
+    """Writes a synthetic complaint to path; the format follows the extension (.pdf or .docx)."""
+    pages = complaint_pages(num_pages, relevant_fraction, seed)
+    if path.lower().endswith(".docx"):
+        write_docx(pages, path)
+    else:
+        write_pdf(pages, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_path")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--relevant-fraction", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    generate_complaint(args.output_path, args.pages, args.relevant_fraction, args.seed)
+    print(f"Wrote {args.pages}-page synthetic complaint to {os.path.abspath(args.output_path)}")
+
+
+if __name__ == "__main__":
+    main()
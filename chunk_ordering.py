@@ -0,0 +1,82 @@
+"""
+Orders a job's chunks longest-first and predicts when the job will finish.
+
+A job finishes when its last chunk does. If chunks go out in page order, a few huge
+exhibit pages near the end start last while the other slots sit idle. So each document's
+queue in the scheduler is ordered by estimated call time, longest first (LPT), rather
+than by page. Results are still reassembled in page order (see JobStore.job_rows). The
+same estimates give a predicted completion time, stored next to the actual one in the
+job's stats.
+"""
+import heapq
+import os
+import re
+from collections import namedtuple
+
+from amendment import PARAGRAPH_START_PATTERN
+from chunk_planning import PROMPT_INSTRUCTION_TOKENS
+
+CHUNK_ORDERING = os.getenv("CHUNK_ORDERING", "lpt").lower() # "lpt" or "document" (page order)
+GEMINI_BASE_LATENCY_SECONDS = float(os.getenv("GEMINI_BASE_LATENCY_SECONDS", "1.5"))
+GEMINI_INPUT_TOKENS_PER_SECOND = float(os.getenv("GEMINI_INPUT_TOKENS_PER_SECOND", "8000"))
+GEMINI_OUTPUT_TOKENS_PER_SECOND = float(os.getenv("GEMINI_OUTPUT_TOKENS_PER_SECOND", "120"))
+OUTPUT_TOKENS_PER_PARAGRAPH = 120 # Roughly one allegation object per numbered paragraph
+OUTPUT_TOKENS_PER_TEXT_TOKEN = 0.25 # Fallback for text without numbered paragraphs
+OUTPUT_TOKENS_EMPTY = 20 # {"allegations": []}
+MAX_OUTPUT_TOKENS = 8192
+
+ChunkCost = namedtuple("ChunkCost", ["input_tokens", "output_tokens", "seconds"])
+
+
+def estimate_chunk_cost(chunk):
+    """Estimated prompt tokens, response tokens and call seconds for one PlannedChunk."""
+    input_tokens = chunk.tokens + PROMPT_INSTRUCTION_TOKENS
+    paragraphs = len(PARAGRAPH_START_PATTERN.findall(chunk.text))
+    body_tokens = paragraphs * OUTPUT_TOKENS_PER_PARAGRAPH if paragraphs else chunk.tokens * OUTPUT_TOKENS_PER_TEXT_TOKEN
+    output_tokens = int(min(MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_EMPTY + body_tokens))
+    seconds = (GEMINI_BASE_LATENCY_SECONDS + input_tokens / GEMINI_INPUT_TOKENS_PER_SECOND
+               + output_tokens / GEMINI_OUTPUT_TOKENS_PER_SECOND)
+    return ChunkCost(input_tokens, output_tokens, seconds)
+
+
+def predicted_makespan(durations, slots, requests_per_minute=0, tokens_per_minute=0, tokens=0,
+                       arrivals=None, longest_first=True, requests_available=None, tokens_available=None):
+    """
+    Seconds for durations to finish on `slots` parallel calls (list-scheduling
+    simulation), or longer if the per-minute rate budgets bind. arrivals gives each
+    duration's queueing time (default: all at 0); whenever a slot frees up it takes the
+    longest chunk queued so far, or the earliest queued one if not longest_first.
+    requests_available and tokens_available are what the rate buckets held at the first
+    arrival (default: full, i.e. one minute's budget); anything beyond them is paced at
+    the per-minute rate.
+    """
+    if not durations:
+        return 0.0
+    queued = sorted(zip(arrivals or [0.0] * len(durations), range(len(durations)), durations))
+    free_at = [0.0] * max(1, slots)
+    ready = [] # (-duration or arrival order, duration) of chunks queued but not started
+    makespan, next_queued = 0.0, 0
+    while next_queued < len(queued) or ready:
+        start = free_at[0] if ready else max(free_at[0], queued[next_queued][0])
+        while next_queued < len(queued) and queued[next_queued][0] <= start:
+            _, order, duration = queued[next_queued]
+            heapq.heappush(ready, (-duration if longest_first else order, duration))
+            next_queued += 1
+        _, duration = heapq.heappop(ready)
+        heapq.heapreplace(free_at, start + duration) # Next free slot takes it
+        makespan = max(makespan, start + duration)
+    if requests_per_minute > 0:
+        available = requests_per_minute if requests_available is None else requests_available
+        makespan = max(makespan, 60.0 * (len(durations) - available) / requests_per_minute)
+    if tokens_per_minute > 0:
+        available = tokens_per_minute if tokens_available is None else tokens_available
+        makespan = max(makespan, 60.0 * (tokens - available) / tokens_per_minute)
+    return makespan
+
+
+def page_order_key(page_id):
+    """Document order of a stored page/chunk id: "12", "12-14", "12 (part 2/3)", "DOCX_Chunk_4"."""
+    match = re.match(r"(?:DOCX_Chunk_)?(\d+)(?:-\d+)?(?: \(part (\d+)/\d+\))?$", str(page_id))
+    if match:
+        return (0, int(match.group(1)), int(match.group(2) or 0))
+    return (-1, 0, 0) # Carried-over rows (amendment mode) and other non-page ids lead
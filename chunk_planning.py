@@ -0,0 +1,168 @@
+"""
+Packs page text into token-budgeted Gemini requests.
+
+Short pages (captions, signature blocks, tables of contents) don't justify a whole
+instruction prompt each. Consecutive pages are packed into one request up to a token
+budget, each introduced by a segment marker so Pin_Cite_Page stays exact, and oversized
+pages are split so responses don't run into max_output_tokens.
+"""
+import os
+from collections import namedtuple
+
+from allegation_prompt import ALLEGATION_PROMPT_TEMPLATE
+from scheduling import CHARS_PER_TOKEN, estimate_tokens
+
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "4000"))
+MAX_SEGMENT_TOKENS = int(os.getenv("MAX_SEGMENT_TOKENS", str(CHUNK_TOKEN_BUDGET)))
+LEGACY_DOCX_PARAS_PER_CHUNK = 20 # Fixed DOCX chunk size before packing; used as the "before" baseline
+PROMPT_INSTRUCTION_TOKENS = estimate_tokens(ALLEGATION_PROMPT_TEMPLATE.format(text_chunk=""))
+
+# final_pages: the pages whose last part is in this chunk. A split page appears in the
+# pages of every chunk holding one of its parts, but only counts towards job progress once.
+PlannedChunk = namedtuple("PlannedChunk", ["chunk_id", "text", "segment_labels", "pages", "tokens", "final_pages"])
+
+
+def segment_marker(segment_id):
+    return f"=== SEGMENT {segment_id} ==="
+
+
+def split_oversized_text(text, max_tokens):
+    """Splits text on line boundaries into pieces of at most max_tokens, hard-wrapping very long lines."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return [text]
+    pieces, current, current_chars = [], [], 0
+    for line in text.split("\n"):
+        while len(line) > max_chars:
+            if current:
+                pieces.append("\n".join(current))
+                current, current_chars = [], 0
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and current_chars + len(line) + 1 > max_chars:
+            pieces.append("\n".join(current))
+            current, current_chars = [], 0
+        current.append(line)
+        current_chars += len(line) + 1
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+class ChunkPlanner:
+    """
+    Packs pages (PDF) or paragraphs (DOCX) into Gemini requests of at most token_budget
+    text tokens, and keeps the counts needed to report calls/tokens before and after packing.
+    """
+
+    def __init__(self, token_budget=CHUNK_TOKEN_BUDGET, max_segment_tokens=MAX_SEGMENT_TOKENS):
+        self.token_budget = token_budget
+        self.max_segment_tokens = min(max_segment_tokens, token_budget)
+        self._pending = [] # (page label, text, part number, part count) segments of the chunk being built
+        self._pending_tokens = 0
+        self._next_page = 1
+        self._waiting_pages = {} # pages that arrived ahead of _next_page
+        self.units_in = 0 # non-empty pages (PDF) or paragraphs (DOCX) seen
+        self.text_tokens_in = 0
+        self.chunks_out = 0
+        self.chunk_tokens_out = 0
+
+    def add_page(self, page_number, text):
+        """
+        Accepts 1-based pages in any order (text may be empty) and returns the chunks
+        completed so far. Pages are packed in document order, so only consecutive pages
+        share a request.
+        """
+        self._waiting_pages[page_number] = text
+        ready = []
+        while self._next_page in self._waiting_pages:
+            page_text = self._waiting_pages.pop(self._next_page)
+            if page_text and page_text.strip():
+                ready.extend(self._add_segment_text(str(self._next_page), page_text))
+            self._next_page += 1
+        return ready
+
+    def flush(self):
+        """Returns the last partial chunk (and any pages stranded behind a gap in numbering)."""
+        ready = []
+        for page_number in sorted(self._waiting_pages):
+            page_text = self._waiting_pages[page_number]
+            if page_text and page_text.strip():
+                ready.extend(self._add_segment_text(str(page_number), page_text))
+        self._waiting_pages.clear()
+        if self._pending:
+            ready.append(self._emit())
+        return ready
+
+    def _add_segment_text(self, label, text):
+        self.units_in += 1
+        ready = []
+        pieces = split_oversized_text(text, self.max_segment_tokens)
+        for part_number, piece in enumerate(pieces, start=1):
+            tokens = estimate_tokens(piece)
+            self.text_tokens_in += tokens
+            if self._pending and self._pending_tokens + tokens > self.token_budget:
+                ready.append(self._emit())
+            self._pending.append((label, piece, part_number, len(pieces)))
+            self._pending_tokens += tokens
+        return ready
+
+    def _emit(self, chunk_id=None):
+        segment_labels = {}
+        parts = []
+        for index, (label, piece, _, _) in enumerate(self._pending, start=1):
+            segment_id = f"S{index}"
+            segment_labels[segment_id] = label
+            parts.append(f"{segment_marker(segment_id)}\n{piece}")
+        pages = list(dict.fromkeys(label for label, _, _, _ in self._pending))
+        final_pages = [label for label, _, part_number, part_count in self._pending if part_number == part_count]
+        if chunk_id is None:
+            chunk_id = pages[0] if len(pages) == 1 else f"{pages[0]}-{pages[-1]}"
+            _, _, part_number, part_count = self._pending[0]
+            if len(pages) == 1 and part_count > 1:
+                # Pieces of one split page each get their own request; keep their ids distinct
+                chunk_id = f"{chunk_id} (part {part_number}/{part_count})"
+        text = "\n".join(parts)
+        tokens = estimate_tokens(text)
+        self._pending, self._pending_tokens = [], 0
+        self.chunks_out += 1
+        self.chunk_tokens_out += tokens
+        return PlannedChunk(chunk_id, text, segment_labels, pages, tokens, final_pages)
+
+    def pack_paragraphs(self, paragraphs):
+        """
+        Packs DOCX paragraphs by token budget instead of a fixed paragraph count. DOCX has
+        no pages, so each chunk is one segment labelled DOCX_Chunk_N.
+        """
+        chunks = []
+        for paragraph in paragraphs:
+            self.units_in += 1
+            for piece in split_oversized_text(paragraph, self.max_segment_tokens):
+                tokens = estimate_tokens(piece)
+                self.text_tokens_in += tokens
+                if self._pending and self._pending_tokens + tokens > self.token_budget:
+                    chunks.append(self._emit_paragraphs(len(chunks) + 1))
+                self._pending.append((None, piece, 1, 1))
+                self._pending_tokens += tokens
+        if self._pending:
+            chunks.append(self._emit_paragraphs(len(chunks) + 1))
+        return chunks
+
+    def _emit_paragraphs(self, chunk_number):
+        chunk_id = f"DOCX_Chunk_{chunk_number}"
+        self._pending = [(chunk_id, "\n".join(piece for _, piece, _, _ in self._pending), 1, 1)]
+        return self._emit(chunk_id)
+
+    def packing_stats(self, baseline_calls):
+        """Gemini calls and prompt tokens (instructions + text) without and with packing."""
+        return {
+            "before": {
+                "calls": baseline_calls,
+                "prompt_tokens": baseline_calls * PROMPT_INSTRUCTION_TOKENS + self.text_tokens_in
+            },
+            "after": {
+                "calls": self.chunks_out,
+                "prompt_tokens": self.chunks_out * PROMPT_INSTRUCTION_TOKENS + self.chunk_tokens_out
+            },
+            "token_budget": self.token_budget
+        }
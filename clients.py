@@ -0,0 +1,143 @@
+"""
+Azure Blob Storage and Gemini clients, and their background initialization.
+
+blob_service_client and gemini_backend_global stay None until initialize_clients()
+has run, so other modules read them as attributes of this module
+(clients.blob_service_client) rather than importing the names.
+"""
+import os
+import time
+import threading
+
+from observability import logger
+
+# --- Azure Blob Storage Configuration ---
+AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+UPLOAD_CONTAINER_NAME = "uploads"
+OUTPUT_CONTAINER_NAME = "outputs"
+
+# "memory" swaps in an in-process fake (offline_backends.py) for local runs and tests
+AZURE_STORAGE_BACKEND = os.getenv("AZURE_STORAGE_BACKEND", "azure").lower()
+# Large uploads are split into blocks and sent in parallel
+BLOB_UPLOAD_CONCURRENCY = int(os.getenv("BLOB_UPLOAD_CONCURRENCY", "4"))
+BLOB_MAX_BLOCK_SIZE = 4 * 1024 * 1024
+BLOB_MAX_SINGLE_PUT_SIZE = 8 * 1024 * 1024
+
+def ensure_blob_containers(client):
+    """Ensure containers exist (optional, but good for first run)."""
+    for container_name in (UPLOAD_CONTAINER_NAME, OUTPUT_CONTAINER_NAME):
+        try:
+            client.create_container(container_name)
+            logger.info(f"Container '{container_name}' created (or already exists).")
+        except Exception as e:
+            if "ContainerAlreadyExists" not in str(e): # Check for specific error message
+                logger.warning(f"Could not create '{container_name}' container: {e}")
+
+# Set by init_blob_storage() on the background client-init thread (see initialize_clients)
+blob_service_client = None
+
+
+def init_blob_storage():
+    """Creates the blob client and makes sure the containers exist. Returns the client state."""
+    global blob_service_client
+    if AZURE_STORAGE_BACKEND == "memory":
+        from offline_backends import InMemoryBlobServiceClient
+        client = InMemoryBlobServiceClient()
+        logger.warning("Using in-memory blob storage (AZURE_STORAGE_BACKEND=memory); data is lost on restart.")
+    elif AZURE_STORAGE_CONNECTION_STRING:
+        from azure.storage.blob import BlobServiceClient
+        client = BlobServiceClient.from_connection_string(
+            AZURE_STORAGE_CONNECTION_STRING,
+            max_block_size=BLOB_MAX_BLOCK_SIZE,
+            max_single_put_size=BLOB_MAX_SINGLE_PUT_SIZE
+        )
+        logger.info("Azure Blob Storage client initialized.")
+    else:
+        logger.warning("AZURE_STORAGE_CONNECTION_STRING not found. Azure Blob Storage will not work.")
+        return "unconfigured"
+    ensure_blob_containers(client) # Network round trips; why this runs off the import path
+    blob_service_client = client
+    return "ready"
+
+# --- Google Gemini Client Initialization ---
+# All model calls go through a backend object exposing generate_content(prompt), which
+# returns a response with .text, .prompt_feedback and .candidates like the Gemini SDK.
+# "fake" swaps in an offline stand-in (offline_backends.py) for local runs and benchmarks.
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "google").lower()
+
+
+class GoogleGeminiBackend:
+    """Wraps genai.GenerativeModel with the generation and safety settings this app always uses."""
+
+    def __init__(self, api_key, model_name):
+        import google.generativeai as genai # Slow to import; only loaded when this backend is used
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        self.generation_config = genai.types.GenerationConfig(
+            temperature=0.0,
+            response_mime_type="application/json",
+            max_output_tokens=8192
+        )
+        self.safety_settings = [{"category": c, "threshold": "BLOCK_NONE"}
+                                for c in genai.types.HarmCategory if c != genai.types.HarmCategory.HARM_CATEGORY_UNSPECIFIED]
+
+    def generate_content(self, prompt, timeout=None):
+        return self.model.generate_content(
+            prompt,
+            generation_config=self.generation_config,
+            safety_settings=self.safety_settings,
+            request_options={"timeout": timeout} if timeout else None
+        )
+
+
+gemini_backend_global = None # Set by init_gemini_backend() on the client-init thread
+gemini_api_key_global = os.getenv("GOOGLE_API_KEY")
+gemini_model_name_global = os.getenv("GEMINI_MODEL")
+if GEMINI_BACKEND == "fake" and not gemini_model_name_global:
+    gemini_model_name_global = os.getenv("FAKE_GEMINI_MODEL", "fake-gemini") # Known up front: it is part of cache keys
+
+
+def init_gemini_backend():
+    """Creates the configured Gemini backend. Returns the client state."""
+    global gemini_backend_global
+    if GEMINI_BACKEND == "fake":
+        from offline_backends import FakeGeminiBackend
+        gemini_backend_global = FakeGeminiBackend.from_env()
+        logger.info(f"Using fake Gemini backend ({gemini_backend_global.describe()}).")
+    elif gemini_api_key_global and gemini_model_name_global:
+        gemini_backend_global = GoogleGeminiBackend(gemini_api_key_global, gemini_model_name_global)
+        logger.info(f"Google Gemini Client Initialized. Model: {gemini_model_name_global}")
+    else:
+        logger.warning("Google Gemini API Key or Model Name not found. Gemini features will not work.")
+        return "unconfigured"
+    return "ready"
+
+# --- Background Client Initialization ---
+# Client setup (container creation, SDK imports) runs on background threads started by
+# start_background_services(), so a worker is accepting connections right away. Routes
+# and job workers that need a client wait on clients_ready; /ready reports the state.
+CLIENT_INIT_WAIT_SECONDS = float(os.getenv("CLIENT_INIT_WAIT_SECONDS", "30")) # How long a request waits for startup
+clients_ready = threading.Event()
+client_init_status = {"blob_storage": {"state": "pending"}, "gemini": {"state": "pending"}}
+
+
+def initialize_clients():
+    """Initializes blob storage and Gemini in parallel, then sets clients_ready."""
+    def run(component, init):
+        start = time.perf_counter()
+        try:
+            status = {"state": init()}
+        except Exception as e:
+            logger.error(f"Error initializing {component} client: {e}", exc_info=True)
+            status = {"state": "failed", "error": str(e)}
+        status["seconds"] = round(time.perf_counter() - start, 3)
+        client_init_status[component] = status
+
+    threads = [threading.Thread(target=run, args=(component, init), name=f"init-{component}", daemon=True)
+               for component, init in (("blob_storage", init_blob_storage), ("gemini", init_gemini_backend))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    clients_ready.set()
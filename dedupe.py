@@ -0,0 +1,177 @@
+"""
+Merges near-duplicate allegations returned for the same product.
+
+The same allegation often comes back more than once (a paragraph split across a page
+break, or restated in a summary section). After collection, summaries are embedded in
+one batch and near-duplicates within each product are found with a radius nearest-
+neighbour search, then merged into one row with combined pin cites. Every row in a
+merged group is within DEDUPE_SIMILARITY of the group's kept row, so chains of pairwise-
+similar rows don't collapse into one.
+"""
+import os
+import re
+
+from local_state import env_flag
+from observability import logger
+from relevance_prefilter import load_sentence_transformer
+
+DEDUPE_ENABLED = env_flag("DEDUPE_ENABLED", True)
+DEDUPE_SIMILARITY = float(os.getenv("DEDUPE_SIMILARITY", "0.85")) # Cosine similarity to treat two summaries as one allegation
+DEDUPE_EMBEDDING_MODEL = os.getenv("DEDUPE_EMBEDDING_MODEL") # Unset = character n-gram TF-IDF
+DEDUPE_EMBED_BATCH_SIZE = int(os.getenv("DEDUPE_EMBED_BATCH_SIZE", "256"))
+NON_ALLEGATION_PRODUCTS = {"ERROR", "N/A", "No Data"} # Placeholder rows are never merged
+
+
+def embed_allegation_summaries(summaries):
+    """Returns one L2-normalized vector (dense or sparse row) per summary."""
+    if DEDUPE_EMBEDDING_MODEL:
+        try:
+            model = load_sentence_transformer(DEDUPE_EMBEDDING_MODEL)
+            return model.encode(summaries, batch_size=DEDUPE_EMBED_BATCH_SIZE, normalize_embeddings=True)
+        except Exception as e:
+            logger.warning(f"Dedupe embedding model unavailable, falling back to TF-IDF: {e}")
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    # Character n-grams tolerate the small rewordings the model makes between pages
+    vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True, dtype=np.float32)
+    return vectorizer.fit_transform(summaries)
+
+
+def pin_cite_sort_key(cite):
+    """Sorts pin cites by their leading page number ("12", "4 (part 1/3)"), others last."""
+    match = re.match(r"\s*(\d+)", str(cite))
+    return (int(match.group(1)), str(cite)) if match else (float("inf"), str(cite))
+
+
+def join_unique(values, separator=", ", sort_key=None, split=True):
+    """Joins the distinct, non-placeholder values (or their comma-separated parts, if split)."""
+    parts = []
+    for value in values:
+        for part in (str(value).split(",") if split else [str(value)]):
+            part = part.strip()
+            if part and part != "N/A" and part not in parts:
+                parts.append(part)
+    if sort_key:
+        parts.sort(key=sort_key)
+    return separator.join(parts) if parts else "N/A"
+
+
+CORPORATE_SUFFIX_PATTERN = re.compile(
+    r"^(?:inc|incorporated|llc|l\.l\.c|ltd|limited|corp|corporation|co|company|lp|l\.p|llp|l\.l\.p|plc|"
+    r"n\.v|nv|s\.a|sa|ag|gmbh|et al)\.?$", re.IGNORECASE)
+
+
+def split_entity_names(value):
+    """
+    Individual names in a comma-separated list (as the LLM writes them and as merged rows
+    are joined), keeping corporate suffixes with their name ("Teva USA, Inc." stays one
+    name). Semicolons, which earlier merges used, also separate names.
+    """
+    names = []
+    for part in re.split(r"[;,]", str(value)):
+        part = part.strip()
+        if not part or part.upper() == "N/A":
+            continue
+        if names and CORPORATE_SUFFIX_PATTERN.match(part):
+            names[-1] = f"{names[-1]}, {part}"
+        else:
+            names.append(part)
+    return names
+
+
+def entity_name_key(name):
+    """Comparison key for an entity name: case, punctuation and spacing ignored."""
+    return " ".join(re.sub(r"[^\w\s]", " ", name.lower()).split())
+
+
+def union_entity_names(values):
+    """
+    Distinct names across values, in first-seen order and spelling, joined with ", " like
+    the LLM's own lists, so split_entity_names reads the merged value back name for name.
+    """
+    names = {}
+    for value in values:
+        for name in split_entity_names(value):
+            names.setdefault(entity_name_key(name), name)
+    return ", ".join(names.values()) if names else "N/A"
+
+
+def merge_pin_cites(cluster_rows):
+    """
+    Combined (Pin_Cite_Page, Pin_Cite_Paragraph) for merged rows. Paragraphs are grouped
+    by the page they were cited with; when there are several pages, both fields are
+    "; "-separated and the n-th paragraph group belongs to the n-th page.
+    """
+    paragraphs_by_page = {}
+    for row in cluster_rows:
+        page = str(row.get("Pin_Cite_Page", "N/A")).strip() or "N/A"
+        paragraphs = paragraphs_by_page.setdefault(page, [])
+        for part in str(row.get("Pin_Cite_Paragraph", "N/A")).split(","):
+            part = part.strip()
+            if part and part != "N/A" and part not in paragraphs:
+                paragraphs.append(part)
+    if len(paragraphs_by_page) > 1 and paragraphs_by_page.get("N/A") == []:
+        del paragraphs_by_page["N/A"] # A row with no cites adds nothing next to real ones
+    pages = sorted(paragraphs_by_page, key=pin_cite_sort_key)
+    paragraph_groups = [", ".join(sorted(paragraphs_by_page[page], key=pin_cite_sort_key)) or "N/A" for page in pages]
+    return "; ".join(pages), "; ".join(paragraph_groups)
+
+
+def merge_allegation_cluster(cluster_rows):
+    """Collapses duplicate rows into the one with the fullest summary, combining pin cites and names."""
+    merged = dict(max(cluster_rows, key=lambda row: len(str(row.get("Specific_Allegation_Summary", "")))))
+    merged["Pin_Cite_Page"], merged["Pin_Cite_Paragraph"] = merge_pin_cites(cluster_rows)
+    for field in ("Involved_Defendants_CoConspirators", "Other_Named_Entities"):
+        merged[field] = union_entity_names(row.get(field, "N/A") for row in cluster_rows)
+    return merged
+
+
+def merge_near_duplicate_allegations(rows, similarity=DEDUPE_SIMILARITY):
+    """
+    Merges near-duplicate allegations within each Product_Name group.
+    Returns (rows, merged_away) where merged_away is how many rows were folded into others.
+    Each merged row takes the position of the first row in its cluster.
+    """
+    candidates = [index for index, row in enumerate(rows)
+                  if row.get("Product_Name") not in NON_ALLEGATION_PRODUCTS
+                  and str(row.get("Specific_Allegation_Summary", "")).strip()]
+    if len(candidates) < 2:
+        return rows, 0
+
+    import numpy as np
+    import pandas as pd
+    from sklearn.neighbors import NearestNeighbors
+
+    vectors = embed_allegation_summaries([rows[index]["Specific_Allegation_Summary"] for index in candidates])
+    product_keys = [str(rows[index]["Product_Name"]).strip().lower() for index in candidates]
+    candidates = np.array(candidates)
+
+    replacement = {} # first row index of a cluster -> merged row
+    dropped = set() # other row indices of a cluster
+    for members in pd.Series(product_keys).groupby(product_keys).indices.values():
+        if len(members) < 2:
+            continue
+        group_vectors = vectors[members]
+        neighbours = NearestNeighbors(radius=1.0 - similarity, metric="cosine", algorithm="brute").fit(group_vectors)
+        neighbour_lists = neighbours.radius_neighbors(group_vectors, return_distance=False)
+        # Rows with the fullest summaries are kept (see merge_allegation_cluster), so they
+        # claim their unclaimed neighbours first; each group is one kept row and rows
+        # within the threshold of it, never a chain of neighbours of neighbours.
+        summary_lengths = [len(str(rows[candidates[member]]["Specific_Allegation_Summary"])) for member in members]
+        claimed = set()
+        for position in sorted(range(len(members)), key=lambda position: (-summary_lengths[position], position)):
+            if position in claimed:
+                continue
+            group = [position] + [other for other in neighbour_lists[position].tolist()
+                                  if other != position and other not in claimed]
+            claimed.update(group)
+            if len(group) < 2:
+                continue
+            cluster = np.sort(candidates[members[group]])
+            replacement[cluster[0]] = merge_allegation_cluster([rows[index] for index in cluster])
+            dropped.update(cluster[1:].tolist())
+
+    if not replacement:
+        return rows, 0
+    merged_rows = [replacement.get(index, row) for index, row in enumerate(rows) if index not in dropped]
+    return merged_rows, len(dropped)
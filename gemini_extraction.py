@@ -0,0 +1,297 @@
+"""
+Gemini allegation extraction for one planned chunk.
+
+Each chunk is served from the per-segment result cache when every segment is cached;
+otherwise it is sent through the shared scheduler (with retries, deadlines and hedging),
+partial answers are salvaged and completed with follow-up calls, and the segment IDs
+the model cites are mapped back to page labels.
+"""
+import json
+import time
+
+import clients
+from allegation_prompt import ALLEGATION_PROMPT_TEMPLATE
+from hedging import generate_with_deadline
+from job_store import job_store
+from llm_cache import LLMResultCache, llm_result_cache
+from observability import logger, metrics, record_stage, timed_stage
+from response_parsing import (
+    GEMINI_CONTINUATION_MAX_DEPTH, SEGMENT_MARKER_PATTERN, continuation_chunks, salvage_allegations,
+    strip_code_fence
+)
+from scheduling import (
+    GEMINI_MAX_RETRIES, RequeueTask, backoff_delay, classify_gemini_error, estimate_tokens, gemini_scheduler
+)
+
+
+def resolve_pin_cite_pages(allegations, page_num_or_chunk_id, segment_labels=None):
+    """
+    Maps the segment IDs the model returns in Pin_Cite_Page ("S1", "S2", ...) back to
+    real page labels. Cached results are stored per segment and re-labelled with the
+    segment's ID in the current chunk (see cached_segment_allegations), so they stay
+    valid when the same text turns up at a different page (e.g. a shared exhibit).
+    Unrecognized values fall back to the chunk's page range.
+    """
+    segment_labels = segment_labels or {"S1": str(page_num_or_chunk_id)}
+    distinct_pages = set(segment_labels.values())
+    resolved = []
+    for item in allegations:
+        item = dict(item)
+        cited = str(item.get("Pin_Cite_Page", "")).strip().upper()
+        if cited in segment_labels:
+            item["Pin_Cite_Page"] = segment_labels[cited]
+        elif len(distinct_pages) == 1:
+            item["Pin_Cite_Page"] = next(iter(distinct_pages))
+        else:
+            item["Pin_Cite_Page"] = str(page_num_or_chunk_id)
+        resolved.append(item)
+    return resolved
+
+
+def record_token_usage(response, prompt_tokens_estimate, response_text):
+    """Counts tokens in/out from the response's usage metadata, falling back to estimates."""
+    usage = getattr(response, "usage_metadata", None)
+    tokens_in = getattr(usage, "prompt_token_count", None) or prompt_tokens_estimate
+    tokens_out = getattr(usage, "candidates_token_count", None) or estimate_tokens(response_text or "")
+    metrics.inc("gemini_tokens_total", tokens_in, direction="input")
+    metrics.inc("gemini_tokens_total", tokens_out, direction="output")
+
+
+def analyze_text_chunk_with_gemini(text_chunk, page_num_or_chunk_id, filename_for_context, use_cache=True,
+                                   segment_labels=None, job_id=None, attempt=0):
+    """
+    Analyzes a given text chunk using the Google Gemini model to extract legal allegations.
+    Returns a list of dictionaries, each representing an allegation.
+    text_chunk carries "=== SEGMENT Sn ===" markers (see ChunkPlanner); segment_labels maps
+    each segment ID to its page label. Without it the chunk is treated as a single page.
+    With use_cache=False the cached result is ignored (but refreshed on success).
+    job_id attributes this call's timing spans to the job's breakdown. attempt is set by
+    the scheduler when it reruns the task after a retryable error (see RequeueTask).
+    """
+    segments = chunk_segments(text_chunk)
+    if use_cache and not attempt: # A rerun already missed the cache
+        cached_allegations = cached_segment_allegations(segments)
+        metrics.inc("llm_cache_lookups_total", result="hit" if cached_allegations is not None else "miss")
+        if cached_allegations is not None:
+            logger.info(f"  [Cache Hit] Page/Chunk '{page_num_or_chunk_id}' served {len(cached_allegations)} cached allegations.")
+            return resolve_pin_cite_pages(cached_allegations, page_num_or_chunk_id, segment_labels)
+
+    if not clients.gemini_backend_global:
+        return [{"Error": "Google Gemini client not initialized."}]
+
+    allegations = request_allegations(text_chunk, page_num_or_chunk_id, job_id, first_attempt=attempt)
+    if not any("Error" in item for item in allegations):
+        cache_segment_allegations(segments, allegations)
+    return resolve_pin_cite_pages(allegations, page_num_or_chunk_id, segment_labels)
+
+
+def chunk_segments(text_chunk):
+    """
+    (segment ID, text) for each "=== SEGMENT Sn ===" block of a chunk. Text without
+    markers is a single segment with no ID.
+    """
+    markers = list(SEGMENT_MARKER_PATTERN.finditer(text_chunk))
+    if not markers:
+        return [(None, text_chunk)]
+    ends = [marker.start() for marker in markers[1:]] + [len(text_chunk)]
+    return [(marker.group(1), text_chunk[marker.end():end].strip("\n")) for marker, end in zip(markers, ends)]
+
+
+def cached_segment_allegations(segments):
+    """
+    The chunk's allegations assembled from per-segment cache entries, with Pin_Cite_Page
+    set to each segment's ID in this chunk, or None unless every segment is cached.
+    Keying by segment text rather than the packed chunk means a page keeps its cached
+    result when it is packed with different neighbours or turns up at a different page.
+    """
+    allegations = []
+    for segment_id, segment_text in segments:
+        cached = llm_result_cache.get(LLMResultCache.make_key(segment_text))
+        if cached is None:
+            return None
+        allegations.extend(dict(item, Pin_Cite_Page=segment_id) if segment_id else item for item in cached)
+    return allegations
+
+
+def cache_segment_allegations(segments, allegations):
+    """
+    Stores a chunk's allegations under each segment's text. Nothing is cached if an
+    allegation can't be attributed to one of the chunk's segments.
+    """
+    by_segment = {segment_id: [] for segment_id, _ in segments}
+    for item in allegations:
+        cited = str(item.get("Pin_Cite_Page", "")).strip().upper()
+        if len(segments) == 1:
+            cited = segments[0][0]
+        if cited not in by_segment:
+            return
+        by_segment[cited].append(item)
+    for segment_id, segment_text in segments:
+        llm_result_cache.put(LLMResultCache.make_key(segment_text), by_segment[segment_id])
+
+
+def request_allegations(text_chunk, page_num_or_chunk_id, job_id=None, depth=0, first_attempt=0):
+    """
+    Calls Gemini (with retries) for one chunk and returns the raw allegation list, with
+    Pin_Cite_Page still holding segment IDs. Failures come back as {"Error": ...} items.
+    A response that breaks off part-way keeps every complete allegation; the missing tail
+    is requested with up to GEMINI_CONTINUATION_MAX_DEPTH rounds of follow-up calls on
+    the rest of the text (see continuation_chunks).
+
+    Throttled and server errors are retried; anything else fails at once. A top-level
+    call hands its backoff to the scheduler (RequeueTask with the next attempt number),
+    so the wait doesn't hold a concurrency slot. Follow-up calls, which can't be rerun
+    on their own, wait in place with their slot released.
+    """
+    prompt_content = ALLEGATION_PROMPT_TEMPLATE.format(text_chunk=text_chunk)
+
+    max_retries = GEMINI_MAX_RETRIES
+    estimated_prompt_tokens = estimate_tokens(prompt_content)
+
+    for attempt in range(first_attempt, max_retries):
+        attempt_start = None
+        try:
+            with timed_stage("gemini_rate_limit_wait", job_id):
+                gemini_scheduler.acquire_rate(estimated_prompt_tokens)
+            logger.info(f"  [LLM Call] Processing page/chunk '{page_num_or_chunk_id}' (Attempt {attempt + 1})...")
+            attempt_start = time.perf_counter()
+            response = generate_with_deadline(prompt_content, page_num_or_chunk_id, job_id, estimated_prompt_tokens)
+            call_seconds = time.perf_counter() - attempt_start
+            record_stage("gemini_call", call_seconds, job_id)
+
+            if response.prompt_feedback and response.prompt_feedback.block_reason:
+                metrics.observe("gemini_attempt_seconds", call_seconds, outcome="blocked")
+                metrics.inc("gemini_calls_total", outcome="blocked")
+                metrics.inc("gemini_safety_blocks_total")
+                reason = response.prompt_feedback.block_reason.name
+                error_msg = f"Gemini content generation blocked by safety filters ({reason}) for page '{page_num_or_chunk_id}'."
+                logger.warning(f"  [LLM Error] {error_msg}")
+                return [{"Error": error_msg}]
+
+            content_str = response.text.strip()
+            record_token_usage(response, estimated_prompt_tokens, content_str)
+
+            if not content_str:
+                metrics.observe("gemini_attempt_seconds", call_seconds, outcome="empty")
+                metrics.inc("gemini_calls_total", outcome="empty")
+                error_msg = f"Gemini response text is empty for page '{page_num_or_chunk_id}'."
+                if response.candidates and response.candidates[0].finish_reason.name == "SAFETY":
+                    metrics.inc("gemini_safety_blocks_total")
+                    safety_ratings_str = ", ".join([f"{r.category.name}: {r.probability.name}" for r in
+                                                     response.candidates[0].safety_ratings if
+                                                     hasattr(r, 'category') and hasattr(r, 'probability')])
+                    error_msg += f" Likely blocked by safety. Ratings: [{safety_ratings_str}]"
+                logger.warning(f"  [LLM Warning] {error_msg}")
+                return [{"Error": error_msg}]
+
+            parse_start = time.perf_counter()
+            content_str = strip_code_fence(content_str) # Clean markdown JSON block
+
+            try:
+                parsed_json_obj = json.loads(content_str)
+                record_stage("response_parse", time.perf_counter() - parse_start, job_id)
+                if isinstance(parsed_json_obj, dict) and "allegations" in parsed_json_obj:
+                    if isinstance(parsed_json_obj["allegations"], list):
+                        gemini_scheduler.record_success() # Only well-formed answers grow the concurrency limit
+                        metrics.observe("gemini_attempt_seconds", call_seconds, outcome="success")
+                        metrics.inc("gemini_calls_total", outcome="success")
+                        logger.info(
+                            f"  [LLM Success] Page/Chunk '{page_num_or_chunk_id}' found {len(parsed_json_obj['allegations'])} allegations.")
+                        return parsed_json_obj["allegations"]
+                    else:
+                        metrics.observe("gemini_attempt_seconds", call_seconds, outcome="unexpected_json")
+                        metrics.inc("gemini_calls_total", outcome="unexpected_json")
+                        error_msg = f"Gemini 'allegations' key is not a list for page '{page_num_or_chunk_id}': {parsed_json_obj['allegations']}"
+                        logger.warning(f"  [LLM Error] {error_msg}. Content: {content_str[:200]}")
+                        return [{"Error": error_msg, "Content_Snippet": content_str[:200]}]
+                else:
+                    metrics.observe("gemini_attempt_seconds", call_seconds, outcome="unexpected_json")
+                    metrics.inc("gemini_calls_total", outcome="unexpected_json")
+                    error_msg = f"Gemini returned unexpected JSON for page '{page_num_or_chunk_id}'. Expected 'allegations' key. Got: {content_str[:500]}"
+                    logger.warning(f"  [LLM Error] {error_msg}. Content: {content_str[:200]}")
+                    return [{"Error": error_msg, "Content_Snippet": content_str[:200]}]
+            except json.JSONDecodeError as je:
+                metrics.inc("gemini_json_decode_failures_total")
+                # Truncated or slightly malformed: keep every allegation object that decodes
+                salvaged, list_closed, malformed = salvage_allegations(content_str)
+                record_stage("response_parse", time.perf_counter() - parse_start, job_id)
+                if salvaged is None:
+                    metrics.observe("gemini_attempt_seconds", call_seconds, outcome="invalid_json")
+                    metrics.inc("gemini_calls_total", outcome="invalid_json")
+                    error_msg = f"Gemini did not return valid JSON for page '{page_num_or_chunk_id}': {content_str[:500]}. Error: {je}"
+                    logger.warning(f"  [LLM Error] {error_msg}. Content: {content_str[:200]}")
+                    return [{"Error": error_msg, "Content_Snippet": content_str[:200]}]
+                gemini_scheduler.record_success() # Complete allegation objects, cut off by length rather than load
+                metrics.observe("gemini_attempt_seconds", call_seconds, outcome="salvaged")
+                metrics.inc("gemini_calls_total", outcome="salvaged")
+                return complete_salvaged_response(
+                    text_chunk, page_num_or_chunk_id, job_id, depth, salvaged, list_closed, malformed, content_str)
+        except Exception as e:
+            error_kind = classify_gemini_error(e)
+            if attempt_start is not None:
+                call_seconds = time.perf_counter() - attempt_start
+                record_stage("gemini_call", call_seconds, job_id)
+                metrics.observe("gemini_attempt_seconds", call_seconds, outcome=f"error_{error_kind}")
+            metrics.inc("gemini_calls_total", outcome=f"error_{error_kind}")
+            error_msg = f"Error calling Google Gemini for page '{page_num_or_chunk_id}' (Attempt {attempt + 1}): {e}"
+            logger.warning(f"  [LLM Critical] {error_msg}", exc_info=error_kind == "other")
+            if error_kind == "other":
+                return [{"Error": f"Failed Gemini call for page '{page_num_or_chunk_id}' (not retryable): {e}"}]
+            gemini_scheduler.record_backoff(error_kind)
+            if attempt < max_retries - 1:
+                metrics.inc("gemini_retries_total", kind=error_kind)
+                delay = backoff_delay(attempt)
+                if depth == 0:
+                    record_stage("gemini_retry_backoff", delay, job_id)
+                    raise RequeueTask(delay, attempt=attempt + 1)
+                with timed_stage("gemini_retry_backoff", job_id), gemini_scheduler.slot_released():
+                    time.sleep(delay)
+            else:
+                return [{"Error": f"Failed Gemini call for page '{page_num_or_chunk_id}' after {max_retries} attempts: {e}"}]
+
+    return [{"Error": f"Failed Gemini call for page '{page_num_or_chunk_id}' after {max_retries} attempts (exhausted retries)."}]
+
+
+def complete_salvaged_response(text_chunk, page_num_or_chunk_id, job_id, depth, salvaged, list_closed, malformed,
+                               content_str):
+    """
+    Finishes a response that only partly parsed: a cut-off list gets follow-up calls for the
+    rest of the text, and whatever still can't be recovered becomes an Error item so the
+    page shows up as failed (and is retried by /jobs/<id>/resume).
+    """
+    allegations = list(salvaged)
+    follow_up_calls = 0
+    tail_recovered = list_closed
+    if not list_closed and depth < GEMINI_CONTINUATION_MAX_DEPTH:
+        follow_up_chunks = continuation_chunks(text_chunk, salvaged)
+        tail_recovered = bool(follow_up_chunks)
+        for follow_up_text in follow_up_chunks:
+            follow_up_calls += 1
+            logger.info(f"  [LLM Continuation] Page/Chunk '{page_num_or_chunk_id}' truncated after {len(salvaged)} "
+                        f"allegations; requesting the remaining {len(follow_up_text)} characters.")
+            follow_up = request_allegations(follow_up_text, page_num_or_chunk_id, job_id, depth + 1)
+            if any("Error" in item for item in follow_up):
+                tail_recovered = False
+            # The follow-up restarts at the last recovered paragraph, so drop exact repeats
+            allegations.extend(item for item in follow_up if "Error" in item or item not in allegations)
+        metrics.inc("gemini_continuations_total", amount=follow_up_calls, outcome="recovered" if tail_recovered else "failed")
+
+    lost = malformed + (0 if tail_recovered else 1) # An unrecovered tail counts as (at least) one lost allegation
+    metrics.inc("gemini_salvaged_allegations_total", amount=len(salvaged), outcome="recovered")
+    if lost:
+        metrics.inc("gemini_salvaged_allegations_total", amount=lost, outcome="lost")
+    if job_id:
+        job_store.increment_stats(job_id, "json_salvage", responses=1, recovered=len(salvaged), lost=lost,
+                                  continuation_calls=follow_up_calls)
+    logger.warning(f"  [LLM Salvage] Page/Chunk '{page_num_or_chunk_id}': recovered {len(salvaged)} allegations from a "
+                   f"{'malformed' if list_closed else 'truncated'} response ({malformed} malformed, "
+                   f"{follow_up_calls} follow-up calls).")
+
+    if lost and not any("Error" in item for item in allegations):
+        allegations.append({
+            "Error": f"Gemini response for page '{page_num_or_chunk_id}' was "
+                     f"{'malformed' if list_closed else 'truncated'}; {len(salvaged)} allegations recovered, "
+                     f"{'some' if not tail_recovered else malformed} could not be recovered.",
+            "Content_Snippet": content_str[-200:]
+        })
+    return allegations
@@ -0,0 +1,56 @@
+"""
+Gunicorn settings for Azure App Service (Linux).
+
+Startup command:
+    gunicorn -c gunicorn.conf.py app:app
+
+The heavy third-party libraries are imported once in the master process (on_starting),
+so every forked worker inherits them copy-on-write instead of importing its own copy,
+and a worker boot or restart only pays for importing the app itself. The app module is
+deliberately not preloaded (preload_app = False): at import it opens SQLite connections,
+which don't survive a fork. Importing it starts no threads; each worker starts its
+background services (client setup, resuming queued jobs, the index backfill) in
+post_worker_init, once it has loaded the app.
+"""
+import importlib
+import os
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "gthread"
+# Each worker runs its own Gemini scheduler and job pool against the shared SQLite job
+# store, so the Gemini request/token budgets apply per worker. Divide them when scaling up.
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "10"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = False
+
+# Imported in the master; failures are logged and left to the lazy imports in the app modules
+PRELOAD_MODULES = [
+    "numpy",
+    "pandas",
+    "openpyxl",
+    "docx",
+    "pdfplumber",
+    "azure.storage.blob",
+    "google.generativeai",
+    "sklearn.feature_extraction.text",
+    "sklearn.neighbors",
+]
+
+
+def on_starting(server):
+    start = time.perf_counter()
+    for module_name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            server.log.warning(f"Could not preload '{module_name}': {e}")
+    server.log.info(f"Preloaded {len(PRELOAD_MODULES)} libraries in {time.perf_counter() - start:.2f}s.")
+
+
+def post_worker_init(worker):
+    from app import start_background_services # Already imported by this worker
+    start_background_services()
@@ -0,0 +1,221 @@
+"""
+Per-call deadlines and hedged (duplicate) Gemini requests for slow calls.
+
+Every generate_content call gets a deadline, so one hung page can't hold its job open. A
+call still running past the recent p95 latency gets a duplicate request, and whichever
+answers first is used. Hedges are capped at a fraction of the tokens sent by first
+attempts and at GEMINI_HEDGE_MAX_IN_FLIGHT extra requests outstanding; a hedge counts
+until both of its call's attempts have ended, since the losing attempt keeps running
+after the scheduler slot has moved on. Hedges are also skipped when the rate budget has
+no room, or shortly after a 429, when a duplicate would only add to the pressure.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import clients
+from job_store import job_store
+from local_state import env_flag
+from observability import logger, metrics
+from scheduling import GEMINI_MAX_CONCURRENCY, gemini_scheduler
+
+GEMINI_CALL_TIMEOUT_SECONDS = float(os.getenv("GEMINI_CALL_TIMEOUT_SECONDS", "120"))
+GEMINI_HEDGE_ENABLED = env_flag("GEMINI_HEDGE_ENABLED", True)
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+GEMINI_HEDGE_BUDGET_FRACTION = float(os.getenv("GEMINI_HEDGE_BUDGET_FRACTION", "0.05")) # Extra tokens, relative to first attempts
+GEMINI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("GEMINI_HEDGE_MIN_DELAY_SECONDS", "1.0"))
+GEMINI_HEDGE_WINDOW = int(os.getenv("GEMINI_HEDGE_WINDOW", "500")) # Recent successful calls the threshold is taken from
+GEMINI_HEDGE_MAX_IN_FLIGHT = int(os.getenv("GEMINI_HEDGE_MAX_IN_FLIGHT", str(max(1, GEMINI_MAX_CONCURRENCY // 10))))
+GEMINI_HEDGE_MIN_SAMPLES = 20
+GEMINI_HEDGE_PAUSE_AFTER_BACKOFF_SECONDS = 30.0
+
+
+class GeminiDeadlineExceeded(TimeoutError):
+    """Raised when no attempt at a Gemini call answered within GEMINI_CALL_TIMEOUT_SECONDS."""
+
+
+class GeminiHedger:
+    """Rolling latency window of successful Gemini calls plus the hedging spend budget."""
+
+    THRESHOLD_REFRESH_SAMPLES = 16 # Re-sort the window at most this often
+
+    def __init__(self, percentile, window, min_samples, budget_fraction, min_delay, max_in_flight):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget_fraction = budget_fraction
+        self.min_delay = min_delay
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._samples_since_refresh = 0
+        self._threshold = None
+        self._primary_tokens = 0
+        self._hedge_tokens = 0
+        self._in_flight = 0
+        self._counters = {"primary_calls": 0, "hedges": 0, "hedge_wins": 0, "skipped_budget": 0,
+                          "skipped_in_flight": 0, "skipped_rate": 0, "skipped_backoff": 0, "deadlines_exceeded": 0}
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+            self._samples_since_refresh += 1
+            if self._threshold is None or self._samples_since_refresh >= self.THRESHOLD_REFRESH_SAMPLES:
+                self._refresh_threshold()
+
+    def _refresh_threshold(self):
+        # Caller holds the lock
+        self._samples_since_refresh = 0
+        if len(self._latencies) < self.min_samples:
+            self._threshold = None
+            return
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+        self._threshold = max(self.min_delay, ordered[index])
+
+    def hedge_delay(self):
+        """Seconds to wait on the first attempt before hedging, or None while there's too little history."""
+        with self._lock:
+            return self._threshold
+
+    def record_primary(self, tokens):
+        with self._lock:
+            self._primary_tokens += tokens
+            self._counters["primary_calls"] += 1
+
+    def try_spend(self, tokens):
+        """
+        Reserves a hedge's tokens and one of max_in_flight hedge slots, if that keeps
+        hedging within both. The slot is given back by hold_until_done.
+        """
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self._counters["skipped_in_flight"] += 1
+                return False
+            if self._hedge_tokens + tokens > self.budget_fraction * self._primary_tokens:
+                self._counters["skipped_budget"] += 1
+                return False
+            self._hedge_tokens += tokens
+            self._in_flight += 1
+            self._counters["hedges"] += 1
+            return True
+
+    def hold_until_done(self, attempts):
+        """Keeps a hedge's slot taken until every attempt of its call has finished or been cancelled."""
+        remaining = [len(attempts)]
+
+        def attempt_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if not remaining[0]:
+                    self._in_flight -= 1
+
+        for attempt in attempts:
+            attempt.add_done_callback(attempt_done)
+
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "enabled": GEMINI_HEDGE_ENABLED,
+                "hedge_delay_seconds": round(self._threshold, 3) if self._threshold is not None else None,
+                "latency_samples": len(self._latencies),
+                "budget_fraction": self.budget_fraction,
+                "spent_fraction": round(self._hedge_tokens / self._primary_tokens, 4) if self._primary_tokens else 0.0,
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                **self._counters
+            }
+
+
+gemini_hedger = GeminiHedger(
+    percentile=GEMINI_HEDGE_PERCENTILE,
+    window=GEMINI_HEDGE_WINDOW,
+    min_samples=GEMINI_HEDGE_MIN_SAMPLES,
+    budget_fraction=GEMINI_HEDGE_BUDGET_FRACTION,
+    min_delay=GEMINI_HEDGE_MIN_DELAY_SECONDS,
+    max_in_flight=GEMINI_HEDGE_MAX_IN_FLIGHT
+)
+# Attempts run here so the scheduler worker can wait on them with a deadline. Sized for
+# every scheduler slot plus the hedges allowed in flight; the few spare threads cover
+# unhedged attempts abandoned at the deadline, which end at their own (equal) timeout.
+gemini_call_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY + GEMINI_HEDGE_MAX_IN_FLIGHT + 4,
+                                          thread_name_prefix="gemini-call")
+
+
+def timed_generate(prompt_content, timeout):
+    """One generate_content attempt; successful latencies feed the hedging threshold."""
+    start = time.perf_counter()
+    response = clients.gemini_backend_global.generate_content(prompt_content, timeout=timeout)
+    gemini_hedger.record_latency(time.perf_counter() - start)
+    return response
+
+
+def generate_with_deadline(prompt_content, page_num_or_chunk_id, job_id, estimated_prompt_tokens):
+    """
+    Calls Gemini with a deadline, hedging once if the call outlives the recent p95 latency.
+    Returns the first successful response; raises the last error if every attempt failed,
+    or GeminiDeadlineExceeded if none finished in time. The losing attempt is cancelled if
+    it hasn't started, and otherwise abandoned (its own request timeout ends it).
+    """
+    deadline = time.monotonic() + GEMINI_CALL_TIMEOUT_SECONDS
+    gemini_hedger.record_primary(estimated_prompt_tokens)
+    attempts = {gemini_call_executor.submit(timed_generate, prompt_content, GEMINI_CALL_TIMEOUT_SECONDS): "primary"}
+
+    hedge_delay = gemini_hedger.hedge_delay() if GEMINI_HEDGE_ENABLED else None
+    if hedge_delay is not None and hedge_delay < GEMINI_CALL_TIMEOUT_SECONDS:
+        done, _ = wait(attempts, timeout=hedge_delay)
+        if not done:
+            if gemini_scheduler.seconds_since_backoff() < GEMINI_HEDGE_PAUSE_AFTER_BACKOFF_SECONDS:
+                gemini_hedger.count("skipped_backoff")
+            elif not gemini_scheduler.try_acquire_rate(estimated_prompt_tokens):
+                gemini_hedger.count("skipped_rate")
+            elif gemini_hedger.try_spend(estimated_prompt_tokens):
+                remaining = max(0.0, deadline - time.monotonic())
+                attempts[gemini_call_executor.submit(timed_generate, prompt_content, remaining)] = "hedge"
+                gemini_hedger.hold_until_done(list(attempts))
+                metrics.inc("gemini_hedges_total", outcome="issued")
+                logger.info(f"  [LLM Hedge] Page/chunk '{page_num_or_chunk_id}' still running after "
+                            f"{hedge_delay:.1f}s; sent a duplicate request.")
+            else:
+                gemini_scheduler.release_rate(estimated_prompt_tokens)
+
+    pending = set(attempts)
+    last_error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for attempt in done:
+            if attempt.exception() is not None:
+                last_error = attempt.exception()
+                continue
+            for loser in pending:
+                loser.cancel()
+            if len(attempts) > 1:
+                won = attempts[attempt] == "hedge"
+                if won:
+                    gemini_hedger.count("hedge_wins")
+                metrics.inc("gemini_hedges_total", outcome="won" if won else "lost")
+                if job_id:
+                    job_store.increment_stats(job_id, "hedging", hedges=1, hedge_wins=int(won))
+            return attempt.result()
+
+    if last_error is not None and not pending:
+        raise last_error
+    for attempt in pending:
+        attempt.cancel()
+    gemini_hedger.count("deadlines_exceeded")
+    metrics.inc("gemini_deadline_exceeded_total")
+    if job_id:
+        job_store.increment_stats(job_id, "hedging", deadlines_exceeded=1)
+    raise GeminiDeadlineExceeded(
+        f"No response from Gemini for page '{page_num_or_chunk_id}' within {GEMINI_CALL_TIMEOUT_SECONDS:.0f}s.")
@@ -0,0 +1,335 @@
+"""
+SQLite-backed store for analysis jobs, batches and their checkpoints.
+
+Analyses run as background jobs so uploads don't hold a server thread (or the HTTP
+connection) for the whole run. Job state lives in a local SQLite file so any worker
+process on the box can answer /jobs/<job_id>.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from chunk_ordering import page_order_key
+from chunk_planning import PlannedChunk
+from local_state import LOCAL_STATE_DIR, connect_sqlite
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(LOCAL_STATE_DIR, "jobs.sqlite3"))
+
+
+class JobStore:
+    """SQLite-backed record of analysis jobs and their progress."""
+
+    UPDATABLE_COLUMNS = {
+        "status", "pages_total", "pages_submitted", "pages_collected", "errors", "excel_filename",
+        "message", "results_json", "stats_json", "started_at", "finished_at"
+    }
+    COUNTER_COLUMNS = {"pages_submitted", "pages_collected", "errors"}
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                original_filename TEXT NOT NULL,
+                input_blob_name TEXT,
+                options_json TEXT NOT NULL DEFAULT '{}',
+                pages_total INTEGER NOT NULL DEFAULT 0,
+                pages_submitted INTEGER NOT NULL DEFAULT 0,
+                pages_collected INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                excel_filename TEXT,
+                message TEXT,
+                results_json TEXT,
+                stats_json TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                updated_at REAL NOT NULL
+            )""")
+        self._ensure_columns(conn, "jobs", {"stats_json": "TEXT", "batch_id": "TEXT"})
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs(batch_id)")
+        # A batch groups one job per document and owns the combined workbook
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                document_count INTEGER NOT NULL,
+                excel_filename TEXT,
+                message TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                updated_at REAL NOT NULL
+            )""")
+        # One row per page/chunk, written as soon as its LLM result is collected.
+        # seq only ever grows, so stream readers can ask for "everything after N".
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_page_results (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                rows_json TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (job_id, page_id)
+            )""")
+        # The chunk plan behind a job's LLM calls (sanitized text plus segment labels), written
+        # before each chunk is submitted so a resumed job never has to re-extract the document
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_chunks (
+                job_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                segment_labels_json TEXT NOT NULL,
+                pages_json TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                PRIMARY KEY (job_id, chunk_id)
+            )""")
+        conn.commit()
+
+    @staticmethod
+    def _ensure_columns(conn, table, columns):
+        """Adds columns introduced after a database file was first created."""
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_sqlite(self.db_path)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id, original_filename, input_blob_name, options=None, batch_id=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO jobs (job_id, status, original_filename, input_blob_name, options_json, batch_id, message, "
+            "created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, 'Queued for analysis.', ?, ?)",
+            (job_id, original_filename, input_blob_name, json.dumps(options or {}), batch_id, now, now))
+        conn.commit()
+
+    def claim(self, job_id):
+        """Atomically moves a queued job to running. Returns False if another worker got it first."""
+        now = time.time()
+        conn = self._conn()
+        claimed = conn.execute(
+            "UPDATE jobs SET status = 'running', started_at = ?, updated_at = ?, message = 'Analysis in progress.' "
+            "WHERE job_id = ? AND status = 'queued'", (now, now, job_id)).rowcount
+        conn.commit()
+        return claimed == 1
+
+    def update(self, job_id, **fields):
+        unknown = set(fields) - self.UPDATABLE_COLUMNS
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        conn = self._conn()
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+        conn.commit()
+
+    def increment(self, job_id, **deltas):
+        unknown = set(deltas) - self.COUNTER_COLUMNS
+        if unknown:
+            raise ValueError(f"Unknown job counters: {sorted(unknown)}")
+        assignments = ", ".join(f"{column} = {column} + ?" for column in deltas)
+        conn = self._conn()
+        conn.execute(f"UPDATE jobs SET {assignments}, updated_at = ? WHERE job_id = ?",
+                     (*deltas.values(), time.time(), job_id))
+        conn.commit()
+
+    def merge_stats(self, job_id, **stats):
+        """Merges keys into the job's stats document (packing, timings, ...)."""
+        conn = self._conn()
+        with conn: # One transaction so concurrent merges don't drop each other's keys
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT stats_json FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            merged = json.loads((row and row["stats_json"]) or "{}")
+            merged.update(stats)
+            conn.execute("UPDATE jobs SET stats_json = ?, updated_at = ? WHERE job_id = ?",
+                         (json.dumps(merged), time.time(), job_id))
+
+    def increment_stats(self, job_id, section, **deltas):
+        """Adds deltas to the numeric counters under stats[section], e.g. json_salvage."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT stats_json FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            merged = json.loads((row and row["stats_json"]) or "{}")
+            counters = merged.setdefault(section, {})
+            for key, delta in deltas.items():
+                counters[key] = counters.get(key, 0) + delta
+            conn.execute("UPDATE jobs SET stats_json = ?, updated_at = ? WHERE job_id = ?",
+                         (json.dumps(merged), time.time(), job_id))
+
+    def get(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job.pop("options_json") or "{}")
+        job["stats"] = json.loads(job.pop("stats_json") or "{}")
+        return job
+
+    def record_page_result(self, job_id, page_id, rows):
+        """Stores the report rows produced for one page/chunk (replacing any earlier attempt)."""
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO job_page_results (job_id, page_id, rows_json, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, str(page_id), json.dumps(rows), time.time()))
+        conn.commit()
+
+    def page_results_since(self, job_id, after_seq=0):
+        """Returns [(seq, page_id, rows)] recorded for job_id after after_seq, oldest first."""
+        return [(row["seq"], row["page_id"], json.loads(row["rows_json"])) for row in self._conn().execute(
+            "SELECT seq, page_id, rows_json FROM job_page_results WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after_seq))]
+
+    def settled_page_ids(self, job_id):
+        """Page/chunk ids whose stored rows are final, i.e. were collected without an ERROR row."""
+        settled = set()
+        for row in self._conn().execute(
+                "SELECT page_id, rows_json FROM job_page_results WHERE job_id = ?", (job_id,)):
+            if not any(result.get("Product_Name") == "ERROR" for result in json.loads(row["rows_json"])):
+                settled.add(row["page_id"])
+        return settled
+
+    def job_rows(self, job_id):
+        """Every stored report row for the job, in page order (chunks finish in any order)."""
+        stored = self._conn().execute(
+            "SELECT page_id, rows_json FROM job_page_results WHERE job_id = ? ORDER BY seq", (job_id,)).fetchall()
+        rows = []
+        for row in sorted(stored, key=lambda row: page_order_key(row["page_id"])): # Stable: retries keep their order
+            rows.extend(json.loads(row["rows_json"]))
+        return rows
+
+    def record_chunk(self, job_id, position, chunk):
+        """Checkpoints one planned chunk (a PlannedChunk) before it is sent to the LLM."""
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO job_chunks (job_id, chunk_id, position, text, segment_labels_json, pages_json, tokens) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, str(chunk.chunk_id), position, chunk.text, json.dumps(chunk.segment_labels),
+             json.dumps(chunk.pages), chunk.tokens))
+        conn.commit()
+
+    def planned_chunks(self, job_id):
+        """
+        The job's checkpointed chunk plan as PlannedChunks, in submission order. Parts of
+        a split page are planned in order, so a page's final part is in the last chunk
+        that lists it.
+        """
+        rows = self._conn().execute(
+            "SELECT * FROM job_chunks WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()
+        chunks, seen_pages = [], set()
+        for row in reversed(rows):
+            pages = json.loads(row["pages_json"])
+            final_pages = [page for page in pages if page not in seen_pages]
+            seen_pages.update(pages)
+            chunks.append(PlannedChunk(row["chunk_id"], row["text"], json.loads(row["segment_labels_json"]),
+                                       pages, row["tokens"], final_pages))
+        return chunks[::-1]
+
+    def requeue_for_resume(self, job_id):
+        """Atomically puts a finished or failed job back in the queue. False if it is still queued/running."""
+        conn = self._conn()
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'queued', pages_submitted = 0, pages_collected = 0, errors = 0, "
+            "excel_filename = NULL, finished_at = NULL, message = 'Queued to retry missing and failed pages.', "
+            "updated_at = ? WHERE job_id = ? AND status IN ('succeeded', 'failed')", (time.time(), job_id)).rowcount
+        conn.commit()
+        return requeued == 1
+
+    def succeeded_job_ids(self):
+        return [row["job_id"] for row in self._conn().execute(
+            "SELECT job_id FROM jobs WHERE status = 'succeeded' ORDER BY finished_at")]
+
+    def create_batch(self, batch_id, document_count):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO batches (batch_id, status, document_count, message, created_at, updated_at) "
+            "VALUES (?, 'running', ?, 'Documents queued for analysis.', ?, ?)", (batch_id, document_count, now, now))
+        conn.commit()
+
+    def get_batch(self, batch_id):
+        row = self._conn().execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        return dict(row) if row else None
+
+    def batch_jobs(self, batch_id, include_results=False):
+        """The batch's document jobs in upload order (results parsed only when asked for)."""
+        jobs = []
+        for row in self._conn().execute("SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at, rowid", (batch_id,)):
+            job = dict(row)
+            results_json = job.pop("results_json")
+            job["options"] = json.loads(job.pop("options_json") or "{}")
+            job["stats"] = json.loads(job.pop("stats_json") or "{}")
+            if include_results:
+                job["results"] = json.loads(results_json or "[]")
+            jobs.append(job)
+        return jobs
+
+    def claim_batch_finalization(self, batch_id):
+        """Atomically marks a batch whose documents have all finished as finalizing. False if not ready or taken."""
+        now = time.time()
+        conn = self._conn()
+        claimed = conn.execute(
+            "UPDATE batches SET status = 'finalizing', message = 'Building combined workbook.', updated_at = ? "
+            "WHERE batch_id = ? AND status = 'running' AND NOT EXISTS "
+            "(SELECT 1 FROM jobs WHERE batch_id = ? AND status IN ('queued', 'running'))",
+            (now, batch_id, batch_id)).rowcount
+        conn.commit()
+        return claimed == 1
+
+    def update_batch(self, batch_id, **fields):
+        unknown = set(fields) - {"status", "excel_filename", "message", "finished_at"}
+        if unknown:
+            raise ValueError(f"Unknown batch fields: {sorted(unknown)}")
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        conn = self._conn()
+        conn.execute(f"UPDATE batches SET {assignments} WHERE batch_id = ?", (*fields.values(), batch_id))
+        conn.commit()
+
+    def reopen_batch(self, batch_id):
+        """Sends a finished batch back to running so its workbook is rebuilt when a resumed document finishes."""
+        conn = self._conn()
+        conn.execute(
+            "UPDATE batches SET status = 'running', excel_filename = NULL, finished_at = NULL, "
+            "message = 'Documents resumed; combined workbook will be rebuilt.', updated_at = ? "
+            "WHERE batch_id = ? AND status IN ('succeeded', 'failed')", (time.time(), batch_id))
+        conn.commit()
+
+    def unfinished_batches(self):
+        """Batches still waiting on their combined workbook (e.g. interrupted mid-finalization)."""
+        conn = self._conn()
+        conn.execute("UPDATE batches SET status = 'running', updated_at = ? WHERE status = 'finalizing'", (time.time(),))
+        conn.commit()
+        return [row["batch_id"] for row in conn.execute("SELECT batch_id FROM batches WHERE status = 'running'")]
+
+    def requeue_interrupted(self, stale_seconds):
+        """
+        Puts running jobs whose worker has gone quiet back in the queue, and returns the ids
+        of every queued job so they can be handed to this process's worker pool. Their
+        checkpointed chunks and page results are kept, so they pick up where they stopped.
+        """
+        conn = self._conn()
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', pages_submitted = 0, pages_collected = 0, errors = 0, "
+            "message = 'Requeued after interruption; collected pages will be reused.', updated_at = ? "
+            "WHERE status = 'running' AND updated_at < ?", (time.time(), time.time() - stale_seconds))
+        conn.commit()
+        return [row["job_id"] for row in conn.execute(
+            "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at")]
+
+
+job_store = JobStore(JOB_DB_PATH)
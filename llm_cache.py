@@ -0,0 +1,233 @@
+"""
+Content-addressed cache of parsed Gemini results.
+
+Identical pages (re-uploaded filings, shared exhibits) are answered from this cache
+instead of a new Gemini call. Two tiers: an in-process LRU and a persistent SQLite
+file with age/size eviction.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from allegation_prompt import ALLEGATION_PROMPT_TEMPLATE
+from clients import gemini_model_name_global
+from local_state import LOCAL_STATE_DIR, connect_sqlite, env_flag
+from observability import logger
+
+LLM_CACHE_ENABLED = env_flag("LLM_CACHE_ENABLED", True)
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "2048"))
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", os.path.join(LOCAL_STATE_DIR, "llm_cache.sqlite3"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+LLM_CACHE_PRUNE_EVERY = 200 # Run disk eviction once every N writes
+
+# Changing the prompt text changes this fingerprint, so stale results are never
+# served. Set PROMPT_TEMPLATE_VERSION explicitly to pin or force a version.
+PROMPT_TEMPLATE_VERSION = os.getenv("PROMPT_TEMPLATE_VERSION") or \
+    hashlib.sha256(ALLEGATION_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:16]
+
+
+class LLMResultCache:
+    """Two-tier (memory LRU + SQLite) cache of parsed Gemini allegation lists."""
+
+    def __init__(self, db_path, memory_entries, max_bytes, max_age_days, enabled=True):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_prune = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+        self._disk_ready = False
+        if self.enabled:
+            try:
+                conn = self._conn()
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_results (
+                        cache_key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        prompt_version TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        size_bytes INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_accessed REAL NOT NULL
+                    )""")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_results_last_accessed ON llm_results(last_accessed)")
+                conn.commit()
+                self._disk_ready = True
+                logger.info(f"LLM result cache ready at '{self.db_path}' (prompt version {PROMPT_TEMPLATE_VERSION}).")
+            except Exception as e:
+                logger.warning(f"LLM result cache disk tier unavailable, using memory only: {e}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_sqlite(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    @staticmethod
+    def make_key(text_chunk, model_name=None, prompt_version=None):
+        """Content address for a sanitized chunk under a given model and prompt version."""
+        material = json.dumps([
+            model_name or gemini_model_name_global or "",
+            prompt_version or PROMPT_TEMPLATE_VERSION,
+            text_chunk
+        ])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key):
+        """Returns the cached allegation list for cache_key, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if cache_key in self._memory:
+                self._memory.move_to_end(cache_key)
+                self._counters["memory_hits"] += 1
+                return json.loads(self._memory[cache_key])
+
+        if self._disk_ready:
+            try:
+                conn = self._conn()
+                row = conn.execute(
+                    "SELECT payload, created_at FROM llm_results WHERE cache_key = ?", (cache_key,)).fetchone()
+                if row and time.time() - row[1] <= self.max_age_seconds:
+                    conn.execute("UPDATE llm_results SET last_accessed = ? WHERE cache_key = ?",
+                                 (time.time(), cache_key))
+                    conn.commit()
+                    self._remember(cache_key, row[0])
+                    self._count("disk_hits")
+                    return json.loads(row[0])
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"  [Cache Warning] Disk lookup failed: {e}")
+
+        self._count("misses")
+        return None
+
+    def put(self, cache_key, allegations):
+        """Stores a successfully parsed allegation list under cache_key."""
+        if not self.enabled:
+            return
+        payload = json.dumps(allegations)
+        self._remember(cache_key, payload)
+        self._count("writes")
+        if not self._disk_ready:
+            return
+        try:
+            now = time.time()
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_results "
+                "(cache_key, model, prompt_version, payload, size_bytes, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, gemini_model_name_global or "", PROMPT_TEMPLATE_VERSION, payload,
+                 len(payload.encode("utf-8")), now, now))
+            conn.commit()
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"  [Cache Warning] Disk write failed: {e}")
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= LLM_CACHE_PRUNE_EVERY
+            if should_prune:
+                self._writes_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def _remember(self, cache_key, payload):
+        with self._lock:
+            self._memory[cache_key] = payload
+            self._memory.move_to_end(cache_key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def prune(self):
+        """Evicts disk entries past the age limit, then least-recently-used entries over the size limit."""
+        if not self._disk_ready:
+            return 0
+        try:
+            conn = self._conn()
+            evicted = conn.execute("DELETE FROM llm_results WHERE created_at < ?",
+                                   (time.time() - self.max_age_seconds,)).rowcount
+            total_bytes = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM llm_results").fetchone()[0]
+            if total_bytes > self.max_bytes:
+                # Free down to 90% of the limit so pruning isn't triggered on every write.
+                to_free = total_bytes - int(self.max_bytes * 0.9)
+                victims = []
+                for cache_key, size_bytes in conn.execute(
+                        "SELECT cache_key, size_bytes FROM llm_results ORDER BY last_accessed ASC"):
+                    victims.append((cache_key,))
+                    to_free -= size_bytes
+                    if to_free <= 0:
+                        break
+                conn.executemany("DELETE FROM llm_results WHERE cache_key = ?", victims)
+                evicted += len(victims)
+            conn.commit()
+            if evicted:
+                self._count("evictions", evicted)
+                logger.info(f"  [Cache] Evicted {evicted} disk entries.")
+            return evicted
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"  [Cache Warning] Prune failed: {e}")
+            return 0
+
+    def invalidate(self, stale_only=True):
+        """
+        Drops cached results. With stale_only, only entries written under a different
+        prompt version or model are removed; otherwise the whole cache is cleared.
+        """
+        with self._lock:
+            self._memory.clear()
+        if not self._disk_ready:
+            return 0
+        conn = self._conn()
+        if stale_only:
+            removed = conn.execute(
+                "DELETE FROM llm_results WHERE prompt_version != ? OR model != ?",
+                (PROMPT_TEMPLATE_VERSION, gemini_model_name_global or "")).rowcount
+        else:
+            removed = conn.execute("DELETE FROM llm_results").rowcount
+        conn.commit()
+        self._count("evictions", removed)
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats["enabled"] = self.enabled
+        stats["prompt_version"] = PROMPT_TEMPLATE_VERSION
+        if self._disk_ready:
+            try:
+                count, size = self._conn().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_results").fetchone()
+                stats["disk_entries"] = count
+                stats["disk_bytes"] = size
+            except Exception as e:
+                stats["disk_error"] = str(e)
+        return stats
+
+
+llm_result_cache = LLMResultCache(
+    LLM_CACHE_DB_PATH,
+    memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+    max_bytes=LLM_CACHE_MAX_BYTES,
+    max_age_days=LLM_CACHE_MAX_AGE_DAYS,
+    enabled=LLM_CACHE_ENABLED
+)
@@ -0,0 +1,30 @@
+"""
+Local state shared by the app's caches and stores: where it lives on disk, how boolean
+settings are read from the environment, and how SQLite files are opened so threads and
+worker processes on the same box can share them.
+"""
+import os
+import sqlite3
+
+# Single-box persistent state (caches, stores) lives under this directory.
+LOCAL_STATE_DIR = os.getenv("LOCAL_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_state"))
+
+
+def env_flag(name, default):
+    """Reads a boolean environment variable ("1", "true", "yes", "on" are truthy)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def connect_sqlite(db_path):
+    """
+    Opens a SQLite connection suitable for sharing one database file between
+    threads and worker processes (WAL journal, generous busy timeout).
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
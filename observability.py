@@ -0,0 +1,180 @@
+"""
+Logging, Prometheus metrics and per-job stage timings.
+
+Everything the app reports, from client setup to job progress, goes through `logger`
+(LOG_LEVEL sets the threshold). Its QueueHandler only enqueues records, and a single
+listener thread does the console writes, so the Gemini worker threads never contend
+on stdout.
+"""
+import os
+import time
+import threading
+import logging
+import logging.handlers
+import atexit
+import sys
+from queue import SimpleQueue
+from contextlib import contextmanager
+from collections import OrderedDict
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logger = logging.getLogger("legal_complaint_analyzer")
+
+if not logger.handlers:
+    _log_queue = SimpleQueue()
+    _console_handler = logging.StreamHandler(sys.stdout)
+    _console_handler.setFormatter(logging.Formatter("%(message)s"))
+    _log_listener = logging.handlers.QueueListener(_log_queue, _console_handler)
+    logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._definitions = OrderedDict() # name -> (kind, help_text, buckets)
+        self._counters = {} # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> [bucket_counts, sum, count]
+
+    def counter(self, name, help_text):
+        self._definitions[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._definitions[name] = ("histogram", help_text, tuple(buckets))
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = self._definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self, gauges=None):
+        """Returns every metric (plus the given {name: (help_text, value)} gauges) as exposition text."""
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(s[0]), s[1], s[2]) for key, s in self._histograms.items()}
+        for name, (kind, help_text, buckets) in self._definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (series_name, labels), value in sorted(counters.items()):
+                    if series_name == name:
+                        lines.append(f"{name}{self._format_labels(labels)} {value}")
+            else:
+                for (series_name, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+                    if series_name != name:
+                        continue
+                    for bound, bucket_count in zip(buckets, bucket_counts):
+                        lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {bucket_count}")
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {total:.6f}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.histogram("analyzer_stage_seconds", "Wall time of each pipeline stage (one observation per span).")
+metrics.histogram("gemini_attempt_seconds", "Latency of each Gemini generate_content attempt, by outcome.")
+metrics.histogram("gemini_queue_wait_seconds", "Time LLM calls spent queued in the shared scheduler.")
+metrics.counter("gemini_calls_total", "Gemini attempts by outcome.")
+metrics.counter("gemini_retries_total", "Gemini attempts that were retried, by error kind.")
+metrics.counter("gemini_safety_blocks_total", "Responses blocked by Gemini safety filters.")
+metrics.counter("gemini_json_decode_failures_total", "Responses that could not be parsed as JSON.")
+metrics.counter("gemini_salvaged_allegations_total", "Allegations recovered from (or lost in) truncated or malformed responses.")
+metrics.counter("gemini_continuations_total", "Follow-up calls for truncated responses, by whether the tail was recovered.")
+metrics.counter("gemini_hedges_total", "Duplicate (hedged) Gemini requests, by whether the duplicate answered first.")
+metrics.counter("gemini_deadline_exceeded_total", "Gemini calls with no response within GEMINI_CALL_TIMEOUT_SECONDS.")
+metrics.counter("gemini_tokens_total", "Gemini tokens (usage metadata, or estimated) by direction.")
+metrics.counter("llm_cache_lookups_total", "LLM result cache lookups by result.")
+metrics.counter("analysis_jobs_total", "Finished analysis jobs by status.")
+metrics.counter("job_streams_rejected_total", "Result streams refused because JOB_STREAM_MAX_CLIENTS were open.")
+metrics.counter("http_compressed_responses_total", "Responses compressed by the after_request hook, by encoding.")
+metrics.counter("http_compressed_bytes_saved_total", "Bytes saved by response compression, by encoding.")
+
+
+class StageTimings:
+    """
+    Wall time per stage for one job. Stages that run concurrently (LLM calls, queue
+    waits) are summed across calls, so they can add up to more than the job's wall time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seconds = {}
+        self._counts = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def summary(self):
+        with self._lock:
+            return {stage: {"seconds": round(seconds, 3), "count": self._counts[stage]}
+                    for stage, seconds in self._seconds.items()}
+
+
+active_job_timings = {} # job_id -> StageTimings while the job is being processed
+
+
+def record_stage(stage, seconds, job_id=None):
+    """Feeds the stage histogram and, if job_id is being processed, that job's breakdown."""
+    metrics.observe("analyzer_stage_seconds", seconds, stage=stage)
+    timings = active_job_timings.get(job_id) if job_id else None
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage, job_id=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, job_id)
+
+
+def timed_iter(iterable, stage, job_id=None):
+    """Yields from iterable, recording the time spent waiting on each item as a stage span."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            record_stage(stage, time.perf_counter() - start, job_id)
+        yield item
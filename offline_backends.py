@@ -0,0 +1,298 @@
+"""
+In-process stand-ins for external services, for local development, tests and
+benchmarks that must run without network access.
+
+Select them with environment variables read by clients.py:
+    AZURE_STORAGE_BACKEND=memory  -> InMemoryBlobServiceClient
+    GEMINI_BACKEND=fake           -> FakeGeminiBackend (tuned with FAKE_GEMINI_* variables)
+
+(To test against Azurite instead, leave AZURE_STORAGE_BACKEND unset and point
+AZURE_STORAGE_CONNECTION_STRING at it, e.g. "UseDevelopmentStorage=true".)
+"""
+import datetime
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+
+class InMemoryBlobProperties:
+    """The subset of azure.storage.blob.BlobProperties the app reads."""
+
+    def __init__(self, name, container, size, etag, last_modified):
+        self.name = name
+        self.container = container
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class InMemoryStorageStreamDownloader:
+    """Mimics StorageStreamDownloader: readall(), readinto(), chunks() and properties."""
+
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, data, properties):
+        self._data = data
+        self.properties = properties
+        self.size = len(data)
+
+    def readall(self):
+        return self._data
+
+    def readinto(self, stream):
+        stream.write(self._data)
+        return len(self._data)
+
+    def chunks(self):
+        for start in range(0, len(self._data), self.CHUNK_SIZE):
+            yield self._data[start:start + self.CHUNK_SIZE]
+
+
+class InMemoryBlobClient:
+    def __init__(self, service, container_name, blob_name):
+        self._service = service
+        self.container_name = container_name
+        self.blob_name = blob_name
+
+    def _blobs(self):
+        try:
+            return self._service._containers[self.container_name]
+        except KeyError:
+            raise ResourceNotFoundError(f"ContainerNotFound: {self.container_name}")
+
+    def upload_blob(self, data, overwrite=False, length=None, **kwargs):
+        """Accepts bytes, str, a readable stream or an iterable of byte chunks, like the real client."""
+        if isinstance(data, str):
+            payload = data.encode("utf-8")
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            payload = bytes(data)
+        elif hasattr(data, "read"):
+            payload = data.read() if length is None else data.read(length)
+        else:
+            buffer = io.BytesIO()
+            for chunk in data:
+                buffer.write(chunk)
+            payload = buffer.getvalue()
+
+        with self._service._lock:
+            blobs = self._blobs()
+            if self.blob_name in blobs and not overwrite:
+                raise ResourceExistsError(f"BlobAlreadyExists: {self.blob_name}")
+            properties = InMemoryBlobProperties(
+                self.blob_name, self.container_name, len(payload),
+                '"' + hashlib.md5(payload).hexdigest() + '"',
+                datetime.datetime.now(datetime.timezone.utc))
+            blobs[self.blob_name] = (payload, properties)
+        return {"etag": properties.etag, "last_modified": properties.last_modified}
+
+    def _get(self):
+        with self._service._lock:
+            try:
+                return self._blobs()[self.blob_name]
+            except KeyError:
+                raise ResourceNotFoundError(f"BlobNotFound: {self.blob_name}")
+
+    def download_blob(self, offset=None, length=None, **kwargs):
+        payload, properties = self._get()
+        if offset is not None:
+            end = len(payload) if length is None else offset + length
+            payload = payload[offset:end]
+        return InMemoryStorageStreamDownloader(payload, properties)
+
+    def get_blob_properties(self, **kwargs):
+        return self._get()[1]
+
+    def exists(self, **kwargs):
+        with self._service._lock:
+            return self.blob_name in self._service._containers.get(self.container_name, {})
+
+    def delete_blob(self, **kwargs):
+        with self._service._lock:
+            if self._blobs().pop(self.blob_name, None) is None:
+                raise ResourceNotFoundError(f"BlobNotFound: {self.blob_name}")
+
+
+class InMemoryContainerClient:
+    def __init__(self, service, container_name):
+        self._service = service
+        self.container_name = container_name
+
+    def get_blob_client(self, blob):
+        return InMemoryBlobClient(self._service, self.container_name, blob)
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        with self._service._lock:
+            blobs = list(self._service._containers.get(self.container_name, {}).values())
+        return [properties for _, properties in blobs
+                if name_starts_with is None or properties.name.startswith(name_starts_with)]
+
+
+class InMemoryBlobServiceClient:
+    """Drop-in for azure.storage.blob.BlobServiceClient backed by a dict (single process only)."""
+
+    def __init__(self):
+        self._containers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_connection_string(cls, conn_str=None, **kwargs):
+        return cls()
+
+    def create_container(self, name, **kwargs):
+        with self._lock:
+            if name in self._containers:
+                raise ResourceExistsError(f"ContainerAlreadyExists: {name}")
+            self._containers[name] = {}
+        return InMemoryContainerClient(self, name)
+
+    def get_container_client(self, container):
+        return InMemoryContainerClient(self, container)
+
+    def get_blob_client(self, container, blob):
+        return InMemoryBlobClient(self, container, blob)
+
+
+# --- Fake Gemini ---
+
+class ResourceExhausted(Exception):
+    """Stands in for google.api_core.exceptions.ResourceExhausted (HTTP 429)."""
+    code = 429
+
+
+class ServiceUnavailable(Exception):
+    """Stands in for google.api_core.exceptions.ServiceUnavailable (HTTP 503)."""
+    code = 503
+
+
+class DeadlineExceeded(Exception):
+    """Stands in for google.api_core.exceptions.DeadlineExceeded (request timeout)."""
+    code = 504
+
+
+class FakeGeminiResponse:
+    """The subset of GenerateContentResponse the app reads."""
+
+    def __init__(self, text):
+        self.text = text
+        self.prompt_feedback = None
+        self.candidates = []
+
+
+class FakeGeminiBackend:
+    """
+    Offline stand-in for the Gemini backend. Returns {"allegations": [...]} JSON built
+    from the prompt itself: one allegation per known drug name in each numbered paragraph
+    that mentions it, cited to the paragraph's segment. Latency is log-normal around
+    latency_ms; a fraction of calls raise 429s or 503s, return truncated JSON, or stall
+    (take stall_factor times as long, like a hung connection). A timeout shorter than
+    the drawn latency raises DeadlineExceeded after the timeout, as the real SDK does.
+    """
+
+    TEXT_START = "Analyze the following text (one or more segments):"
+    SEGMENT_PATTERN = re.compile(r"^[ \t]*=== SEGMENT (S\d+) ===$", re.MULTILINE) # The template indents the first one
+    PARAGRAPH_PATTERN = re.compile(r"^\s*(\d{1,4})\.\s+(.+?)(?=^\s*\d{1,4}\.\s|\Z)", re.MULTILINE | re.DOTALL)
+    DEFENDANT_PATTERN = re.compile(r"\b(Teva|Mylan|Sandoz|Taro|Perrigo|Actavis|Lannett|Par|Glenmark|Zydus|Aurobindo|Wockhardt)\b")
+    DEFAULT_DRUG_NAMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "generic_drug_names.txt")
+
+    def __init__(self, model_name="fake-gemini", latency_ms=800.0, latency_sigma=0.5, throttle_rate=0.0,
+                 error_rate=0.0, truncate_rate=0.0, stall_rate=0.0, stall_factor=20.0, seed=None,
+                 drug_names_path=DEFAULT_DRUG_NAMES_PATH):
+        self.model_name = model_name
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.stall_rate = stall_rate
+        self.stall_factor = stall_factor
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        names = set()
+        if drug_names_path and os.path.exists(drug_names_path):
+            with open(drug_names_path, encoding="utf-8") as names_file:
+                names = {line.strip().lower() for line in names_file if line.strip() and not line.startswith("#")}
+        self._drug_pattern = re.compile(r"\b(" + "|".join(sorted(map(re.escape, names), key=len, reverse=True)) + r")\b",
+                                        re.IGNORECASE) if names else None
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv("FAKE_GEMINI_SEED")
+        return cls(
+            model_name=os.getenv("FAKE_GEMINI_MODEL", "fake-gemini"),
+            latency_ms=float(os.getenv("FAKE_GEMINI_LATENCY_MS", "800")),
+            latency_sigma=float(os.getenv("FAKE_GEMINI_LATENCY_SIGMA", "0.5")),
+            throttle_rate=float(os.getenv("FAKE_GEMINI_429_RATE", "0")),
+            error_rate=float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0")),
+            truncate_rate=float(os.getenv("FAKE_GEMINI_TRUNCATE_RATE", "0")),
+            stall_rate=float(os.getenv("FAKE_GEMINI_STALL_RATE", "0")),
+            stall_factor=float(os.getenv("FAKE_GEMINI_STALL_FACTOR", "20")),
+            seed=int(seed) if seed else None,
+        )
+
+    def describe(self):
+        return (f"median {self.latency_ms:.0f} ms, sigma {self.latency_sigma}, 429 rate {self.throttle_rate}, "
+                f"error rate {self.error_rate}, truncate rate {self.truncate_rate}, stall rate {self.stall_rate}")
+
+    def _draw(self):
+        with self._random_lock:
+            latency = self.latency_ms / 1000.0 * math.exp(self._random.gauss(0.0, self.latency_sigma))
+            if self._random.random() < self.stall_rate:
+                latency *= self.stall_factor
+            return latency, self._random.random(), self._random.random()
+
+    @staticmethod
+    def _wait(seconds, timeout):
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise DeadlineExceeded("504 Deadline Exceeded")
+        time.sleep(seconds)
+
+    def generate_content(self, prompt, timeout=None, **kwargs):
+        latency, failure_roll, truncate_roll = self._draw()
+        if failure_roll < self.throttle_rate:
+            self._wait(latency * 0.1, timeout) # Quota errors come back fast
+            raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        if failure_roll < self.throttle_rate + self.error_rate:
+            self._wait(latency, timeout)
+            raise ServiceUnavailable("503 The service is currently unavailable.")
+
+        text = json.dumps({"allegations": self._allegations_for(prompt)}, indent=2)
+        self._wait(latency * (1.0 + len(text) / 20000.0), timeout) # Longer answers take longer to generate
+        if truncate_roll < self.truncate_rate:
+            text = text[:max(1, int(len(text) * (0.3 + 0.6 * truncate_roll / max(self.truncate_rate, 1e-9))))]
+        return FakeGeminiResponse(text)
+
+    def _allegations_for(self, prompt):
+        text = prompt.split(self.TEXT_START, 1)[-1]
+        markers = list(self.SEGMENT_PATTERN.finditer(text))
+        segments = [(m.group(1), text[m.end():markers[i + 1].start() if i + 1 < len(markers) else len(text)])
+                    for i, m in enumerate(markers)] or [("S1", text)]
+
+        allegations = []
+        for segment_id, segment_text in segments:
+            for paragraph_match in self.PARAGRAPH_PATTERN.finditer(segment_text):
+                paragraph_number, paragraph = paragraph_match.group(1), " ".join(paragraph_match.group(2).split())
+                drugs = []
+                for drug in (self._drug_pattern.findall(paragraph) if self._drug_pattern else []):
+                    if drug.title() not in drugs:
+                        drugs.append(drug.title())
+                defendants = ", ".join(dict.fromkeys(self.DEFENDANT_PATTERN.findall(paragraph))) or "N/A"
+                for drug in drugs:
+                    allegations.append({
+                        "Product_Name": drug,
+                        "Allegation_Category": "Price Fixing" if "price" in paragraph.lower() else "Market Allocation",
+                        "Specific_Allegation_Summary": paragraph[:400],
+                        "Involved_Defendants_CoConspirators": defendants,
+                        "Other_Named_Entities": "N/A",
+                        "Pin_Cite_Page": segment_id,
+                        "Pin_Cite_Paragraph": paragraph_number
+                    })
+        return allegations
@@ -0,0 +1,78 @@
+"""
+PDF text extraction helpers that can run inside process-pool workers.
+
+Kept separate from app.py so the pool's tasks only need pdfplumber, not the Flask
+app and its Azure/Gemini clients. (Under `python app.py`, spawned workers still
+re-import app.py as __mp_main__; its startup work only runs under __main__.)
+pdfplumber itself is imported on first use, so importing this module (and app.py)
+stays cheap.
+"""
+import itertools
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+def count_pages(pdf_path):
+    """Returns the number of pages in the PDF at pdf_path."""
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(pdf_path, start_page, end_page):
+    """
+    Extracts text for 0-based pages [start_page, end_page).
+    Returns a list of (page_number, text) with 1-based page numbers.
+    """
+    import pdfplumber
+    extracted = []
+    with pdfplumber.open(pdf_path, pages=list(range(start_page + 1, end_page + 1))) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text() or "" # Single extract_text() call per page
+            extracted.append((page.page_number, text))
+            page.close() # Release the page's cached layout objects
+    return extracted
+
+
+def plan_batches(num_pages, batch_pages):
+    """Splits the page range into contiguous batches of at most batch_pages pages."""
+    batch_pages = max(1, batch_pages)
+    return [(start, min(start + batch_pages, num_pages)) for start in range(0, num_pages, batch_pages)]
+
+
+def iter_page_batches(pdf_path, num_pages, pool=None, batch_pages=8, max_pending=None):
+    """
+    Yields lists of (page_number, text), one list per extraction batch. With a process
+    pool, batches are extracted in parallel and each is yielded as soon as it finishes,
+    so the caller can start work on early pages while later ones are still being parsed.
+
+    max_pending bounds how many batches are being extracted or waiting to be consumed at
+    once; the next batch is only started after the caller has taken one. None starts them
+    all up front.
+    """
+    batches = plan_batches(num_pages, batch_pages)
+    if pool is None or len(batches) <= 1:
+        for start_page, end_page in batches:
+            yield extract_page_range(pdf_path, start_page, end_page)
+        return
+
+    remaining = iter(batches)
+    pending = set()
+
+    def top_up():
+        slots = len(batches) if max_pending is None else max(1, max_pending) - len(pending)
+        for start_page, end_page in itertools.islice(remaining, max(0, slots)):
+            pending.add(pool.submit(extract_page_range, pdf_path, start_page, end_page))
+
+    try:
+        top_up()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                yield future.result()
+                top_up() # Runs once the caller asks for more, i.e. after it has handled this batch
+    finally:
+        # Stop queued batches if the consumer bails out early
+        for future in pending:
+            future.cancel()
+
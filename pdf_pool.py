@@ -0,0 +1,40 @@
+"""
+The shared process pool that parses PDF pages.
+
+pdfplumber is CPU-bound and holds the GIL, so pages are parsed in a process pool (see
+pdf_extraction.py). Workers are spawned, not forked, so each starts a fresh interpreter;
+under `python app.py` that interpreter re-imports app.py as __mp_main__, which is
+why client setup and job pickup only happen in start_background_services(), called from
+the __main__ block.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from observability import logger
+
+PDF_EXTRACTION_PROCESSES = int(os.getenv("PDF_EXTRACTION_PROCESSES", str(os.cpu_count() or 1))) # 1 = extract inline
+PDF_EXTRACTION_BATCH_PAGES = int(os.getenv("PDF_EXTRACTION_BATCH_PAGES", "8"))
+
+_pdf_extraction_pool = None
+_pdf_extraction_pool_lock = threading.Lock()
+
+
+def get_pdf_extraction_pool():
+    """Returns the shared extraction process pool, or None to extract in-process."""
+    global _pdf_extraction_pool
+    if PDF_EXTRACTION_PROCESSES <= 1:
+        return None
+    with _pdf_extraction_pool_lock:
+        if _pdf_extraction_pool is None:
+            try:
+                _pdf_extraction_pool = ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACTION_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn") # fork is unsafe with scheduler threads running
+                )
+                logger.info(f"PDF extraction pool started with {PDF_EXTRACTION_PROCESSES} processes.")
+            except Exception as e:
+                logger.warning(f"Could not start PDF extraction pool, extracting in-process: {e}")
+                return None
+        return _pdf_extraction_pool
@@ -0,0 +1,203 @@
+"""
+Local relevance pre-filter that screens out pages Gemini would find nothing on.
+
+The prompt drops anything without a named generic drug, so pages that can't contain one
+(jurisdiction, parties, prayer for relief, exhibit lists) are screened out locally
+before paying for a Gemini round trip. Each page is scored by a drug-name dictionary
+match plus a lexicon classifier (optionally an embedding similarity), vectorized over a
+whole batch of pages at once. A page can name a drug the dictionary and stem patterns
+don't know, so by default the filter only audits: pages it would skip are logged and
+listed in the job stats and the report, but still sent to Gemini. "enforce" actually
+skips them; "off" turns scoring off.
+"""
+import os
+import re
+import threading
+from collections import namedtuple
+
+from observability import logger
+
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "audit").lower()
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "0.25"))
+PREFILTER_DRUG_NAMES_PATH = os.getenv(
+    "PREFILTER_DRUG_NAMES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "generic_drug_names.txt"))
+PREFILTER_EMBEDDING_MODEL = os.getenv("PREFILTER_EMBEDDING_MODEL") # e.g. "all-MiniLM-L6-v2"; unset = lexicon only
+PREFILTER_DICTIONARY_WEIGHT = 0.6
+PREFILTER_CLASSIFIER_WEIGHT = 0.4
+
+# Common generic-drug stems, dosage forms and words that introduce a product, for drugs
+# missing from the dictionary
+DRUG_STEM_PATTERN = re.compile(
+    r"\b[a-z]{3,}(?:olol|pril|sartan|statin|azole|cillin|mycin|cycline|floxacin|oxetine|azepam|triptyline|"
+    r"tidine|dipine|olone|asone|onide|profen|caine|tinib|ciclovir|zosin|terol)\b"
+    r"|\b\d+(?:\.\d+)?\s?(?:mg|mcg)\b|\b(?:tablets?|capsules?|ointment|cream|extended[- ]release)\b"
+    r"|\b(?:generics?|drugs?|formulations?|ANDAs?)\b",
+    re.IGNORECASE)
+
+# Weighted lexicon for the classifier: anticompetitive conduct vs. procedural boilerplate
+PREFILTER_LEXICON = {
+    "conspiracy": 2.0, "conspired": 2.0, "conspire": 2.0, "conspirators": 1.5, "co-conspirators": 1.5,
+    "price fixing": 2.0, "price-fixing": 2.0, "fixed prices": 2.0, "price increase": 1.5, "price increases": 1.5,
+    "raised prices": 1.5, "bid rigging": 2.0, "bid": 0.5, "bids": 0.5, "market allocation": 2.0,
+    "allocate": 1.0, "allocated": 1.0, "fair share": 2.0, "customers": 0.5, "customer": 0.5,
+    "collusion": 2.0, "collusive": 2.0, "agreement": 0.5, "agreed": 0.5, "competitor": 1.0, "competitors": 1.0,
+    "communications": 0.5, "phone calls": 1.0, "spoke": 0.5, "texted": 1.0, "wac": 1.0, "supracompetitive": 1.5,
+    "jurisdiction": -1.5, "venue": -1.5, "prayer for relief": -3.0, "jury trial": -2.0, "demand for jury": -2.0,
+    "respectfully submitted": -3.0, "certificate of service": -3.0, "table of contents": -3.0,
+    "class action allegations": -1.0, "personal jurisdiction": -2.0, "incorporated": -0.5, "headquartered": -0.5,
+}
+PREFILTER_CLASSIFIER_SCALE = 4.0 # Lexicon score at which the classifier component reaches ~63%
+PREFILTER_PROTOTYPES = [
+    "Defendants conspired to fix prices and allocate customers for the generic drug.",
+    "The competitors agreed not to bid on the customer to protect each other's fair share and price increases.",
+]
+
+PrefilterScore = namedtuple("PrefilterScore", ["score", "drug_terms", "relevant"])
+
+_sentence_models = {}
+_sentence_models_lock = threading.Lock()
+
+
+def load_sentence_transformer(model_name):
+    """Loads (once per process) a CPU sentence-transformers model. The import is deferred to first use."""
+    with _sentence_models_lock:
+        if model_name not in _sentence_models:
+            from sentence_transformers import SentenceTransformer
+            _sentence_models[model_name] = SentenceTransformer(model_name, device="cpu")
+        return _sentence_models[model_name]
+
+
+def build_trie_regex(words):
+    """
+    Compiles many literal words into one trie-shaped alternation, so matching is a
+    single linear regex scan per page (Aho-Corasick style multi-pattern matching).
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def to_pattern(node):
+        branches = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return re.compile(r"\b(?:" + to_pattern(trie) + r")\b", re.IGNORECASE)
+
+
+class RelevancePrefilter:
+    """
+    Scores pages for the chance they contain a drug-specific allegation. mode is "audit"
+    (low-scoring pages are only reported) or "enforce" (they are kept from the LLM).
+    """
+
+    def __init__(self, drug_names_path, threshold, embedding_model_name=None, mode="audit"):
+        self.threshold = threshold
+        self.mode = mode
+        self.embedding_model_name = embedding_model_name
+        with open(drug_names_path, encoding="utf-8") as names_file:
+            names = {line.strip().lower() for line in names_file if line.strip() and not line.startswith("#")}
+        self.drug_pattern = build_trie_regex(sorted(names))
+        self._vectorizer = None
+        self._lexicon_weights = None
+        self._embedder = None
+        self._prototype_embeddings = None
+        self._lock = threading.Lock()
+        logger.info(f"Relevance pre-filter ready: {len(names)} drug names, threshold {threshold}, mode {mode}.")
+
+    def _lexicon_model(self):
+        # scikit-learn is only imported once a document actually needs scoring
+        with self._lock:
+            if self._vectorizer is None:
+                import numpy as np
+                from sklearn.feature_extraction.text import CountVectorizer
+                terms = list(PREFILTER_LEXICON)
+                self._vectorizer = CountVectorizer(
+                    vocabulary=terms, ngram_range=(1, 3), lowercase=True, token_pattern=r"(?u)\b[\w-]+\b")
+                self._lexicon_weights = np.array([PREFILTER_LEXICON[term] for term in terms])
+            return self._vectorizer, self._lexicon_weights
+
+    def _embedding_model(self):
+        with self._lock:
+            if self._embedder is None and self.embedding_model_name:
+                try:
+                    self._embedder = load_sentence_transformer(self.embedding_model_name)
+                    self._prototype_embeddings = self._embedder.encode(PREFILTER_PROTOTYPES, normalize_embeddings=True)
+                except Exception as e:
+                    logger.warning(f"Pre-filter embedding model unavailable, using lexicon only: {e}")
+                    self.embedding_model_name = None
+            return self._embedder
+
+    def score(self, texts):
+        """Scores a batch of page texts in one vectorized pass. Returns a PrefilterScore per text."""
+        if not texts:
+            return []
+        import numpy as np
+        drug_terms = [sorted({match.lower() for match in self.drug_pattern.findall(text)}) for text in texts]
+        dictionary_component = np.array([
+            1.0 if terms else (0.5 if DRUG_STEM_PATTERN.search(text) else 0.0)
+            for text, terms in zip(texts, drug_terms)])
+
+        vectorizer, weights = self._lexicon_model()
+        lexicon_scores = vectorizer.transform(texts) @ weights # sparse (pages x terms) . (terms,)
+        classifier_component = 1.0 - np.exp(-np.clip(lexicon_scores, 0, None) / PREFILTER_CLASSIFIER_SCALE)
+
+        embedder = self._embedding_model()
+        if embedder is not None:
+            page_embeddings = embedder.encode(texts, batch_size=32, normalize_embeddings=True)
+            similarity = (page_embeddings @ self._prototype_embeddings.T).max(axis=1)
+            # Cosine similarity of ~0.2 is unrelated text; ~0.6 is on topic
+            classifier_component = np.maximum(classifier_component, np.clip((similarity - 0.2) / 0.4, 0, 1))
+
+        scores = PREFILTER_DICTIONARY_WEIGHT * dictionary_component + PREFILTER_CLASSIFIER_WEIGHT * classifier_component
+        return [PrefilterScore(float(score), terms, bool(score >= self.threshold))
+                for score, terms in zip(scores, drug_terms)]
+
+
+_relevance_prefilter = None
+_relevance_prefilter_lock = threading.Lock()
+
+
+def get_relevance_prefilter():
+    """Returns the shared pre-filter (built on first use), or None if it is off or broken."""
+    global _relevance_prefilter
+    if PREFILTER_MODE == "off":
+        return None
+    with _relevance_prefilter_lock:
+        if _relevance_prefilter is None:
+            try:
+                _relevance_prefilter = RelevancePrefilter(
+                    PREFILTER_DRUG_NAMES_PATH, PREFILTER_THRESHOLD, PREFILTER_EMBEDDING_MODEL, PREFILTER_MODE)
+            except Exception as e:
+                logger.warning(f"Relevance pre-filter disabled: {e}")
+                return None
+        return _relevance_prefilter
+
+
+def prefilter_skip_record(page_id, text, prefilter_score, enforced):
+    """Row for the report's "Skipped Pages" sheet (enforced: the page was kept from the LLM)."""
+    snippet = re.sub(r"\s+", " ", text).strip()[:300]
+    return {
+        "Page/Chunk": page_id,
+        "Pre-filter Action": "Skipped" if enforced else "Analyzed (audit only)",
+        "Relevance Score": round(prefilter_score.score, 3),
+        "Drug Terms Found": ", ".join(prefilter_score.drug_terms) or "None",
+        "Text Snippet": snippet
+    }
+
+
+def format_page_ranges(page_ids):
+    """Compact list of page ids: consecutive page numbers collapse ("3-5, 9, DOCX_Chunk_2")."""
+    numbers = sorted({int(page_id) for page_id in map(str, page_ids) if page_id.isdigit()})
+    ranges = []
+    for number in numbers:
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    others = [str(page_id) for page_id in page_ids if not str(page_id).isdigit()]
+    return ", ".join([str(a) if a == b else f"{a}-{b}" for a, b in ranges] + others)
@@ -0,0 +1,114 @@
+"""
+Local disk cache of generated reports, served to repeat downloads.
+
+Reports are usually downloaded seconds after they are generated. The writer tees each
+report into this bounded on-disk LRU, so those downloads are served locally (with
+Range/ETag support via send_file) without a round trip to blob storage.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+from local_state import LOCAL_STATE_DIR, env_flag
+from observability import logger
+
+REPORT_CACHE_ENABLED = env_flag("REPORT_CACHE_ENABLED", True)
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(LOCAL_STATE_DIR, "report_cache"))
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+CachedReport = namedtuple("CachedReport", ["path", "size", "etag"])
+
+
+class ReportFileCache:
+    """Bounded LRU of generated report files on local disk, keyed by output blob name."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # blob name -> CachedReport, least recently used first
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        # Reload what earlier processes left behind, oldest first
+        meta_paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")]
+        for meta_path in sorted(meta_paths, key=os.path.getmtime):
+            self._adopt_meta(meta_path)
+        self._evict()
+
+    def _paths(self, blob_name):
+        digest = hashlib.sha256(blob_name.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, digest + ".bin"), os.path.join(self.directory, digest + ".json")
+
+    def _adopt_meta(self, meta_path):
+        # Caller holds the lock (or is __init__)
+        try:
+            with open(meta_path, encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            data_path = self._paths(meta["blob_name"])[0]
+            entry = CachedReport(data_path, os.path.getsize(data_path), meta.get("etag"))
+        except (OSError, ValueError, KeyError):
+            return None
+        previous = self._entries.pop(meta["blob_name"], None)
+        self._total_bytes += entry.size - (previous.size if previous else 0)
+        self._entries[meta["blob_name"]] = entry
+        return entry
+
+    def reserve(self):
+        """Returns a fresh temp path in the cache directory for a report being written."""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        os.close(fd)
+        return temp_path
+
+    def discard(self, temp_path):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    def commit(self, blob_name, temp_path, etag):
+        data_path, meta_path = self._paths(blob_name)
+        with self._lock:
+            os.replace(temp_path, data_path)
+            with open(meta_path, "w", encoding="utf-8") as meta_file:
+                json.dump({"blob_name": blob_name, "etag": etag}, meta_file)
+            self._adopt_meta(meta_path)
+            self._evict()
+
+    def get(self, blob_name):
+        """Returns a CachedReport, or None. Also picks up files written by other worker processes."""
+        with self._lock:
+            entry = self._entries.get(blob_name)
+            if entry is None:
+                meta_path = self._paths(blob_name)[1]
+                entry = self._adopt_meta(meta_path) if os.path.exists(meta_path) else None
+                if entry is None:
+                    return None
+            if not os.path.exists(entry.path):
+                # Evicted by another process
+                self._entries.pop(blob_name)
+                self._total_bytes -= entry.size
+                return None
+            self._entries.move_to_end(blob_name)
+            return entry
+
+    def _evict(self):
+        # Caller holds the lock (or is __init__). Always keeps the newest report.
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            blob_name, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size
+            for path in self._paths(blob_name):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+report_cache = None
+if REPORT_CACHE_ENABLED:
+    try:
+        report_cache = ReportFileCache(REPORT_CACHE_DIR, REPORT_CACHE_MAX_BYTES)
+    except Exception as e:
+        logger.warning(f"Report cache disabled: {e}")
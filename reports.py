@@ -0,0 +1,277 @@
+"""
+Report writers (xlsx, csv, parquet) that stream straight to blob storage.
+
+Reports are streamed: rows are sorted by key arrays only (never copying the verbatim
+summaries into intermediate DataFrames), written in bounded-memory batches, and piped
+straight into the blob upload so uploading overlaps with writing.
+"""
+import csv
+import io
+import itertools
+import os
+import re
+import threading
+
+from clients import BLOB_UPLOAD_CONCURRENCY
+from report_cache import report_cache
+
+REPORT_FORMAT_DEFAULT = os.getenv("REPORT_FORMAT", "xlsx").lower()
+REPORT_BATCH_ROWS = int(os.getenv("REPORT_BATCH_ROWS", "2000")) # Rows per Parquet row group / CSV flush
+REPORT_PIPE_BUFFER_BYTES = 1024 * 1024
+
+REPORT_COLUMNS = [
+    ("Product_Name", "Product Name"),
+    ("Allegation_Category", "Allegation Category"),
+    ("Specific_Allegation_Summary", "Specific Allegation"),
+    ("Complaint_Name", "Complaint Name"),
+    ("Involved_Defendants_CoConspirators", "Involved Defendants/Co-Conspirators (as per the allegation)"),
+    ("Other_Named_Entities", "Other Named Entities (Not Defendants/Co-conspirators)"),
+    ("Pin_Cite_Page", "Pin Cite (Page/Chunk)"),
+    ("Pin_Cite_Paragraph", "Pin Cite (Paragraph #)"),
+]
+SKIPPED_PAGES_COLUMNS = ["Page/Chunk", "Pre-filter Action", "Relevance Score", "Drug Terms Found", "Text Snippet"]
+
+REPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def report_sort_order(rows, by_complaint=False):
+    """
+    Row indices ordered by product name, then (with by_complaint) complaint name, then
+    pin-cite page (PDF pages numerically, DOCX chunks after them, anything else last).
+    Keys are computed column-wise.
+    """
+    import numpy as np
+    import pandas as pd
+    if not rows:
+        return np.array([], dtype=int)
+    products = pd.Series([row.get("Product_Name") for row in rows], dtype=object)
+    complaints = pd.Series([row.get("Complaint_Name") for row in rows], dtype=object)
+    cites = pd.Series([row.get("Pin_Cite_Page") for row in rows], dtype=object).astype(str)
+    page_keys = pd.to_numeric(cites.str.extract(r"^\s*(\d+)", expand=False), errors="coerce")
+    chunk_keys = pd.to_numeric(cites.str.extract(r"^DOCX_Chunk_(\d+)", expand=False), errors="coerce") + 1000000
+    page_keys = page_keys.fillna(chunk_keys).fillna(np.inf)
+    keys = pd.DataFrame({"product": products, "complaint": complaints, "page": page_keys})
+    sort_columns = ["product", "complaint", "page"] if by_complaint else ["product", "page"]
+    return keys.sort_values(sort_columns, kind="mergesort", na_position="last").index.to_numpy()
+
+
+def iter_report_rows(rows, order, columns=REPORT_COLUMNS):
+    """Yields each row, in order, as a list of cell strings matching columns."""
+    for index in order:
+        row = rows[index]
+        yield ["" if row.get(key) is None else str(row.get(key)) for key, _ in columns]
+
+
+def skipped_page_report_rows(skipped_pages, complaint_name):
+    """Single-table formats (CSV/Parquet) carry pre-filter skips as marked rows instead of a second sheet."""
+    for record in skipped_pages:
+        action = record.get("Pre-filter Action", "Skipped")
+        yield ["N/A", "Skipped by relevance pre-filter" if action == "Skipped" else "Flagged by relevance pre-filter (analyzed)",
+               f"Score {record['Relevance Score']}; drug terms: {record['Drug Terms Found']}. {record['Text Snippet']}",
+               complaint_name, "N/A", "N/A", str(record["Page/Chunk"]), "N/A"]
+
+
+def write_xlsx_report(stream, rows, order, skipped_pages):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True) # Rows go to per-sheet temp files, not an in-memory cell grid
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append([header for _, header in REPORT_COLUMNS])
+    for cells in iter_report_rows(rows, order):
+        sheet.append(cells)
+    if skipped_pages:
+        # Pages the pre-filter skipped (or, in audit mode, would have), so recall can be audited
+        skipped_sheet = workbook.create_sheet("Skipped Pages")
+        skipped_sheet.append(SKIPPED_PAGES_COLUMNS)
+        for record in skipped_pages:
+            skipped_sheet.append([record.get(column, "Skipped") for column in SKIPPED_PAGES_COLUMNS])
+    workbook.save(stream) # zipfile writes sequentially, so a non-seekable pipe is fine
+
+
+def write_csv_report(stream, rows, order, skipped_pages, complaint_name):
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="") # BOM so Excel detects UTF-8
+    writer = csv.writer(text_stream)
+    writer.writerow([header for _, header in REPORT_COLUMNS])
+    writer.writerows(iter_report_rows(rows, order))
+    writer.writerows(skipped_page_report_rows(skipped_pages, complaint_name))
+    text_stream.flush()
+    text_stream.detach()
+
+
+def write_parquet_report(stream, rows, order, skipped_pages, complaint_name):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(header, pa.string()) for _, header in REPORT_COLUMNS])
+    with pq.ParquetWriter(stream, schema, compression="zstd") as writer:
+        batch = []
+        for cells in itertools.chain(iter_report_rows(rows, order), skipped_page_report_rows(skipped_pages, complaint_name)):
+            batch.append(cells)
+            if len(batch) >= REPORT_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist([dict(zip(schema.names, cells)) for cells in batch], schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist([dict(zip(schema.names, cells)) for cells in batch], schema=schema))
+
+
+# Combined batch workbook: the cross-complaint sheet leads with the complaint name
+BATCH_CROSS_COMPLAINT_COLUMNS = [REPORT_COLUMNS[3]] + REPORT_COLUMNS[:3] + REPORT_COLUMNS[4:]
+BATCH_SUMMARY_COLUMNS = ["Complaint Name", "File", "Status", "Pages", "Allegations", "Errors", "Pre-filter Skipped Pages",
+                         "Message"]
+EXCEL_SHEET_NAME_INVALID = re.compile(r"[\[\]:*?/\\]")
+
+
+def unique_sheet_name(name, used_names):
+    """Excel sheet names: at most 31 characters, no []:*?/\\, unique case-insensitively."""
+    base = EXCEL_SHEET_NAME_INVALID.sub("_", name).strip("' ") or "Complaint"
+    candidate, counter = base[:31], 2
+    while candidate.lower() in used_names:
+        suffix = f" ({counter})"
+        candidate, counter = base[:31 - len(suffix)] + suffix, counter + 1
+    used_names.add(candidate.lower())
+    return candidate
+
+
+def write_batch_xlsx_report(stream, documents, skipped_pages=()):
+    """
+    documents: list of dicts with complaint_name, original_filename, status, pages, errors,
+    message, rows and (optionally) prefilter_skipped_ranges. Writes a summary sheet, a cross-complaint sheet (every allegation,
+    ordered by product then complaint), one sheet per complaint and, if the pre-filter
+    skipped or flagged anything, a "Skipped Pages" sheet across all complaints.
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    used_names = {"batch summary", "all complaints", "skipped pages"}
+
+    summary_sheet = workbook.create_sheet("Batch Summary")
+    summary_sheet.append(BATCH_SUMMARY_COLUMNS)
+    for document in documents:
+        summary_sheet.append([document["complaint_name"], document["original_filename"], document["status"],
+                              document["pages"], len(document["rows"]), document["errors"],
+                              document.get("prefilter_skipped_ranges") or "", document["message"] or ""])
+
+    all_rows = [row for document in documents for row in document["rows"]]
+    cross_sheet = workbook.create_sheet("All Complaints")
+    cross_sheet.append([header for _, header in BATCH_CROSS_COMPLAINT_COLUMNS])
+    for cells in iter_report_rows(all_rows, report_sort_order(all_rows, by_complaint=True), BATCH_CROSS_COMPLAINT_COLUMNS):
+        cross_sheet.append(cells)
+
+    for document in documents:
+        sheet = workbook.create_sheet(unique_sheet_name(document["complaint_name"], used_names))
+        sheet.append([header for _, header in REPORT_COLUMNS])
+        for cells in iter_report_rows(document["rows"], report_sort_order(document["rows"])):
+            sheet.append(cells)
+
+    if skipped_pages:
+        skipped_sheet = workbook.create_sheet("Skipped Pages")
+        skipped_sheet.append(["Complaint Name"] + SKIPPED_PAGES_COLUMNS)
+        for record in skipped_pages:
+            skipped_sheet.append([record["Complaint Name"]] + [record.get(column, "Skipped") for column in SKIPPED_PAGES_COLUMNS])
+    workbook.save(stream)
+
+
+class ReportPipeWriter(io.RawIOBase):
+    """
+    Write end of the report pipe. Tracks its own position, since pipes can't tell() or
+    seek(). Everything written is optionally teed into a local file (the report cache).
+    """
+
+    def __init__(self, fd, tee=None):
+        self._file = os.fdopen(fd, "wb", buffering=REPORT_PIPE_BUFFER_BYTES)
+        self._tee = tee
+        self.bytes_written = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._file.write(data)
+        if self._tee is not None:
+            self._tee.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close() # Flushes first
+        except OSError:
+            pass # Reader already gone (upload failed)
+        finally:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+
+
+def upload_report_streaming(blob_client, report_format, rows, skipped_pages, complaint_name, cache_name=None):
+    """Sorts the rows and streams a single-document report in report_format to the blob (see stream_report_to_blob)."""
+    order = report_sort_order(rows)
+
+    def write_report(stream):
+        if report_format == "csv":
+            write_csv_report(stream, rows, order, skipped_pages, complaint_name)
+        elif report_format == "parquet":
+            write_parquet_report(stream, rows, order, skipped_pages, complaint_name)
+        else:
+            write_xlsx_report(stream, rows, order, skipped_pages)
+
+    return stream_report_to_blob(blob_client, REPORT_FORMATS[report_format], write_report, cache_name)
+
+
+def stream_report_to_blob(blob_client, content_type, write_report, cache_name=None):
+    """
+    Runs write_report(stream) in a background thread, writing into an OS pipe while
+    upload_blob reads the other end, so blocks go out as the file is produced. With
+    cache_name, the same bytes are also written to the local report cache so an
+    immediate download skips blob storage. Returns the bytes uploaded.
+    """
+    from azure.storage.blob import ContentSettings
+    cache_path = report_cache.reserve() if (report_cache and cache_name) else None
+    cache_file = open(cache_path, "wb") if cache_path else None
+    read_fd, write_fd = os.pipe()
+    pipe = ReportPipeWriter(write_fd, tee=cache_file)
+    writer_errors = []
+
+    def produce():
+        try:
+            write_report(pipe)
+        except BaseException as e:
+            writer_errors.append(e)
+        finally:
+            pipe.close() # EOF for the uploader (also on failure, so it never blocks)
+
+    producer = threading.Thread(target=produce, name="report-writer", daemon=True)
+    producer.start()
+    upload_result = None
+    with os.fdopen(read_fd, "rb") as upload_source:
+        try:
+            upload_result = blob_client.upload_blob(
+                upload_source, overwrite=True, max_concurrency=BLOB_UPLOAD_CONCURRENCY,
+                content_settings=ContentSettings(content_type=content_type))
+        finally:
+            upload_source.close() # Unblocks the writer if the upload failed part-way
+            producer.join()
+            if cache_file:
+                cache_file.close()
+                if upload_result is None or writer_errors:
+                    report_cache.discard(cache_path)
+    if writer_errors:
+        # The blob holds a truncated file; remove it rather than serve it
+        try:
+            blob_client.delete_blob()
+        except Exception:
+            pass
+        raise writer_errors[0]
+    if cache_path:
+        report_cache.commit(cache_name, cache_path, (upload_result or {}).get("etag"))
+    return pipe.bytes_written
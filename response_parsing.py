@@ -0,0 +1,136 @@
+"""
+Tolerant parsing of Gemini's JSON answers.
+
+A dense chunk can run past max_output_tokens, and the model occasionally emits slightly
+invalid JSON. Instead of discarding the chunk, each allegation object is decoded on its
+own so every complete one is kept, and the cut-off tail is re-requested on just the
+remaining text. Well-formed responses still take a single json.loads.
+"""
+import json
+import os
+import re
+
+from amendment import cited_paragraph_numbers
+
+GEMINI_CONTINUATION_MAX_DEPTH = int(os.getenv("GEMINI_CONTINUATION_MAX_DEPTH", "2")) # Follow-up rounds per chunk
+ALLEGATIONS_LIST_PATTERN = re.compile(r'"allegations"\s*:\s*\[')
+LIST_SEPARATOR_PATTERN = re.compile(r"[\s,]*")
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([\]}])")
+SEGMENT_MARKER_PATTERN = re.compile(r"^=== SEGMENT (S\d+) ===$", re.MULTILINE)
+
+
+def strip_code_fence(content_str):
+    """Removes a ```json fence around the response, including one left unclosed by truncation."""
+    if content_str.startswith("```"):
+        content_str = content_str.split("\n", 1)[1] if "\n" in content_str else ""
+        content_str = content_str.rstrip()
+        if content_str.endswith("```"):
+            content_str = content_str[:-3]
+    return content_str.strip()
+
+
+def find_object_end(text, start):
+    """Index just past the {...} object that opens at text[start], or None if it never closes."""
+    depth, in_string, escaped = 0, False, False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return None
+
+
+def salvage_allegations(content_str):
+    """
+    Recovers allegation objects from a response that is not valid JSON as a whole.
+    Returns (allegations, list_closed, malformed): allegations is None if there is no
+    "allegations" list at all; list_closed is False when the response was cut off before
+    the closing bracket; malformed counts complete objects that still failed to decode
+    after trailing-comma cleanup (which is only applied to those objects).
+    """
+    key = ALLEGATIONS_LIST_PATTERN.search(content_str)
+    if not key:
+        return None, False, 0
+    decoder = json.JSONDecoder()
+    allegations, malformed, position = [], 0, key.end()
+    while True:
+        position = LIST_SEPARATOR_PATTERN.match(content_str, position).end()
+        if position >= len(content_str) or content_str[position] not in "{]":
+            return allegations, False, malformed # Cut off (or garbled) between objects
+        if content_str[position] == "]":
+            return allegations, True, malformed
+        try:
+            item, position = decoder.raw_decode(content_str, position)
+        except json.JSONDecodeError:
+            end = find_object_end(content_str, position)
+            if end is None:
+                return allegations, False, malformed # Cut off inside this object
+            try:
+                item = json.loads(TRAILING_COMMA_PATTERN.sub(r"\1", content_str[position:end]))
+            except json.JSONDecodeError:
+                malformed += 1
+                position = end
+                continue
+            position = end
+        if isinstance(item, dict):
+            allegations.append(item)
+
+
+def continuation_chunks(text_chunk, recovered):
+    """
+    Follow-up text for a chunk whose response was cut off. The model works through the
+    text in order, so the follow-up restarts at the segment of the last recovered
+    allegation, and within it at that allegation's paragraph. Segment markers keep their
+    original IDs so the follow-up's cites resolve against the same segment labels. When no
+    progress point can be found, the text is split in two halves instead. Returns [] if
+    the text can't be narrowed any further.
+    """
+    markers = list(SEGMENT_MARKER_PATTERN.finditer(text_chunk))
+    segments = [(m.group(1), m.start(), m.end()) for m in markers] or [(None, 0, 0)]
+    segment_ids = [segment_id for segment_id, _, _ in segments]
+
+    cited_segments = [segment_ids.index(str(item.get("Pin_Cite_Page", "")).strip().upper()) for item in recovered
+                      if str(item.get("Pin_Cite_Page", "")).strip().upper() in segment_ids]
+    segment_index = max(cited_segments) if cited_segments else 0
+    _, segment_start, marker_end = segments[segment_index]
+    segment_end = segments[segment_index + 1][1] if segment_index + 1 < len(segments) else len(text_chunk)
+
+    # Within the segment, restart at the last recovered allegation's paragraph ("251.")
+    resume_at = marker_end
+    paragraph_numbers = [number for item in recovered
+                         if segment_ids[0] is None or str(item.get("Pin_Cite_Page", "")).strip().upper() == segment_ids[segment_index]
+                         for number in cited_paragraph_numbers(item.get("Pin_Cite_Paragraph", ""))]
+    if paragraph_numbers:
+        paragraph = re.compile(rf"^[ \t]*{max(paragraph_numbers)}\.[ \t]", re.MULTILINE).search(
+            text_chunk, marker_end, segment_end)
+        if paragraph:
+            resume_at = paragraph.start()
+
+    marker = text_chunk[segment_start:marker_end]
+    if segment_start > 0 or text_chunk[marker_end:resume_at].strip():
+        tail = text_chunk[resume_at:]
+        return [f"{marker}\n{tail.lstrip(chr(10))}" if marker else tail]
+
+    # No progress point: split at the segment boundary (or line) nearest the middle
+    middle = len(text_chunk) // 2
+    if len(segments) > 1:
+        split_at = min((start for _, start, _ in segments[1:]), key=lambda start: abs(start - middle))
+        return [text_chunk[:split_at].rstrip("\n"), text_chunk[split_at:]]
+    split_at = text_chunk.rfind("\n", marker_end + 1, middle + 1)
+    if split_at <= marker_end:
+        split_at = text_chunk.find("\n", middle)
+    if split_at <= marker_end or not text_chunk[split_at:].strip():
+        return []
+    return [text_chunk[:split_at], f"{marker}\n{text_chunk[split_at:].lstrip(chr(10))}" if marker else text_chunk[split_at:]]
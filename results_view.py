@@ -0,0 +1,118 @@
+"""
+Paged, grouped views of a job's results and compression of text responses.
+
+A finished job's results can run to thousands of rows, so the browser first loads a per-
+product summary and then pages of rows for the groups it actually shows. Parsed and
+grouped results are kept for the most recently viewed jobs, so every page request
+doesn't have to re-read results_json.
+"""
+import gzip
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+from observability import metrics
+
+RESULTS_DEFAULT_PAGE_SIZE = 200
+RESULTS_MAX_PAGE_SIZE = 1000
+RESULTS_VIEW_CACHE_JOBS = int(os.getenv("RESULTS_VIEW_CACHE_JOBS", "16"))
+NO_PRODUCT_GROUP = "No Product Mentioned"
+# Responses smaller than this aren't worth compressing
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/css", "text/javascript",
+                          "application/javascript", "text/plain", "text/csv"}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5 # Well above gzip's ratio on JSON while still fast enough per request
+
+try:
+    import brotli
+except ImportError: # Optional; gzip is used when it isn't installed
+    brotli = None
+
+
+def result_group_name(row):
+    """Product group a row is shown under in the UI."""
+    name = row.get("Product_Name")
+    return name.strip() if isinstance(name, str) and name.strip() else NO_PRODUCT_GROUP
+
+
+def result_group_sort_key(name):
+    """Products alphabetically, then "ERROR", with "No Product Mentioned" last."""
+    return (name == NO_PRODUCT_GROUP, name == "ERROR", name.lower())
+
+
+def result_row_sort_key(row):
+    """Pin-cite order within a group: PDF pages numerically, DOCX chunks after them, anything else last."""
+    cite = str(row.get("Pin_Cite_Page", ""))
+    match = re.match(r"\s*(\d+)", cite)
+    if match:
+        return (int(match.group(1)), cite)
+    match = re.match(r"DOCX_Chunk_(\d+)", cite)
+    return (1000000 + int(match.group(1)), cite) if match else (float("inf"), cite)
+
+
+class ResultsViewCache:
+    """Bounded LRU of finished jobs' results, grouped by product and sorted for paging."""
+
+    def __init__(self, max_jobs):
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._views = OrderedDict() # (job_id, finished_at) -> {product: [rows]}, least recently used first
+
+    def get(self, job):
+        key = (job["job_id"], job["finished_at"]) # A resumed job finishes again with new rows
+        with self._lock:
+            groups = self._views.get(key)
+            if groups is not None:
+                self._views.move_to_end(key)
+                return groups
+        groups = {}
+        for row in json.loads(job["results_json"] or "[]"):
+            if row.get("Product_Name") != "No Data":
+                groups.setdefault(result_group_name(row), []).append(row)
+        groups = {name: sorted(groups[name], key=result_row_sort_key)
+                  for name in sorted(groups, key=result_group_sort_key)}
+        with self._lock:
+            self._views[key] = groups
+            while len(self._views) > self.max_jobs:
+                self._views.popitem(last=False)
+        return groups
+
+
+results_view_cache = ResultsViewCache(RESULTS_VIEW_CACHE_JOBS)
+
+
+def compress_response(response):
+    """
+    after_request hook: compresses buffered text responses (JSON, HTML, CSS, JS) with brotli
+    or gzip, whichever the client prefers and is available. Streams (SSE) and file
+    downloads pass through.
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality("br") > 0 and accepted.quality("br") >= accepted.quality("gzip"):
+        encoding, compressed = "br", brotli.compress(body, quality=BROTLI_QUALITY)
+    elif accepted.quality("gzip") > 0:
+        encoding, compressed = "gzip", gzip.compress(body, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    if response.headers.get("ETag"):
+        # The compressed bytes are a different representation from the uncompressed ones
+        response.headers["ETag"] = response.headers["ETag"].rstrip('"') + f'-{encoding}"'
+    metrics.inc("http_compressed_responses_total", encoding=encoding)
+    metrics.inc("http_compressed_bytes_saved_total", len(body) - len(compressed), encoding=encoding)
+    return response
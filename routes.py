@@ -0,0 +1,557 @@
+"""
+HTTP routes: uploads, job status/results/streaming, search, cache and ops endpoints.
+
+Registered on the app in app.py. The handlers only queue and read work; the analysis
+itself runs in the background job pools (analysis_jobs.py).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import Blueprint, Response, current_app, jsonify, render_template, request, send_file
+from werkzeug.http import http_date
+
+import clients
+from allegation_index import ALLEGATION_SEARCH_DEFAULT_PAGE_SIZE, ALLEGATION_SEARCH_MAX_PAGE_SIZE, allegation_index
+from analysis_jobs import analysis_options_from_form, enqueue_analysis_job, queue_document_job
+from clients import CLIENT_INIT_WAIT_SECONDS, OUTPUT_CONTAINER_NAME, client_init_status, clients_ready
+from hedging import gemini_hedger
+from job_store import job_store
+from llm_cache import llm_result_cache
+from observability import active_job_timings, logger, metrics
+from report_cache import report_cache
+from reports import REPORT_FORMATS
+from results_view import RESULTS_DEFAULT_PAGE_SIZE, RESULTS_MAX_PAGE_SIZE, results_view_cache
+from scheduling import gemini_scheduler
+from spooling import BATCH_MAX_DOCUMENTS, release_spooled_input, spool_batch_upload, spool_to_local_file
+
+routes = Blueprint("routes", __name__)
+
+
+@routes.route('/', methods=['GET'])
+def index():
+    """Renders the initial upload form page."""
+    return render_template('upload.html', results=[])
+
+@routes.route('/analyze', methods=['POST'])
+def analyze_document():
+    """
+    Handles the file upload via AJAX. The document is spooled once to local disk and an
+    analysis job is queued; the response returns the job id immediately so the client
+    can poll /jobs/<job_id> instead of holding the connection open. The archival copy
+    is uploaded to blob storage in the background while the job parses the local file.
+    """
+    if not clients_ready.wait(CLIENT_INIT_WAIT_SECONDS):
+        return jsonify({"status": "error", "message": "Service is still starting up. Please retry shortly."}), 503
+    if not clients.blob_service_client:
+        return jsonify({"status": "error", "message": "Azure Blob Storage not initialized. Check connection string."}), 500
+
+    try:
+        if 'file' not in request.files:
+            return jsonify({"status": "error", "message": "No file part selected."}), 400
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"status": "error", "message": "No file selected."}), 400
+
+        original_filename = file.filename
+        if not original_filename.lower().endswith(('.pdf', '.docx')):
+            return jsonify({"status": "error", "message": "Unsupported file type. Please upload a PDF or DOCX file."}), 400
+
+        try:
+            options = analysis_options_from_form(request.form)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        # Amendment mode: re-analyze only what changed since an earlier job on the prior version
+        baseline_job_id = request.form.get("baseline_job_id", "").strip()
+        if baseline_job_id:
+            baseline_job = job_store.get(baseline_job_id)
+            if not baseline_job or baseline_job["status"] != "succeeded":
+                return jsonify({"status": "error",
+                                "message": "Baseline job not found or not finished successfully."}), 400
+            options["baseline_job_id"] = baseline_job_id
+
+        unique_id = str(uuid.uuid4()) # Generate a unique ID for this request; doubles as the job id
+
+        # Spool the upload to local disk once; parsing starts from this copy and never
+        # waits on blob storage
+        suffix = os.path.splitext(original_filename)[1].lower()
+        spool_start = time.perf_counter()
+        input_path = spool_to_local_file(file.stream, suffix=suffix)
+        spool_seconds = time.perf_counter() - spool_start
+        logger.info(f"Spooled '{original_filename}' to '{input_path}'")
+
+        queue_document_job(unique_id, original_filename, input_path, options, spool_seconds)
+        enqueue_analysis_job(unique_id)
+        logger.info(f"Queued analysis job '{unique_id}' for '{original_filename}'.")
+
+        return jsonify({"status": "queued", "job_id": unique_id, "status_url": f"/jobs/{unique_id}"}), 202
+
+    except Exception as e:
+        logger.error(f"--- ERROR in analyze_document (upload/enqueue): {e} ---", exc_info=True)
+        return jsonify({"status": "error", "message": f"Processing error: {str(e)}"}), 500
+
+
+@routes.route('/analyze_batch', methods=['POST'])
+def analyze_batch():
+    """
+    Accepts several PDF/DOCX files and/or ZIP archives of them (form field "files") and
+    queues one job per document under a batch. All documents share the Gemini scheduler,
+    so their pages are interleaved. Poll /batches/<batch_id> for per-document progress;
+    the combined workbook is built once every document has finished.
+    """
+    if not clients_ready.wait(CLIENT_INIT_WAIT_SECONDS):
+        return jsonify({"status": "error", "message": "Service is still starting up. Please retry shortly."}), 503
+    if not clients.blob_service_client:
+        return jsonify({"status": "error", "message": "Azure Blob Storage not initialized. Check connection string."}), 500
+
+    spooled = []
+    try:
+        uploads = [f for f in request.files.getlist("files") + request.files.getlist("file") if f.filename]
+        if not uploads:
+            return jsonify({"status": "error", "message": "No files selected."}), 400
+        try:
+            options = analysis_options_from_form(request.form)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        if request.form.get("report_format", "xlsx").lower() != "xlsx":
+            # The combined batch report is a multi-sheet workbook
+            return jsonify({"status": "error", "message": "Batch reports are only available as xlsx."}), 400
+        options["report_format"] = "xlsx"
+        direct_documents = sum(os.path.splitext(upload.filename)[1].lower() in (".pdf", ".docx") for upload in uploads)
+        if direct_documents > BATCH_MAX_DOCUMENTS:
+            return jsonify({"status": "error",
+                            "message": f"A batch can contain at most {BATCH_MAX_DOCUMENTS} documents."}), 400
+
+        for upload in uploads:
+            spooled.extend(spool_batch_upload(upload, BATCH_MAX_DOCUMENTS - len(spooled)))
+        if not spooled:
+            return jsonify({"status": "error", "message": "No PDF or DOCX documents found in the upload."}), 400
+
+        batch_id = str(uuid.uuid4())
+        job_store.create_batch(batch_id, len(spooled))
+        documents = []
+        used_names = set()
+        for original_filename, input_path, spool_seconds in spooled:
+            # Complaint names key the combined workbook, so keep them unique within the batch
+            stem, extension = os.path.splitext(original_filename)
+            unique_stem, counter = stem, 2
+            while unique_stem.lower() in used_names:
+                unique_stem, counter = f"{stem} ({counter})", counter + 1
+            used_names.add(unique_stem.lower())
+            job_id = str(uuid.uuid4())
+            queue_document_job(job_id, unique_stem + extension, input_path, options, spool_seconds, batch_id=batch_id)
+            documents.append({"job_id": job_id, "original_filename": unique_stem + extension})
+        spooled = [] # Owned by the jobs from here on
+
+        for document in documents:
+            enqueue_analysis_job(document["job_id"], batch_id=batch_id)
+        logger.info(f"Queued batch '{batch_id}' with {len(documents)} documents.")
+        return jsonify({"status": "queued", "batch_id": batch_id, "status_url": f"/batches/{batch_id}",
+                        "documents": documents}), 202
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"--- ERROR in analyze_batch (upload/enqueue): {e} ---", exc_info=True)
+        return jsonify({"status": "error", "message": f"Processing error: {str(e)}"}), 500
+    finally:
+        for _, path, _ in spooled:
+            release_spooled_input(path)
+
+
+JOB_STREAM_POLL_SECONDS = 0.5
+JOB_STREAM_HEARTBEAT_SECONDS = 15 # Comment lines keep idle proxies from closing the stream
+# Each open stream holds a server thread (waitress/gthread have 10). Past the cap, new
+# streams get a 503 and the page falls back to polling; each stream also ends after
+# JOB_STREAM_MAX_SECONDS, and EventSource reconnects where it left off (Last-Event-ID).
+JOB_STREAM_MAX_CLIENTS = int(os.getenv("JOB_STREAM_MAX_CLIENTS", "4"))
+JOB_STREAM_MAX_SECONDS = float(os.getenv("JOB_STREAM_MAX_SECONDS", "60"))
+JOB_STREAM_RETRY_MS = 1000 # Reconnect delay the browser uses after a stream ends
+job_stream_slots = threading.BoundedSemaphore(max(1, JOB_STREAM_MAX_CLIENTS))
+
+def format_sse(event, data, event_id=None):
+    """Formats one Server-Sent Events message."""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@routes.route('/jobs/<job_id>/stream', methods=['GET'])
+def job_stream(job_id):
+    """
+    Streams a job's results as Server-Sent Events: a "page" event with each page's
+    allegations as soon as it is collected, "progress" events as counts change and a
+    final "complete" event carrying the report name (or the failure message).
+    Reconnecting clients resume from the Last-Event-ID header. Streams are capped in
+    number (503 past JOB_STREAM_MAX_CLIENTS) and in lifetime (JOB_STREAM_MAX_SECONDS).
+    """
+    if not job_store.get(job_id):
+        return jsonify({"status": "error", "message": "Job not found."}), 404
+    if not job_stream_slots.acquire(blocking=False):
+        metrics.inc("job_streams_rejected_total")
+        return jsonify({"status": "error", "message": "Too many open result streams; poll /jobs/<id> instead."}), 503
+
+    try:
+        last_seq = int(request.headers.get("Last-Event-ID", "0"))
+    except ValueError:
+        last_seq = 0
+
+    def generate():
+        seq = last_seq
+        last_progress = None
+        last_sent = time.time()
+        stream_ends_at = time.monotonic() + JOB_STREAM_MAX_SECONDS
+        yield f"retry: {JOB_STREAM_RETRY_MS}\n\n"
+        while True:
+            job = job_store.get(job_id)
+            for seq, page_id, rows in job_store.page_results_since(job_id, seq):
+                yield format_sse("page", {"page_id": page_id, "results": rows}, event_id=seq)
+                last_sent = time.time()
+
+            progress = {
+                "pages_total": job["pages_total"],
+                "pages_submitted": job["pages_submitted"],
+                "pages_collected": job["pages_collected"],
+                "errors": job["errors"]
+            }
+            if progress != last_progress:
+                yield format_sse("progress", progress)
+                last_progress = progress
+                last_sent = time.time()
+
+            if job["status"] in ("succeeded", "failed"):
+                # Rows recorded between the read above and the status change are flushed first
+                for seq, page_id, rows in job_store.page_results_since(job_id, seq):
+                    yield format_sse("page", {"page_id": page_id, "results": rows}, event_id=seq)
+                yield format_sse("complete", {
+                    "job_status": job["status"],
+                    "message": job["message"],
+                    "excel_filename": job["excel_filename"]
+                })
+                return
+
+            if time.monotonic() >= stream_ends_at:
+                return # Frees the thread; the browser reconnects and resumes after seq
+
+            if time.time() - last_sent >= JOB_STREAM_HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.time()
+            time.sleep(JOB_STREAM_POLL_SECONDS)
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.call_on_close(job_stream_slots.release) # Runs on normal end and on client disconnect
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no" # Disable proxy buffering so events arrive immediately
+    return response
+
+
+@routes.route('/batches/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Reports per-document progress for a batch, and the combined workbook once it is ready."""
+    batch = job_store.get_batch(batch_id)
+    if not batch:
+        return jsonify({"status": "error", "message": "Batch not found."}), 404
+
+    documents = []
+    totals = {"pages_total": 0, "pages_collected": 0, "errors": 0}
+    status_counts = {}
+    for job in job_store.batch_jobs(batch_id):
+        documents.append({
+            "job_id": job["job_id"],
+            "original_filename": job["original_filename"],
+            "job_status": job["status"],
+            "progress": {key: job[key] for key in ("pages_total", "pages_submitted", "pages_collected", "errors")},
+            "message": job["message"],
+            "status_url": f"/jobs/{job['job_id']}"
+        })
+        for key in totals:
+            totals[key] += job[key]
+        status_counts[job["status"]] = status_counts.get(job["status"], 0) + 1
+
+    return jsonify({
+        "status": "success",
+        "batch_id": batch_id,
+        "batch_status": batch["status"],
+        "message": batch["message"],
+        "document_count": batch["document_count"],
+        "documents_by_status": status_counts,
+        "progress": totals,
+        "documents": documents,
+        "excel_filename": batch["excel_filename"],
+        "created_at": batch["created_at"],
+        "finished_at": batch["finished_at"]
+    }), 200
+
+@routes.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Reports progress for an analysis job, and its results once it has finished."""
+    job = job_store.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job not found."}), 404
+
+    payload = {
+        "status": "success",
+        "job_id": job_id,
+        "job_status": job["status"],
+        "original_filename": job["original_filename"],
+        "progress": {
+            "pages_total": job["pages_total"],
+            "pages_submitted": job["pages_submitted"],
+            "pages_collected": job["pages_collected"],
+            "errors": job["errors"]
+        },
+        "message": job["message"],
+        "stats": job["stats"],
+        "excel_filename": job["excel_filename"],
+        "batch_id": job["batch_id"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+    # include_results=0 skips the (possibly large) row list; /jobs/<id>/results pages it instead
+    if job["status"] == "succeeded" and request.args.get("include_results", "1") != "0":
+        payload["results"] = json.loads(job["results_json"] or "[]")
+    return jsonify(payload), 200
+
+@routes.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """
+    Pages through a finished job's results. Without product: one entry per product group
+    (name, row count, rows per category), in display order. With product: one page of
+    that group's rows in pin-cite order (page, page_size).
+    """
+    job = job_store.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job not found."}), 404
+    if job["status"] != "succeeded":
+        return jsonify({"status": "error", "message": f"Job is {job['status']}; results are available once it succeeds."}), 409
+
+    groups = results_view_cache.get(job)
+    product = request.args.get("product")
+    if product is None:
+        return jsonify({
+            "status": "success",
+            "job_id": job_id,
+            "total": sum(len(rows) for rows in groups.values()),
+            "groups": [{
+                "product_name": name,
+                "count": len(rows),
+                "categories": dict(Counter(str(row.get("Allegation_Category") or "N/A") for row in rows))
+            } for name, rows in groups.items()]
+        }), 200
+
+    if product not in groups:
+        return jsonify({"status": "error", "message": f"No results for product '{product}'."}), 404
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+        page_size = min(RESULTS_MAX_PAGE_SIZE, max(1, int(request.args.get("page_size", RESULTS_DEFAULT_PAGE_SIZE))))
+    except ValueError:
+        return jsonify({"status": "error", "message": "page and page_size must be integers."}), 400
+    rows = groups[product]
+    return jsonify({
+        "status": "success",
+        "job_id": job_id,
+        "product_name": product,
+        "total": len(rows),
+        "page": page,
+        "page_size": page_size,
+        "pages": (len(rows) + page_size - 1) // page_size,
+        "results": rows[(page - 1) * page_size:page * page_size]
+    }), 200
+
+@routes.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """
+    Requeues a finished or failed job so that only its missing and errored pages are sent
+    to the LLM again. Pages already collected are reused from the job's checkpoint and the
+    report is regenerated from the stored rows.
+    """
+    job = job_store.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job not found."}), 404
+    if not job_store.requeue_for_resume(job_id):
+        return jsonify({"status": "error", "message": f"Job is still {job['status']}; nothing to resume yet."}), 409
+
+    settled_page_ids = job_store.settled_page_ids(job_id)
+    pending_chunks = sum(1 for chunk in job_store.planned_chunks(job_id) if chunk.chunk_id not in settled_page_ids)
+    if job["batch_id"]:
+        job_store.reopen_batch(job["batch_id"])
+    enqueue_analysis_job(job_id, batch_id=job["batch_id"])
+    logger.info(f"Resuming job '{job_id}': {pending_chunks} planned chunks to retry"
+                + ("" if job["stats"].get("plan_complete") else " (plan incomplete; the document will be re-read)") + ".")
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}",
+                    "chunks_to_retry": pending_chunks, "plan_complete": bool(job["stats"].get("plan_complete"))}), 202
+
+@routes.route('/allegations/search', methods=['GET'])
+def search_allegations():
+    """
+    Queries allegations across every indexed complaint. Filters: product and defendant
+    (prefix, case-insensitive), category, complaint, job_id; q is full-text over the
+    allegation summary (words AND-ed, "quoted phrases", trailing * for prefixes).
+    Paged with page / page_size.
+    """
+    if not allegation_index:
+        return jsonify({"status": "error", "message": "Allegation index is disabled."}), 503
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+        page_size = min(ALLEGATION_SEARCH_MAX_PAGE_SIZE,
+                        max(1, int(request.args.get("page_size", ALLEGATION_SEARCH_DEFAULT_PAGE_SIZE))))
+    except ValueError:
+        return jsonify({"status": "error", "message": "page and page_size must be integers."}), 400
+
+    start = time.perf_counter()
+    try:
+        total, results = allegation_index.search(
+            q=request.args.get("q", "").strip() or None,
+            product=request.args.get("product"),
+            defendant=request.args.get("defendant"),
+            category=request.args.get("category"),
+            complaint=request.args.get("complaint"),
+            job_id=request.args.get("job_id"),
+            page=page,
+            page_size=page_size)
+    except sqlite3.OperationalError as e:
+        return jsonify({"status": "error", "message": f"Invalid search: {e}"}), 400
+    return jsonify({
+        "status": "success",
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "pages": (total + page_size - 1) // page_size,
+        "query_ms": round((time.perf_counter() - start) * 1000, 2),
+        "results": results
+    }), 200
+
+@routes.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Reports hit/miss counters and size of the Gemini result cache."""
+    return jsonify({"status": "success", "cache": llm_result_cache.stats()}), 200
+
+@routes.route('/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    """
+    Invalidates the Gemini result cache. scope=stale (default) drops entries from other
+    prompt versions/models; scope=all clears everything.
+    """
+    scope = (request.values.get("scope") or (request.get_json(silent=True) or {}).get("scope") or "stale").lower()
+    if scope not in ("stale", "all"):
+        return jsonify({"status": "error", "message": "scope must be 'stale' or 'all'."}), 400
+    try:
+        removed = llm_result_cache.invalidate(stale_only=(scope == "stale"))
+        logger.info(f"LLM result cache invalidated (scope={scope}): {removed} disk entries removed.")
+        return jsonify({"status": "success", "removed": removed, "scope": scope}), 200
+    except Exception as e:
+        logger.error(f"Error invalidating LLM result cache: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": f"Cache invalidation error: {str(e)}"}), 500
+
+@routes.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage/LLM latency histograms, LLM counters and scheduler gauges."""
+    scheduler = gemini_scheduler.snapshot()
+    gauges = {
+        "gemini_scheduler_in_flight": ("LLM calls currently running.", scheduler["in_flight"]),
+        "gemini_scheduler_queue_depth": ("LLM calls waiting in the scheduler.", scheduler["queue_depth"]),
+        "gemini_scheduler_concurrency_limit": ("Current adaptive concurrency limit.", scheduler["concurrency_limit"]),
+        "analysis_jobs_running": ("Jobs being processed by this process.", len(active_job_timings)),
+    }
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+@routes.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    """Reports the shared Gemini scheduler's queue depth, in-flight calls and limits, and hedging counters."""
+    return jsonify({"status": "success", "scheduler": gemini_scheduler.snapshot(),
+                    "hedging": gemini_hedger.snapshot()}), 200
+
+@routes.route('/download_report/<filename>')
+def download_report(filename):
+    """
+    Serves the generated report (.xlsx, .csv or .parquet). Recently generated reports come
+    from the local report cache; otherwise blob chunks are streamed straight to the client.
+    Both paths honour Range, If-Range and If-None-Match.
+    """
+    from azure.core import MatchConditions
+    from azure.core.exceptions import ResourceNotFoundError
+    if not clients_ready.wait(CLIENT_INIT_WAIT_SECONDS):
+        return "Service is still starting up. Please retry shortly.", 503
+    if not clients.blob_service_client:
+        return "Azure Blob Storage not initialized.", 500
+
+    # Determine content type (MIME type) from the report's extension
+    mime_type = REPORT_FORMATS.get(os.path.splitext(filename)[1].lstrip(".").lower(), "application/octet-stream")
+
+    # Extract original filename for download prompt (if it was uniquely named)
+    original_download_name = filename
+    if '_' in filename: # Assuming format unique_id_originalfilename.xlsx
+        try:
+            parts = filename.split('_', 1)
+            if len(parts) > 1:
+                original_download_name = parts[1] 
+        except Exception as e:
+            logger.warning(f"Could not parse original filename from unique blob name {filename}: {e}")
+
+    try:
+        cached = report_cache.get(filename) if report_cache else None
+        if cached:
+            return send_file(cached.path, mimetype=mime_type, as_attachment=True, download_name=original_download_name,
+                             conditional=True, etag=cached.etag.strip('"') if cached.etag else True, max_age=0)
+
+        output_blob_client = clients.blob_service_client.get_container_client(OUTPUT_CONTAINER_NAME).get_blob_client(filename)
+        if request.range or request.if_none_match:
+            # Conditional and partial requests need the size/ETag before choosing what to send
+            properties = output_blob_client.get_blob_properties()
+            etag, total_size, last_modified = properties.etag, properties.size, properties.last_modified
+            if request.if_none_match.contains_weak(etag.strip('"')):
+                return Response(status=304, headers={"ETag": etag})
+            byte_range = None
+            if request.range and (not request.if_range.etag or request.if_range.etag == etag.strip('"')):
+                byte_range = request.range.range_for_length(total_size)
+                if byte_range is None and len(request.range.ranges) == 1:
+                    return Response(status=416, headers={"Content-Range": f"bytes */{total_size}"})
+                # Multi-range requests get the whole file
+            offset, length = (byte_range[0], byte_range[1] - byte_range[0]) if byte_range else (None, None)
+            # Pin the download to the ETag we just checked, in case the blob is replaced in between
+            downloader = output_blob_client.download_blob(offset=offset, length=length, etag=etag,
+                                                          match_condition=MatchConditions.IfNotModified)
+        else:
+            # Plain download: one round trip, properties come back with the first chunk
+            byte_range = None
+            downloader = output_blob_client.download_blob()
+            etag, total_size, last_modified = downloader.properties.etag, downloader.size, downloader.properties.last_modified
+
+        headers = {
+            "Content-Disposition": f"attachment; filename={original_download_name}",
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+            "Last-Modified": http_date(last_modified),
+            "Content-Length": str(byte_range[1] - byte_range[0] if byte_range else total_size),
+            "Cache-Control": "no-cache",
+        }
+        if byte_range:
+            headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1] - 1}/{total_size}"
+        return Response(downloader.chunks(), status=206 if byte_range else 200, mimetype=mime_type,
+                        headers=headers, direct_passthrough=True)
+    except ResourceNotFoundError:
+        logger.warning(f"Blob not found: {filename} in '{OUTPUT_CONTAINER_NAME}' container.")
+        return "File not found.", 404
+    except Exception as e:
+        logger.error(f"Error serving file '{filename}' from blob storage: {e}", exc_info=True)
+        return "Error serving file.", 500
+
+
+@routes.route('/ready', methods=['GET'])
+def readiness():
+    """
+    Readiness probe: 200 once background client setup has finished with blob storage
+    and Gemini both usable, 503 (with per-client state) until then or if either failed.
+    """
+    ready = clients_ready.is_set() and all(status["state"] == "ready" for status in client_init_status.values())
+    return jsonify({
+        "status": "ready" if ready else ("starting" if not clients_ready.is_set() else "unavailable"),
+        "clients": client_init_status,
+        "uptime_seconds": round(time.time() - current_app.config["PROCESS_START_TIME"], 3)
+    }), 200 if ready else 503
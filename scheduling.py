@@ -0,0 +1,351 @@
+"""
+The process-wide Gemini scheduler and its rate limits.
+
+One scheduler per process instead of a 50-thread executor per request. It enforces
+request/token-per-minute budgets, adapts concurrency AIMD-style (halve on 429/5xx, grow
+slowly on success) and interleaves pages round-robin across documents so a huge filing
+can't starve a small one.
+"""
+import os
+import itertools
+import time
+import threading
+import random
+import heapq
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import CancelledError, Future
+
+from observability import logger, metrics, record_stage
+
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "50"))
+GEMINI_MIN_CONCURRENCY = int(os.getenv("GEMINI_MIN_CONCURRENCY", "2"))
+GEMINI_INITIAL_CONCURRENCY = int(os.getenv("GEMINI_INITIAL_CONCURRENCY", "16"))
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "1000")) # 0 disables the limit
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "2000000")) # 0 disables the limit
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_BACKOFF_BASE_SECONDS = 1.0
+GEMINI_BACKOFF_MAX_SECONDS = 30.0
+CHARS_PER_TOKEN = 4 # Rough English-text estimate used for budgeting
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for rate budgeting (no tokenizer round trip)."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """Blocks until `amount` tokens are available, then takes them. Returns seconds waited."""
+        if self.rate_per_second <= 0:
+            return 0.0
+        amount = min(float(amount), self.capacity) # Oversized requests wait for a full bucket, never forever
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                shortfall = amount - self._tokens
+            delay = shortfall / self.rate_per_second
+            time.sleep(delay)
+            waited += delay
+
+    def try_acquire(self, amount=1):
+        """Takes `amount` tokens if they're available right now; never waits."""
+        if self.rate_per_second <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return True
+            return False
+
+    def release(self, amount=1):
+        """Returns tokens taken by a request that wasn't sent after all."""
+        if self.rate_per_second <= 0:
+            return
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+def classify_gemini_error(error):
+    """
+    Returns "throttled" for quota/429 errors, "server" for 5xx, timeouts and connection
+    errors (both worth retrying), otherwise "other" (bad request, auth, invalid argument,
+    unreadable response), which a retry won't fix.
+    """
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code) # google.api_core uses ints; grpc uses StatusCode enums
+    name = type(error).__name__
+    message = str(error)
+    if code == 429 or name in ("ResourceExhausted", "TooManyRequests") or "429" in message or "quota" in message.lower():
+        return "throttled"
+    if isinstance(error, OSError) or (isinstance(code, int) and 500 <= code < 600) or name in (
+            "InternalServerError", "ServiceUnavailable", "DeadlineExceeded", "GatewayTimeout", "ServerError"):
+        return "server"
+    return "other"
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter so throttled calls don't all retry in lockstep."""
+    return random.uniform(0, min(GEMINI_BACKOFF_MAX_SECONDS, GEMINI_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+class RequeueTask(Exception):
+    """
+    Raised by a scheduled task to be run again after `delay` seconds instead of waiting
+    in its worker slot; `kwargs` are merged into the task's keyword arguments (e.g. the
+    next attempt number). The task's future stays pending until a later run finishes.
+    """
+
+    def __init__(self, delay, **kwargs):
+        super().__init__(f"requeue after {delay:.2f}s")
+        self.delay = delay
+        self.kwargs = kwargs
+
+
+class GeminiScheduler:
+    """Process-wide fair, rate-limited, adaptively concurrent executor for Gemini calls."""
+
+    ADDITIVE_INCREASE = 1.0 # Roughly +1 slot per window of successful calls
+    MULTIPLICATIVE_DECREASE = 0.5
+    DECREASE_COOLDOWN_SECONDS = 2.0 # A burst of 429s from one window only halves the limit once
+
+    def __init__(self, max_concurrency, min_concurrency, initial_concurrency, requests_per_minute, tokens_per_minute):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self._limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._queues = {} # doc_key -> heap of (-cost, seq, future, fn, args, kwargs, queued_at)
+        self._sequence = itertools.count() # FIFO among tasks of equal cost
+        self._delayed = [] # heap of (not_before, seq, doc_key, queue entry) for tasks backing off
+        self._round_robin = deque() # doc_keys with pending work, in service order
+        self._in_flight = 0
+        self._in_flight_by_doc = {}
+        self._last_decrease = 0.0
+        self._counters = {"submitted": 0, "completed": 0, "cancelled": 0, "requeued": 0, "throttled": 0,
+                          "server_errors": 0, "rate_wait_seconds": 0.0}
+        self._workers = []
+        self._started = False
+
+    def _ensure_workers(self):
+        # Workers are started on first use so importing the app stays cheap.
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.max_concurrency):
+            worker = threading.Thread(target=self._worker_loop, name=f"gemini-scheduler-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, doc_key, fn, *args, cost=0.0, **kwargs):
+        """
+        Queues fn(*args, **kwargs) under doc_key and returns a concurrent.futures.Future.
+        Within a document, tasks with the highest cost (estimated seconds) run first;
+        equal costs run in submission order.
+        """
+        future = Future()
+        with self._cond:
+            self._ensure_workers()
+            self._enqueue(doc_key, (-cost, next(self._sequence), future, fn, args, kwargs, time.perf_counter()))
+            self._counters["submitted"] += 1
+            self._cond.notify()
+        return future
+
+    def _enqueue(self, doc_key, entry):
+        # Caller holds self._cond
+        queue = self._queues.get(doc_key)
+        if queue is None:
+            queue = self._queues[doc_key] = []
+            self._round_robin.append(doc_key)
+        heapq.heappush(queue, entry)
+
+    def _release_delayed(self):
+        # Caller holds self._cond. Moves tasks whose backoff has elapsed back into their queues.
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, doc_key, entry = heapq.heappop(self._delayed)
+            self._enqueue(doc_key, entry[:6] + (time.perf_counter(),))
+
+    def cancel_pending(self, doc_key):
+        """Cancels everything still queued or backing off for doc_key (running calls finish normally)."""
+        with self._cond:
+            entries = self._queues.pop(doc_key, None) or []
+            if doc_key in self._round_robin:
+                self._round_robin.remove(doc_key)
+            entries += [entry for _, _, key, entry in self._delayed if key == doc_key]
+            self._delayed = [item for item in self._delayed if item[2] != doc_key]
+            heapq.heapify(self._delayed)
+        cancelled = 0
+        for _, _, future, _, _, _, _ in entries:
+            if future.running():
+                future.set_exception(CancelledError()) # Requeued after its first run; cancel() can't stop it
+                cancelled += 1
+            elif future.cancel():
+                cancelled += 1
+        with self._cond:
+            self._counters["cancelled"] += cancelled
+        return cancelled
+
+    def _next_task(self):
+        # Caller holds self._cond. Serves one task from the doc at the head of the rotation.
+        doc_key = self._round_robin.popleft()
+        queue = self._queues[doc_key]
+        task = heapq.heappop(queue)
+        if queue:
+            self._round_robin.append(doc_key)
+        else:
+            del self._queues[doc_key]
+        return doc_key, task
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    self._release_delayed()
+                    if self._round_robin and self._in_flight < int(self._limit):
+                        break
+                    # Sleep until notified, or until the next backing-off task is due
+                    self._cond.wait(timeout=max(0.0, self._delayed[0][0] - time.monotonic()) if self._delayed else None)
+                doc_key, entry = self._next_task()
+                _, _, future, fn, args, kwargs, queued_at = entry
+                # A requeued task's future is already running; only new ones can still be cancelled
+                if not future.running() and not future.set_running_or_notify_cancel():
+                    continue
+                self._in_flight += 1
+                self._in_flight_by_doc[doc_key] = self._in_flight_by_doc.get(doc_key, 0) + 1
+            queue_wait = time.perf_counter() - queued_at
+            metrics.observe("gemini_queue_wait_seconds", queue_wait)
+            record_stage("gemini_queue_wait", queue_wait, doc_key) # doc_key is the job id
+            requeue = None
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except RequeueTask as e:
+                requeue = e
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    remaining = self._in_flight_by_doc[doc_key] - 1
+                    if remaining:
+                        self._in_flight_by_doc[doc_key] = remaining
+                    else:
+                        del self._in_flight_by_doc[doc_key]
+                    if requeue is not None:
+                        # Backs off outside the slot: other tasks (and documents) run meanwhile
+                        entry = entry[:5] + ({**kwargs, **requeue.kwargs}, queued_at)
+                        heapq.heappush(self._delayed, (time.monotonic() + requeue.delay, next(self._sequence), doc_key, entry))
+                        self._counters["requeued"] += 1
+                    else:
+                        self._counters["completed"] += 1
+                    self._cond.notify_all()
+
+    @contextmanager
+    def slot_released(self):
+        """For a running task that has to wait in place: frees its concurrency slot meanwhile."""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                while self._in_flight >= int(self._limit):
+                    self._cond.wait()
+                self._in_flight += 1
+
+    def acquire_rate(self, estimated_tokens):
+        """Blocks until one request and estimated_tokens fit within the per-minute budgets."""
+        waited = self.request_bucket.acquire(1) + self.token_bucket.acquire(estimated_tokens)
+        if waited:
+            with self._cond:
+                self._counters["rate_wait_seconds"] += waited
+
+    def try_acquire_rate(self, estimated_tokens):
+        """Like acquire_rate, but returns False instead of waiting when the budgets are short."""
+        if not self.request_bucket.try_acquire(1):
+            return False
+        if not self.token_bucket.try_acquire(min(float(estimated_tokens), self.token_bucket.capacity)):
+            self.request_bucket.release(1)
+            return False
+        return True
+
+    def release_rate(self, estimated_tokens):
+        """Gives back a try_acquire_rate reservation for a request that wasn't sent after all."""
+        self.request_bucket.release(1)
+        self.token_bucket.release(min(float(estimated_tokens), self.token_bucket.capacity))
+
+    def seconds_since_backoff(self):
+        with self._cond:
+            return time.monotonic() - self._last_decrease if self._last_decrease else float("inf")
+
+    def record_success(self):
+        with self._cond:
+            if self._limit < self.max_concurrency:
+                self._limit = min(self.max_concurrency, self._limit + self.ADDITIVE_INCREASE / self._limit)
+                self._cond.notify_all()
+
+    def record_backoff(self, kind):
+        """Multiplicative decrease after a 429 ("throttled") or 5xx ("server") response."""
+        with self._cond:
+            self._counters["throttled" if kind == "throttled" else "server_errors"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.DECREASE_COOLDOWN_SECONDS:
+                self._limit = max(self.min_concurrency, self._limit * self.MULTIPLICATIVE_DECREASE)
+                self._last_decrease = now
+                logger.warning(f"  [Scheduler] Backing off after {kind} response; concurrency limit now {int(self._limit)}.")
+
+    def concurrency_limit(self):
+        with self._cond:
+            return int(self._limit)
+
+    def snapshot(self):
+        """Queue depth, in-flight counts and limits for monitoring."""
+        with self._cond:
+            return {
+                "queue_depth": sum(len(q) for q in self._queues.values()),
+                "backing_off": len(self._delayed),
+                "queue_depth_by_document": {k: len(q) for k, q in self._queues.items()},
+                "in_flight": self._in_flight,
+                "in_flight_by_document": dict(self._in_flight_by_doc),
+                "concurrency_limit": int(self._limit),
+                "max_concurrency": self.max_concurrency,
+                "min_concurrency": self.min_concurrency,
+                "requests_available": round(self.request_bucket.available(), 1),
+                "tokens_available": round(self.token_bucket.available()),
+                **{k: (round(v, 3) if isinstance(v, float) else v) for k, v in self._counters.items()}
+            }
+
+
+gemini_scheduler = GeminiScheduler(
+    max_concurrency=GEMINI_MAX_CONCURRENCY,
+    min_concurrency=GEMINI_MIN_CONCURRENCY,
+    initial_concurrency=GEMINI_INITIAL_CONCURRENCY,
+    requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=GEMINI_TOKENS_PER_MINUTE
+)
@@ -0,0 +1,151 @@
+"""
+Spooled uploads: local copies of input documents and who still needs them.
+
+Uploads (and blobs pulled back for a rerun) are copied to a file under SPOOL_DIR so
+extraction works from local disk. The spooled upload is shared by the background
+archival upload and the analysis job; whichever finishes last deletes it.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import clients
+from clients import BLOB_UPLOAD_CONCURRENCY, UPLOAD_CONTAINER_NAME
+from local_state import LOCAL_STATE_DIR
+from observability import logger, timed_stage
+
+SPOOL_DIR = os.path.join(LOCAL_STATE_DIR, "spool")
+
+
+def spool_to_local_file(source, suffix="", max_bytes=None):
+    """
+    Copies a readable stream, or a blob downloader (anything with readinto), into a
+    uniquely named file under SPOOL_DIR and returns its path. With max_bytes, a stream
+    that runs longer raises ValueError and the partial file is removed.
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=SPOOL_DIR, suffix=suffix, delete=False) as spooled:
+        try:
+            if max_bytes is not None:
+                copied = 0
+                while block := source.read(1024 * 1024):
+                    copied += len(block)
+                    if copied > max_bytes:
+                        raise ValueError(f"File is larger than the {max_bytes} byte limit.")
+                    spooled.write(block)
+            elif hasattr(source, "read"):
+                shutil.copyfileobj(source, spooled, length=1024 * 1024)
+            else:
+                source.readinto(spooled)
+        except Exception:
+            spooled.close()
+            os.remove(spooled.name)
+            raise
+        return spooled.name
+
+
+_spool_holders = {}
+_spool_holders_lock = threading.Lock()
+archive_upload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="archive-upload")
+
+
+def retain_spooled_input(path, holders=1):
+    with _spool_holders_lock:
+        _spool_holders[path] = _spool_holders.get(path, 0) + holders
+
+
+def release_spooled_input(path):
+    """Drops one holder of a spooled file and deletes it when nobody needs it any more."""
+    with _spool_holders_lock:
+        remaining = _spool_holders.get(path, 1) - 1
+        if remaining > 0:
+            _spool_holders[path] = remaining
+            return
+        _spool_holders.pop(path, None)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove spooled file '{path}': {e}")
+
+
+def archive_input_document(local_path, input_blob_name):
+    """Uploads the spooled document to the uploads container as a chunked, parallel upload."""
+    try:
+        input_blob_client = clients.blob_service_client.get_container_client(UPLOAD_CONTAINER_NAME).get_blob_client(input_blob_name)
+        with open(local_path, "rb") as data, timed_stage("archive_upload"):
+            input_blob_client.upload_blob(data, overwrite=True, max_concurrency=BLOB_UPLOAD_CONCURRENCY)
+        logger.info(f"Archived upload to blob: '{input_blob_name}' in container '{UPLOAD_CONTAINER_NAME}'")
+    except Exception as e:
+        # Archival is best-effort; the analysis runs from the local copy regardless
+        logger.warning(f"Could not archive '{input_blob_name}' to blob storage: {e}", exc_info=True)
+    finally:
+        release_spooled_input(local_path)
+
+
+# /analyze_batch limits, checked while spooling so an oversized upload never fills the disk
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "200"))
+BATCH_MAX_DOCUMENT_BYTES = int(os.getenv("BATCH_MAX_DOCUMENT_BYTES", str(200 * 1024 * 1024))) # Per file, incl. ZIP members
+
+
+
+def spool_batch_upload(file, max_documents):
+    """
+    Spools one /analyze_batch upload. A ZIP is expanded into its PDF/DOCX members.
+    Returns [(original_filename, local_path, spool_seconds)]; unsupported files are skipped.
+    Every document is held to BATCH_MAX_DOCUMENT_BYTES, and a ZIP's members are counted
+    and sized from its directory before any of them is expanded; more than
+    max_documents documents raises ValueError.
+    """
+    name = os.path.basename(file.filename or "")
+    suffix = os.path.splitext(name)[1].lower()
+    if suffix in (".pdf", ".docx"):
+        if max_documents < 1:
+            raise ValueError(f"A batch can contain at most {BATCH_MAX_DOCUMENTS} documents.")
+        start = time.perf_counter()
+        try:
+            path = spool_to_local_file(file.stream, suffix=suffix, max_bytes=BATCH_MAX_DOCUMENT_BYTES)
+        except ValueError:
+            raise ValueError(f"'{name}' is larger than the per-document limit.") from None
+        return [(name, path, time.perf_counter() - start)]
+    if suffix != ".zip":
+        logger.info(f"Skipping unsupported batch file '{name}'.")
+        return []
+
+    spooled = []
+    zip_path = spool_to_local_file(file.stream, suffix=".zip")
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            members = []
+            for member in archive.infolist():
+                member_name = os.path.basename(member.filename)
+                member_suffix = os.path.splitext(member_name)[1].lower()
+                if (member.is_dir() or member_suffix not in (".pdf", ".docx") or member_name.startswith(".")
+                        or member.filename.startswith("__MACOSX/")):
+                    continue
+                if member.file_size > BATCH_MAX_DOCUMENT_BYTES:
+                    raise ValueError(f"'{member_name}' in '{name}' is larger than the per-document limit.")
+                members.append((member, member_name, member_suffix))
+            if len(members) > max_documents:
+                raise ValueError(f"A batch can contain at most {BATCH_MAX_DOCUMENTS} documents.")
+            for member, member_name, member_suffix in members:
+                start = time.perf_counter()
+                with archive.open(member) as member_stream:
+                    try:
+                        # The directory's size can lie, so the expanded bytes are checked too
+                        path = spool_to_local_file(member_stream, suffix=member_suffix, max_bytes=BATCH_MAX_DOCUMENT_BYTES)
+                    except ValueError:
+                        raise ValueError(f"'{member_name}' in '{name}' is larger than the per-document limit.") from None
+                spooled.append((member_name, path, time.perf_counter() - start))
+    except Exception:
+        for _, path, _ in spooled:
+            release_spooled_input(path)
+        raise
+    finally:
+        os.remove(zip_path)
+    return spooled
@@ -5,6 +5,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const resultsContainer = document.getElementById('resultsContainer');
     const loadingOverlay = document.getElementById('loadingOverlay');
     const flashesContainer = document.getElementById('flashesContainer');
+    const loadingProgress = document.getElementById('loadingProgress');
     
     // New: Drag and Drop elements
     const fileDropArea = document.getElementById('fileDropArea');
@@ -66,6 +67,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Function to show the loading overlay
     function showLoading() {
+        if (loadingProgress) loadingProgress.textContent = '';
         loadingOverlay.style.display = 'flex';
         analyzeForm.querySelector('button[type="submit"]').disabled = true;
     }
@@ -128,24 +130,29 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: formData
             });
 
-            const data = await response.json();
+            const queued = await response.json();
 
-            if (data.status === 'success') {
-                resultsContainer.innerHTML = '<h3>Analysis Results:</h3>'; // Start with heading
-                resultsContainer.style.display = 'block';
+            if (queued.status !== 'queued') { // status === 'error'
+                displayFlashMessage(queued.message || "An unknown error occurred during analysis.", "danger");
+                return;
+            }
+
+            // /analyze only queues the job. Results stream in page by page, so swap the
+            // full-screen overlay for inline progress above the growing result list.
+            startResultsView();
+            loadingOverlay.style.display = 'none';
 
-                // BEFORE displaying results, check for and display the Excel download button
+            const data = window.EventSource ? await streamJob(queued.job_id) : await waitForJob(queued.job_id);
+
+            if (data.status === 'success') {
+                // Streamed rows were a preview; the finished (deduplicated) results are paged from the server
+                await loadResultGroups(queued.job_id);
                 if (data.excel_filename) {
-                    displayDownloadButton(data.excel_filename);
+                    displayDownloadButton(data.excel_filename, queued.job_id);
                 }
-
-                if (data.results && data.results.length > 0) {
-                    displayAnalysisResults(data.results); // Renamed function for clarity
-                } else {
+                if (renderedResultCount === 0) {
                     displayFlashMessage(data.message || "Analysis completed, but no allegations were identified.", "info");
                 }
-            } else if (data.status === 'info') {
-                displayFlashMessage(data.message || "Analysis completed, but no allegations were identified.", "info");
             } else { // status === 'error'
                 displayFlashMessage(data.message || "An unknown error occurred during analysis.", "danger");
             }
@@ -155,105 +162,441 @@ document.addEventListener('DOMContentLoaded', () => {
             displayFlashMessage(`Network or server error: ${error.message}. Please try again.`, "danger");
         } finally {
             hideLoading(); // Hide loading indicator regardless of success or failure
+            if (streamProgress) streamProgress.remove();
         }
     });
 
-    // Function to display the Excel download button (moved to the top of resultsContainer)
-    function displayDownloadButton(filename) {
+    // --- Incremental results view ---
+    // Each product group keeps its rows in memory (or pages them from the server once the
+    // job has finished); only the rows scrolled into view of an expanded group are in the DOM.
+    const RESULTS_PAGE_SIZE = 200;
+    const ESTIMATED_ROW_HEIGHT = 150; // px, used until a row has been rendered and measured
+    const ROW_GAP = 12; // Matches .virtual-window .result-item margin-bottom
+    const OVERSCAN_PX = 600; // Rendered above and below the visible part of a group
+
+    let productGroups = new Map(); // product name -> group (see getProductGroup)
+    let renderedResultCount = 0;
+    let downloadSlot = null;
+    let streamProgress = null;
+
+    // Resets the results area: heading, a slot for the download button and a progress line
+    function startResultsView() {
+        productGroups = new Map();
+        renderedResultCount = 0;
+        resultsContainer.innerHTML = '<h3>Analysis Results:</h3>'; // Start with heading
+
+        downloadSlot = document.createElement('div');
+        resultsContainer.appendChild(downloadSlot);
+
+        streamProgress = document.createElement('p');
+        streamProgress.className = 'stream-progress';
+        streamProgress.textContent = 'Preparing document...';
+        resultsContainer.appendChild(streamProgress);
+
+        resultsContainer.style.display = 'block';
+    }
+
+    // Follows /jobs/<id>/stream, rendering each page's allegations as soon as it arrives.
+    // Resolves with the job outcome; falls back to polling if the stream can't be kept open.
+    function streamJob(jobId) {
+        return new Promise((resolve) => {
+            const source = new EventSource(`/jobs/${jobId}/stream`);
+            let lastSeq = 0; // Highest page event id shown
+            const previewPages = new Map(); // page_id -> rows shown for it
+
+            source.addEventListener('page', (event) => {
+                // A reconnect resumes after Last-Event-ID, but anything sent again is skipped
+                const seq = parseInt(event.lastEventId, 10);
+                if (seq <= lastSeq) return;
+                if (seq) lastSeq = seq;
+                const payload = JSON.parse(event.data);
+                // A page re-run after a resume comes back under a new id; its rows replace the old ones
+                if (previewPages.has(payload.page_id)) removeAnalysisResults(previewPages.get(payload.page_id));
+                previewPages.set(payload.page_id, payload.results);
+                displayAnalysisResults(payload.results);
+            });
+
+            source.addEventListener('progress', (event) => {
+                updateLoadingProgress(JSON.parse(event.data));
+            });
+
+            source.addEventListener('complete', (event) => {
+                source.close();
+                const outcome = JSON.parse(event.data);
+                if (outcome.job_status === 'succeeded') {
+                    resolve({ status: 'success', excel_filename: outcome.excel_filename });
+                } else {
+                    resolve({ status: 'error', message: outcome.message });
+                }
+            });
+
+            source.onerror = () => {
+                // EventSource retries on its own (resuming via Last-Event-ID) unless the
+                // connection was refused outright; only then fall back to polling.
+                if (source.readyState === EventSource.CLOSED) {
+                    startResultsView();
+                    resolve(waitForJob(jobId));
+                }
+            };
+        });
+    }
+
+    // Polls /jobs/<id> until the analysis job finishes, updating progress as it goes.
+    // Resolves to a payload shaped like the old synchronous /analyze response (minus the
+    // rows, which loadResultGroups pages in afterwards).
+    async function waitForJob(jobId) {
+        const pollIntervalMs = 2000;
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, pollIntervalMs));
+
+            const response = await fetch(`/jobs/${jobId}?include_results=0`);
+            const job = await response.json();
+            if (job.status !== 'success') {
+                return job; // error payload (e.g. job not found)
+            }
+
+            updateLoadingProgress(job.progress);
+
+            if (job.job_status === 'succeeded') {
+                return { status: 'success', excel_filename: job.excel_filename };
+            }
+            if (job.job_status === 'failed') {
+                return { status: 'error', message: job.message };
+            }
+        }
+    }
+
+    // Shows "pages analyzed" progress under the spinner and above the streamed results
+    function updateLoadingProgress(progress) {
+        if (!progress) return;
+        let text = 'Preparing document...';
+        if (progress.pages_total > 0) {
+            text = `Analyzed ${progress.pages_collected} of ${progress.pages_total} pages`;
+            if (progress.errors > 0) {
+                text += ` (${progress.errors} errors)`;
+            }
+            text += '.';
+        }
+        if (loadingProgress) loadingProgress.textContent = text;
+        if (streamProgress) streamProgress.textContent = text;
+    }
+
+    // Function to display the report download button (at the top of resultsContainer)
+    // (jobId is shown so an amended version can later be analyzed against this run)
+    function displayDownloadButton(filename, jobId) {
+        const extension = filename.split('.').pop().toLowerCase();
+        const label = { xlsx: 'Excel', csv: 'CSV', parquet: 'Parquet' }[extension] || 'Analysis';
+        const icon = { xlsx: 'fa-file-excel', csv: 'fa-file-csv' }[extension] || 'fa-file';
         const downloadDiv = document.createElement('div');
         downloadDiv.className = 'download-section';
         downloadDiv.innerHTML = `
             <a href="/download_report/${filename}" class="download-button" download="${filename}">
-                <i class="fas fa-file-excel"></i> Download Excel Report
+                <i class="fas ${icon}"></i> Download ${label} Report
             </a>
             <p class="download-tip">Click to download the full analysis report.</p>
+            ${jobId ? `<p class="download-tip">Job ID: <code>${jobId}</code> (enter it as the baseline when analyzing an amended complaint)</p>` : ''}
+        `;
+        (downloadSlot || resultsContainer).appendChild(downloadDiv);
+    }
+
+    // Sort product names alphabetically, pushing "No Product Mentioned" and "ERROR" to end
+    function compareProductNames(a, b) {
+        if (a === "No Product Mentioned") return 1;
+        if (b === "No Product Mentioned") return -1;
+        if (a === "ERROR") return 1;
+        if (b === "ERROR") return -1;
+        return a.localeCompare(b);
+    }
+
+    // Numeric page for ordering results within a group; DOCX chunks and N/A sort last
+    function pinCiteSortKey(result) {
+        const page = String(result.Pin_Cite_Page || '');
+        if (/^\d+$/.test(page)) return parseInt(page, 10);
+        const chunkMatch = page.match(/^DOCX_Chunk_(\d+)$/);
+        if (chunkMatch) return 1000000 + parseInt(chunkMatch[1], 10);
+        return Number.MAX_SAFE_INTEGER;
+    }
+
+    // Returns the group for a product, creating its card in sorted position on first use
+    function getProductGroup(productName) {
+        let group = productGroups.get(productName);
+        if (group) return group;
+
+        const productGroupDiv = document.createElement('div');
+        productGroupDiv.className = 'product-group-card';
+        productGroupDiv.dataset.productName = productName;
+
+        // Add an arrow icon for expand/collapse
+        const headerHtml = `
+            <h4>
+                ${productName} <span class="group-count"></span>
+                <i class="fas fa-chevron-down toggle-icon"></i>
+            </h4>
+        `;
+        productGroupDiv.innerHTML = headerHtml;
+
+        const groupContent = document.createElement('div');
+        groupContent.className = 'group-content hidden'; // Initially hidden
+        productGroupDiv.appendChild(groupContent);
+
+        // The scrolling viewport holds a spacer as tall as every row would be, with only
+        // the visible window of rows positioned inside it
+        const viewport = document.createElement('div');
+        viewport.className = 'virtual-viewport';
+        const spacer = document.createElement('div');
+        spacer.className = 'virtual-spacer';
+        const windowDiv = document.createElement('div');
+        windowDiv.className = 'virtual-window';
+        spacer.appendChild(windowDiv);
+        viewport.appendChild(spacer);
+        groupContent.appendChild(viewport);
+
+        // Insert before the first existing card that sorts after this one
+        const nextCard = Array.from(resultsContainer.querySelectorAll('.product-group-card'))
+            .find(card => compareProductNames(card.dataset.productName, productName) > 0);
+        resultsContainer.insertBefore(productGroupDiv, nextCard || null);
+
+        group = {
+            name: productName,
+            card: productGroupDiv,
+            content: groupContent,
+            viewport: viewport,
+            spacer: spacer,
+            windowDiv: windowDiv,
+            rows: [],          // Streamed rows, or the server pages loaded so far (sparse)
+            heights: [],       // Measured row heights (including the gap); undefined = estimate
+            total: 0,
+            expanded: false,
+            jobId: null,       // Set once rows are paged from /jobs/<id>/results
+            loadingPages: new Set(),
+            renderPending: false
+        };
+
+        // Add click listener to the header (h4) of the product group
+        productGroupDiv.querySelector('h4').addEventListener('click', () => {
+            setGroupExpanded(group, !group.expanded);
+        });
+        viewport.addEventListener('scroll', () => scheduleGroupRender(group));
+
+        productGroups.set(productName, group);
+        return group;
+    }
+
+    function setGroupExpanded(group, expanded) {
+        group.expanded = expanded;
+        group.content.classList.toggle('hidden', !expanded);
+        const icon = group.card.querySelector('.toggle-icon');
+        icon.classList.toggle('fa-chevron-down', !expanded);
+        icon.classList.toggle('fa-chevron-up', expanded);
+        group.card.classList.toggle('expanded', expanded); // Add a class for styling expanded state
+        if (expanded) scheduleGroupRender(group);
+    }
+
+    function setGroupTotal(group, total) {
+        group.total = total;
+        group.card.querySelector('.group-count').textContent = `(${total})`;
+    }
+
+    // Coalesces renders (scrolls, streamed rows) to one per animation frame per group
+    function scheduleGroupRender(group) {
+        if (!group.expanded || group.renderPending) return;
+        group.renderPending = true;
+        requestAnimationFrame(() => {
+            group.renderPending = false;
+            renderGroupWindow(group);
+        });
+    }
+
+    function rowHeight(group, index) {
+        return group.heights[index] || ESTIMATED_ROW_HEIGHT;
+    }
+
+    // Renders just the rows of an expanded group that overlap its visible area
+    function renderGroupWindow(group) {
+        if (!group.expanded) return;
+        const top = Math.max(0, group.viewport.scrollTop - OVERSCAN_PX);
+        const bottom = group.viewport.scrollTop + group.viewport.clientHeight + OVERSCAN_PX;
+
+        let offset = 0;
+        let first = 0;
+        while (first < group.total && offset + rowHeight(group, first) <= top) {
+            offset += rowHeight(group, first);
+            first += 1;
+        }
+        const windowTop = offset;
+        let last = first;
+        while (last < group.total && offset < bottom) {
+            offset += rowHeight(group, last);
+            last += 1;
+        }
+        let fullHeight = offset;
+        for (let index = last; index < group.total; index += 1) {
+            fullHeight += rowHeight(group, index);
+        }
+
+        group.spacer.style.height = `${fullHeight}px`;
+        group.windowDiv.style.transform = `translateY(${windowTop}px)`;
+        group.windowDiv.innerHTML = '';
+        for (let index = first; index < last; index += 1) {
+            const result = group.rows[index];
+            group.windowDiv.appendChild(result ? buildResultItem(result) : buildPlaceholderItem());
+        }
+        if (group.jobId) loadGroupPages(group, first, last);
+
+        // Replace estimates with real heights; re-render once if the layout moved
+        let changed = false;
+        Array.from(group.windowDiv.children).forEach((item, position) => {
+            const index = first + position;
+            if (!group.rows[index]) return;
+            const measured = item.offsetHeight + ROW_GAP;
+            if (group.heights[index] !== measured) {
+                group.heights[index] = measured;
+                changed = true;
+            }
+        });
+        if (changed) scheduleGroupRender(group);
+    }
+
+    function buildResultItem(result) {
+        const resultItem = document.createElement('div');
+        resultItem.className = 'result-item';
+
+        // Handle Pin_Cite_Page and Pin_Cite_Paragraph for display
+        let pinCiteDisplay = 'N/A';
+        if (result.Pin_Cite_Page && result.Pin_Cite_Page !== 'N/A') {
+            if (String(result.Pin_Cite_Page).startsWith('DOCX_Chunk_')) {
+                // For DOCX chunks, display as is
+                pinCiteDisplay = result.Pin_Cite_Page;
+            } else {
+                // Assume it's a PDF page number or a number-like string
+                pinCiteDisplay = `p. ${result.Pin_Cite_Page}`;
+            }
+
+            if (result.Pin_Cite_Paragraph && result.Pin_Cite_Paragraph !== 'N/A') {
+                pinCiteDisplay += `, ¶${result.Pin_Cite_Paragraph}`;
+            }
+        }
+
+        resultItem.innerHTML = `
+            <p><strong>Allegation Category:</strong> ${result.Allegation_Category || 'N/A'}</p>
+            <p><strong>Specific Allegation Summary:</strong> ${result.Specific_Allegation_Summary || 'N/A'}</p>
+            <p><strong>Involved Defendants/Co-Conspirators:</strong> ${result.Involved_Defendants_CoConspirators || 'N/A'}</p>
+            <p><strong>Pin Cite:</strong> ${pinCiteDisplay}</p>
         `;
-        resultsContainer.appendChild(downloadDiv);
+        return resultItem;
     }
 
-    // Renamed function to display analysis results (excluding the download button logic)
+    function buildPlaceholderItem() {
+        const placeholder = document.createElement('div');
+        placeholder.className = 'result-item result-placeholder';
+        placeholder.style.height = `${ESTIMATED_ROW_HEIGHT - ROW_GAP}px`;
+        placeholder.innerHTML = '<p>Loading...</p>';
+        return placeholder;
+    }
+
+    // Fetches the server pages covering rows [first, last) that aren't loaded yet
+    function loadGroupPages(group, first, last) {
+        for (let index = first; index < last; index += 1) {
+            if (group.rows[index]) continue;
+            const page = Math.floor(index / RESULTS_PAGE_SIZE) + 1;
+            index = page * RESULTS_PAGE_SIZE - 1; // Next candidate is the following page
+            if (group.loadingPages.has(page)) continue;
+            group.loadingPages.add(page);
+
+            const params = new URLSearchParams({ product: group.name, page: page, page_size: RESULTS_PAGE_SIZE });
+            fetch(`/jobs/${group.jobId}/results?${params}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status !== 'success') throw new Error(data.message);
+                    data.results.forEach((result, offset) => {
+                        group.rows[(page - 1) * RESULTS_PAGE_SIZE + offset] = result;
+                    });
+                    group.loadingPages.delete(page);
+                    scheduleGroupRender(group);
+                })
+                .catch(error => {
+                    console.error('Results page error:', error);
+                    group.loadingPages.delete(page); // Retried on the next scroll
+                });
+        }
+    }
+
+    // Adds streamed results to their product groups; only expanded groups touch the DOM
     function displayAnalysisResults(results) {
-        // Group results by Product_Name
-        const groupedResults = results.reduce((acc, current) => {
-            // Use current.Product_Name, ensuring it's a string or defaults
-            const productName = current.Product_Name && typeof current.Product_Name === 'string'
-                                ? current.Product_Name.trim()
+        const touched = new Set();
+        results.forEach(result => {
+            // Use result.Product_Name, ensuring it's a string or defaults
+            const productName = result.Product_Name && typeof result.Product_Name === 'string'
+                                ? result.Product_Name.trim()
                                 : "No Product Mentioned";
+            const group = getProductGroup(productName);
+
+            // Pages finish out of order; keep each group in page order as results arrive
+            const sortKey = pinCiteSortKey(result);
+            let low = 0;
+            let high = group.rows.length;
+            while (low < high) {
+                const mid = (low + high) >> 1;
+                if (pinCiteSortKey(group.rows[mid]) <= sortKey) low = mid + 1; else high = mid;
+            }
+            group.rows.splice(low, 0, result);
+            group.heights.splice(low, 0, undefined);
 
-            if (!acc[productName]) {
-                acc[productName] = [];
+            setGroupTotal(group, group.rows.length);
+            renderedResultCount += 1;
+            touched.add(group);
+        });
+        touched.forEach(scheduleGroupRender);
+    }
+
+    // Takes rows added by displayAnalysisResults back out of their product groups
+    function removeAnalysisResults(results) {
+        const touched = new Set();
+        results.forEach(result => {
+            const productName = result.Product_Name && typeof result.Product_Name === 'string'
+                                ? result.Product_Name.trim()
+                                : "No Product Mentioned";
+            const group = productGroups.get(productName);
+            const index = group ? group.rows.indexOf(result) : -1;
+            if (index === -1) return;
+            group.rows.splice(index, 1);
+            group.heights.splice(index, 1);
+            setGroupTotal(group, group.rows.length);
+            renderedResultCount -= 1;
+            touched.add(group);
+        });
+        touched.forEach(group => {
+            if (group.total === 0) {
+                group.card.remove();
+                productGroups.delete(group.name);
+            } else {
+                scheduleGroupRender(group);
             }
-            acc[productName].push(current);
-            return acc;
-        }, {});
-
-        // Sort product names alphabetically, pushing "No Product Mentioned" and "ERROR" to end
-        const sortedProductNames = Object.keys(groupedResults).sort((a, b) => {
-            if (a === "No Product Mentioned") return 1;
-            if (b === "No Product Mentioned") return -1;
-            if (a === "ERROR") return 1;
-            if (b === "ERROR") return -1;
-            return a.localeCompare(b);
         });
+    }
 
-        sortedProductNames.forEach(productName => {
-            const productGroupDiv = document.createElement('div');
-            productGroupDiv.className = 'product-group-card';
-
-            // Add an arrow icon for expand/collapse
-            const headerHtml = `
-                <h4>
-                    ${productName}
-                    <i class="fas fa-chevron-down toggle-icon"></i>
-                </h4>
-            `;
-            productGroupDiv.innerHTML = headerHtml;
-
-            const groupContent = document.createElement('div');
-            groupContent.className = 'group-content hidden'; // Initially hidden
-
-            groupedResults[productName].forEach(result => {
-                const resultItem = document.createElement('div');
-                resultItem.className = 'result-item';
-
-                // Handle Pin_Cite_Page and Pin_Cite_Paragraph for display
-                let pinCiteDisplay = 'N/A';
-                if (result.Pin_Cite_Page && result.Pin_Cite_Page !== 'N/A') {
-                    if (String(result.Pin_Cite_Page).startsWith('DOCX_Chunk_')) {
-                        // For DOCX chunks, display as is
-                        pinCiteDisplay = result.Pin_Cite_Page;
-                    } else {
-                        // Assume it's a PDF page number or a number-like string
-                        pinCiteDisplay = `p. ${result.Pin_Cite_Page}`;
-                    }
-                    
-                    if (result.Pin_Cite_Paragraph && result.Pin_Cite_Paragraph !== 'N/A') {
-                        pinCiteDisplay += `, ¶${result.Pin_Cite_Paragraph}`;
-                    }
-                }
+    // Replaces the streamed preview with the job's final groups, whose rows are then
+    // paged from /jobs/<id>/results as each group is expanded and scrolled
+    async function loadResultGroups(jobId) {
+        const response = await fetch(`/jobs/${jobId}/results`);
+        const data = await response.json();
+        if (data.status !== 'success') {
+            displayFlashMessage(data.message || "Could not load the analysis results.", "danger");
+            return;
+        }
 
-                resultItem.innerHTML = `
-                    <p><strong>Allegation Category:</strong> ${result.Allegation_Category || 'N/A'}</p>
-                    <p><strong>Specific Allegation Summary:</strong> ${result.Specific_Allegation_Summary || 'N/A'}</p>
-                    <p><strong>Involved Defendants/Co-Conspirators:</strong> ${result.Involved_Defendants_CoConspirators || 'N/A'}</p>
-                    <p><strong>Pin Cite:</strong> ${pinCiteDisplay}</p>
-                `;
-                groupContent.appendChild(resultItem);
-            });
-            productGroupDiv.appendChild(groupContent);
-            resultsContainer.appendChild(productGroupDiv);
-
-            // Add click listener to the header (h4) of the product group
-            productGroupDiv.querySelector('h4').addEventListener('click', (e) => {
-                const content = productGroupDiv.querySelector('.group-content');
-                const icon = productGroupDiv.querySelector('.toggle-icon');
-                if (content && icon) {
-                    content.classList.toggle('hidden');
-                    icon.classList.toggle('fa-chevron-down');
-                    icon.classList.toggle('fa-chevron-up');
-                    productGroupDiv.classList.toggle('expanded'); // Add a class for styling expanded state
-                }
-            });
+        const expandedNames = new Set(Array.from(productGroups.values())
+            .filter(group => group.expanded).map(group => group.name));
+        productGroups.forEach(group => group.card.remove());
+        productGroups = new Map();
+        renderedResultCount = 0;
+
+        data.groups.forEach(summary => {
+            const group = getProductGroup(summary.product_name);
+            group.jobId = jobId;
+            setGroupTotal(group, summary.count);
+            renderedResultCount += summary.count;
+            if (expandedNames.has(summary.product_name)) setGroupExpanded(group, true);
         });
     }
-});
\ No newline at end of file
+});
@@ -0,0 +1,55 @@
+"""
+Unit tests run fully offline: the app is imported with the in-memory blob store, the
+fake Gemini backend, a throwaway LOCAL_STATE_DIR and the result cache disabled.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+os.environ.setdefault("LOCAL_STATE_DIR", tempfile.mkdtemp(prefix="legal-complaint-tests-"))
+os.environ.setdefault("GEMINI_BACKEND", "fake")
+os.environ.setdefault("AZURE_STORAGE_BACKEND", "memory")
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("PDF_EXTRACTION_PROCESSES", "1")
+os.environ.setdefault("FAKE_GEMINI_LATENCY_MS", "1")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks")) # synthetic_complaints writes test documents
+
+JOB_TIMEOUT_SECONDS = 60
+
+
+@pytest.fixture
+def client():
+    """Flask test client for an app whose (offline) clients have finished initializing."""
+    import app
+    app.start_background_services()
+    assert app.clients_ready.wait(JOB_TIMEOUT_SECONDS)
+    return app.app.test_client()
+
+
+@pytest.fixture
+def run_job(client, tmp_path):
+    """Uploads a document written from [[paragraph, ...], ...] pages and returns the finished job."""
+    from job_store import job_store
+    from synthetic_complaints import write_docx, write_pdf
+
+    def run(pages, suffix=".pdf", **form):
+        path = str(tmp_path / f"complaint{suffix}")
+        (write_docx if suffix == ".docx" else write_pdf)(pages, path)
+        with open(path, "rb") as document:
+            response = client.post("/analyze", data=dict(form, file=(document, os.path.basename(path))),
+                                   content_type="multipart/form-data")
+        assert response.status_code == 202, response.get_json()
+        job_id = response.get_json()["job_id"]
+        deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+        while job_store.get(job_id)["status"] not in ("succeeded", "failed"):
+            assert time.monotonic() < deadline, "job did not finish"
+            time.sleep(0.02)
+        return job_store.get(job_id)
+
+    return run
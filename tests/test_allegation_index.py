@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from allegation_index import AllegationIndex, entity_keys
+
+
+def row(product, defendants, summary, complaint="Complaint A", page="2"):
+    return {"Product_Name": product, "Allegation_Category": "Price Fixing", "Specific_Allegation_Summary": summary,
+            "Involved_Defendants_CoConspirators": defendants, "Other_Named_Entities": "N/A",
+            "Pin_Cite_Page": page, "Pin_Cite_Paragraph": "5", "Complaint_Name": complaint}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = AllegationIndex(str(tmp_path / "allegations.sqlite3"))
+    index.replace_job("job-a", [
+        row("Carbamazepine ER (Tegretol XR)", "Taro Pharmaceuticals U.S.A., Inc., Sandoz",
+            "Taro and Sandoz coordinated carbamazepine price increases."),
+        row("Digoxin", "Mylan N.V.", "Mylan allocated digoxin customers with Lannett."),
+        row("N/A", "N/A", "No allegations on this page."),
+    ])
+    index.replace_job("job-b", [
+        row("Carbamazepine", "Teva USA Inc, Taro", "Teva followed Taro's carbamazepine price increase.",
+            complaint="Complaint B"),
+    ])
+    return index
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Sandoz, Taro", ["sandoz", "taro"]),
+    ("Teva USA, Inc., Mylan N.V.", ["teva usa inc", "mylan n v"]),
+    ("Teva USA, Inc.; Sandoz, sandoz", ["teva usa inc", "sandoz"]), # Older merged rows used "; "
+    ("N/A", []),
+    (None, []),
+])
+def test_entity_keys_match_dedupe_normalizer(value, expected):
+    assert entity_keys(value) == expected
+
+
+@pytest.mark.parametrize("filters, products", [
+    ({"product": "carbamazepine"}, ["Carbamazepine ER (Tegretol XR)", "Carbamazepine"]),
+    ({"defendant": "taro"}, ["Carbamazepine ER (Tegretol XR)", "Carbamazepine"]),
+    # Suffix punctuation and case are ignored either way round
+    ({"defendant": "Teva USA, Inc."}, ["Carbamazepine"]),
+    ({"defendant": "taro pharmaceuticals u.s.a. inc"}, ["Carbamazepine ER (Tegretol XR)"]),
+    ({"defendant": "Mylan N.V."}, ["Digoxin"]),
+    ({"defendant": "Inc."}, []), # A suffix is never a defendant on its own
+    ({"complaint": "complaint b"}, ["Carbamazepine"]),
+    ({"q": "allocated"}, ["Digoxin"]),
+    ({"q": "carbamaz*", "defendant": "sandoz"}, ["Carbamazepine ER (Tegretol XR)"]),
+])
+def test_search_filters(index, filters, products):
+    total, rows = index.search(**filters)
+
+    assert total == len(products)
+    assert sorted(r["Product_Name"] for r in rows) == sorted(products)
+
+
+def test_replace_job_reindexes_and_skips_placeholders(index):
+    assert index.search(job_id="job-a")[0] == 2
+
+    index.replace_job("job-a", [row("Digoxin", "Lannett", "Lannett matched Mylan's digoxin price.")])
+
+    assert index.search(job_id="job-a")[0] == 1
+    assert index.search(defendant="mylan")[0] == 0
+    assert index.indexed_job_ids() == {"job-a", "job-b"}
+
+
+def test_keys_from_an_older_index_are_rebuilt(tmp_path):
+    path = str(tmp_path / "allegations.sqlite3")
+    AllegationIndex(path).replace_job("job-a", [row("Digoxin", "Teva USA, Inc.", "Teva raised prices.")])
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE allegation_defendants SET defendant_key = 'teva usa'")
+        conn.execute("PRAGMA user_version = 0")
+    conn.close()
+
+    assert AllegationIndex(path).search(defendant="Teva USA, Inc.")[0] == 1
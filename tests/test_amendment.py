@@ -0,0 +1,126 @@
+import pytest
+
+from amendment import plan_amendment, split_numbered_paragraphs
+
+BASELINE_PAGES = [
+    (1, "UNITED STATES DISTRICT COURT\nCOMPLAINT\n1. Plaintiffs bring this action against Sandoz and Taro.\n"),
+    (2, "2. Sandoz and Taro agreed to raise clobetasol prices in 2014.\n"
+        "3. Mylan allocated digoxin customers with Lannett\nacross the\n"),
+    (3, "Case 2:16-md-02724 Document 1 Page 3 of 4\ncountry during 2015.\n"
+        "4. The conspiracy caused purchasers to overpay.\n"),
+]
+
+
+def row(product, paragraph, page, summary="Summary."):
+    return {"Product_Name": product, "Allegation_Category": "Price Fixing", "Specific_Allegation_Summary": summary,
+            "Involved_Defendants_CoConspirators": "Sandoz", "Other_Named_Entities": "N/A",
+            "Pin_Cite_Page": page, "Pin_Cite_Paragraph": paragraph, "Complaint_Name": "Baseline"}
+
+
+def sent_text(plan):
+    return "".join(text for _, text in plan.pages_to_send)
+
+
+def test_split_numbered_paragraphs_spans_pages_and_keeps_preamble():
+    paragraphs = split_numbered_paragraphs(BASELINE_PAGES)
+
+    assert [p.number for p in paragraphs] == [None, 1, 2, 3, 4]
+    assert "COMPLAINT" in paragraphs[0].pieces[0][1]
+    assert [page for page, _ in paragraphs[3].pieces] == [2, 3]
+
+
+@pytest.mark.parametrize("pages, expected", [
+    ([(1, "1. First.\n2. Second.\n")], [1, 2]),
+    ([(1, "20. Twenty.\n1. A nested list item.\n21. Twenty-one.\n")], [20, 21]), # Restarted numbering
+    ([(1, "90. Ninety.\n")], [None]), # Too far from the previous paragraph (none) to be one
+    ([(1, "5. Prices rose in\n2015. They kept rising.\n6. Next.\n")], [5, 6]), # A year at a line start
+    ([(1, "No numbered paragraphs here.\n")], [None]),
+    ([(1, ""), (2, "  \n")], []),
+])
+def test_split_numbered_paragraphs_numbering(pages, expected):
+    assert [p.number for p in split_numbered_paragraphs(pages)] == expected
+
+
+def test_split_numbered_paragraphs_digest_ignores_page_furniture_and_wrapping():
+    wrapped = split_numbered_paragraphs([(1, "3. Mylan allocated digoxin\ncustomers.\n"), (2, "Page 2 of 9\n")])
+    reflowed = split_numbered_paragraphs([(7, "3. Mylan allocated digoxin customers.\n")])
+
+    assert wrapped[0].digest == reflowed[0].digest
+
+
+def test_identical_document_keeps_every_row():
+    rows = [row("Clobetasol", "1", "1"),
+            row("Clobetasol", "2", "2"),
+            row("Digoxin", "30", "3"), # Paragraph 30 doesn't exist
+            row("Clobetasol", "N/A", "N/A")]
+
+    plan = plan_amendment(BASELINE_PAGES, rows, BASELINE_PAGES, "Amended")
+
+    assert plan.stats["new_or_changed_paragraphs"] == 0
+    assert plan.stats["rows_dropped"] == 0
+    assert plan.stats["rows_resent"] == 1
+    assert plan.stats["rows_carried_as_is"] == 1
+    assert len(plan.carried_rows) == 3
+    # The row citing the missing paragraph falls back to re-sending its cited page
+    assert "3. Mylan" in sent_text(plan) and "4. The conspiracy" in sent_text(plan)
+    assert "2. Sandoz and Taro" not in sent_text(plan)
+    assert all(carried["Complaint_Name"] == "Amended" for carried in plan.carried_rows)
+
+
+def test_rows_without_paragraph_cite_fall_back_to_pages():
+    rows = [row("Digoxin", "N/A", "3"), row("ERROR", "Error processing", "1")]
+
+    plan = plan_amendment(BASELINE_PAGES, rows, BASELINE_PAGES, "Amended")
+
+    assert plan.stats["rows_dropped"] == 0
+    assert plan.stats["rows_resent"] == 2
+    assert plan.carried_rows == []
+    assert "4. The conspiracy" in sent_text(plan) and "1. Plaintiffs" in sent_text(plan)
+
+
+def test_docx_rows_are_carried_over_unchanged():
+    baseline = [(None, "1. Sandoz and Taro agreed to raise prices.\n"), (None, "2. Mylan allocated customers.\n")]
+    rows = [row("Clobetasol", "N/A", "DOCX_Chunk_1"), row("Digoxin", "2", "DOCX_Chunk_1")]
+
+    plan = plan_amendment(baseline, rows, baseline, "Amended")
+
+    assert plan.stats["rows_dropped"] == 0
+    assert plan.stats["rows_carried_as_is"] == 1
+    assert [carried["Product_Name"] for carried in plan.carried_rows] == ["Clobetasol", "Digoxin"]
+    assert plan.carried_rows[0]["Pin_Cite_Page"] == "DOCX_Chunk_1"
+
+
+def test_changed_paragraph_is_resent_and_its_rows_are_not_carried():
+    amended = [BASELINE_PAGES[0],
+               (2, "2. Sandoz and Taro agreed to raise clobetasol prices in 2014 and 2015.\n"
+                   "3. Mylan allocated digoxin customers with Lannett\nacross the\n"),
+               BASELINE_PAGES[2]]
+    rows = [row("Clobetasol", "2", "2"), row("Digoxin", "3-4", "2, 3"), row("Clobetasol", "1, 2", "1, 2")]
+
+    plan = plan_amendment(BASELINE_PAGES, rows, amended, "Amended")
+
+    assert plan.stats["new_or_changed_paragraphs"] == 1
+    assert plan.stats["rows_dropped"] == 0
+    assert [carried["Pin_Cite_Paragraph"] for carried in plan.carried_rows] == ["3-4"]
+    # The row citing paragraphs 1 and 2 sends its unchanged paragraph 1 along with 2
+    assert "and 2015" in sent_text(plan) and "1. Plaintiffs" in sent_text(plan)
+    assert "3. Mylan" not in sent_text(plan) and "4. The conspiracy" not in sent_text(plan)
+
+
+def test_inserted_paragraph_renumbers_carried_rows():
+    amended = [(1, "UNITED STATES DISTRICT COURT\nCOMPLAINT\n1. Plaintiffs bring this action against Sandoz and Taro.\n"
+                   "2. Venue is proper in this District.\n"),
+               (2, "3. Sandoz and Taro agreed to raise clobetasol prices in 2014.\n"),
+               (3, "4. Mylan allocated digoxin customers with Lannett across the country during 2015.\n"
+                   "5. The conspiracy caused purchasers to overpay.\n")]
+    rows = [row("Digoxin", "3", "2", summary="3. Mylan allocated digoxin customers."),
+            row("Clobetasol", "2; 4", "2; 3")]
+
+    plan = plan_amendment(BASELINE_PAGES, rows, amended, "Amended")
+
+    assert plan.stats["rows_dropped"] == 0
+    digoxin, clobetasol = plan.carried_rows
+    assert (digoxin["Pin_Cite_Paragraph"], digoxin["Pin_Cite_Page"]) == ("4", "3")
+    assert digoxin["Specific_Allegation_Summary"] == "4. Mylan allocated digoxin customers."
+    assert (clobetasol["Pin_Cite_Paragraph"], clobetasol["Pin_Cite_Page"]) == ("3; 5", "2; 3")
+    assert "2. Venue" in sent_text(plan)
@@ -0,0 +1,83 @@
+import io
+import os
+import time
+import zipfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import spooling
+from conftest import JOB_TIMEOUT_SECONDS
+from spooling import release_spooled_input, spool_batch_upload
+from synthetic_complaints import write_pdf
+
+PAGES = [["1. Sandoz and Taro agreed to raise clobetasol prices in 2014."]]
+
+
+@pytest.fixture(scope="module")
+def pdf_bytes(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("batch") / "complaint.pdf")
+    write_pdf(PAGES, path)
+    with open(path, "rb") as document:
+        return document.read()
+
+
+def zip_upload(members, name="batch.zip"):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for member_name, data in members.items():
+            archive.writestr(member_name, data)
+    buffer.seek(0)
+    return FileStorage(stream=buffer, filename=name)
+
+
+def test_zip_batch_expands_documents_and_skips_everything_else(pdf_bytes):
+    upload = zip_upload({"a.pdf": pdf_bytes, "nested/b.docx": b"docx", "notes.txt": b"notes",
+                         "__MACOSX/._a.pdf": b"resource fork", ".hidden.pdf": pdf_bytes})
+
+    spooled = spool_batch_upload(upload, max_documents=10)
+    try:
+        assert [name for name, _, _ in spooled] == ["a.pdf", "b.docx"]
+        assert all(os.path.exists(path) for _, path, _ in spooled)
+    finally:
+        for _, path, _ in spooled:
+            release_spooled_input(path)
+
+
+def test_zip_batch_limits_are_checked_before_expanding(pdf_bytes, monkeypatch):
+    with pytest.raises(ValueError, match="at most"):
+        spool_batch_upload(zip_upload({"a.pdf": pdf_bytes, "b.pdf": pdf_bytes}), max_documents=1)
+
+    monkeypatch.setattr(spooling, "BATCH_MAX_DOCUMENT_BYTES", 100)
+    with pytest.raises(ValueError, match="per-document limit"):
+        spool_batch_upload(zip_upload({"a.pdf": pdf_bytes}), max_documents=10)
+    with pytest.raises(ValueError, match="per-document limit"):
+        spool_batch_upload(FileStorage(stream=io.BytesIO(pdf_bytes), filename="a.pdf"), max_documents=10)
+
+
+def test_unsupported_file_is_skipped():
+    assert spool_batch_upload(FileStorage(stream=io.BytesIO(b"notes"), filename="notes.txt"), max_documents=10) == []
+
+
+def test_analyze_batch_runs_each_document_and_builds_a_combined_workbook(client, pdf_bytes):
+    response = client.post("/analyze_batch", content_type="multipart/form-data", data={
+        "files": [(zip_upload({"complaint.pdf": pdf_bytes, "copy/complaint.pdf": pdf_bytes}).stream, "batch.zip")]})
+
+    assert response.status_code == 202, response.get_json()
+    batch = response.get_json()
+    assert [document["original_filename"] for document in batch["documents"]] == ["complaint.pdf",
+                                                                                   "complaint (2).pdf"]
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while (status := client.get(batch["status_url"]).get_json())["batch_status"] not in ("succeeded", "failed"):
+        assert time.monotonic() < deadline, "batch did not finish"
+        time.sleep(0.05)
+    assert status["batch_status"] == "succeeded"
+    assert status["documents_by_status"] == {"succeeded": 2}
+    assert status["excel_filename"]
+
+
+def test_analyze_batch_rejects_non_xlsx_reports(client, pdf_bytes):
+    response = client.post("/analyze_batch", content_type="multipart/form-data",
+                           data={"files": [(io.BytesIO(pdf_bytes), "a.pdf")], "report_format": "csv"})
+
+    assert response.status_code == 400
@@ -0,0 +1,58 @@
+from chunk_planning import PROMPT_INSTRUCTION_TOKENS, ChunkPlanner, segment_marker, split_oversized_text
+
+
+def page(words):
+    """Page text of about `words` tokens (4 characters each)."""
+    return "abc " * words
+
+
+def test_pages_are_packed_in_document_order_with_segment_labels():
+    planner = ChunkPlanner(token_budget=250, max_segment_tokens=250)
+
+    assert planner.add_page(2, page(100)) == [] # Waits for page 1
+    assert planner.add_page(1, page(100)) == []
+    chunks = planner.add_page(3, page(100)) + planner.add_page(4, "") + planner.add_page(5, page(100)) + planner.flush()
+
+    assert [chunk.chunk_id for chunk in chunks] == ["1-2", "3-5"]
+    first = chunks[0]
+    assert first.segment_labels == {"S1": "1", "S2": "2"}
+    assert first.text.startswith(segment_marker("S1") + "\n")
+    assert segment_marker("S2") in first.text
+    assert chunks[1].pages == ["3", "5"] # Empty pages are never sent
+
+
+def test_oversized_page_is_split_into_parts_that_finish_once():
+    planner = ChunkPlanner(token_budget=100, max_segment_tokens=100)
+
+    chunks = planner.add_page(1, "\n".join(["word " * 15] * 8)) + planner.flush() # ~150 tokens over 8 lines
+
+    assert [chunk.chunk_id for chunk in chunks] == ["1 (part 1/2)", "1 (part 2/2)"]
+    assert [chunk.final_pages for chunk in chunks] == [[], ["1"]] # Progress counts the page once
+    assert all(chunk.segment_labels == {"S1": "1"} for chunk in chunks)
+
+
+def test_split_oversized_text_hard_wraps_long_lines():
+    pieces = split_oversized_text("x" * 90, max_tokens=10)
+
+    assert [len(piece) for piece in pieces] == [40, 40, 10]
+
+
+def test_docx_paragraphs_pack_into_numbered_chunks():
+    planner = ChunkPlanner(token_budget=250, max_segment_tokens=250)
+
+    chunks = planner.pack_paragraphs([page(100), page(100), page(100)])
+
+    assert [chunk.chunk_id for chunk in chunks] == ["DOCX_Chunk_1", "DOCX_Chunk_2"]
+    assert chunks[0].segment_labels == {"S1": "DOCX_Chunk_1"}
+
+
+def test_packing_stats_compare_calls_and_prompt_tokens():
+    planner = ChunkPlanner(token_budget=1000, max_segment_tokens=1000)
+    for number in range(1, 5):
+        planner.add_page(number, page(100))
+    planner.flush()
+
+    stats = planner.packing_stats(baseline_calls=4)
+
+    assert (stats["before"]["calls"], stats["after"]["calls"]) == (4, 1)
+    assert stats["before"]["prompt_tokens"] - stats["after"]["prompt_tokens"] > 2 * PROMPT_INSTRUCTION_TOKENS
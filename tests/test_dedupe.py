@@ -0,0 +1,61 @@
+import pytest
+
+from dedupe import merge_near_duplicate_allegations, split_entity_names, union_entity_names
+
+
+def row(summary, page, paragraph, defendants="Sandoz", product="Clobetasol"):
+    return {"Product_Name": product, "Allegation_Category": "Price Fixing", "Specific_Allegation_Summary": summary,
+            "Involved_Defendants_CoConspirators": defendants, "Other_Named_Entities": "N/A",
+            "Pin_Cite_Page": page, "Pin_Cite_Paragraph": paragraph}
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Sandoz, Taro", ["Sandoz", "Taro"]),
+    ("Teva USA, Inc., Mylan N.V.", ["Teva USA, Inc.", "Mylan N.V."]),
+    ("Teva USA, Inc.; Mylan", ["Teva USA, Inc.", "Mylan"]), # Joined by an earlier merge
+    ("Perrigo Co., LLC, Lannett", ["Perrigo Co., LLC", "Lannett"]),
+    ("N/A", []),
+    ("n/a, Sandoz", ["Sandoz"]),
+])
+def test_split_entity_names(value, expected):
+    assert split_entity_names(value) == expected
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["Sandoz, Taro", "taro ; SANDOZ", "Mylan"], "Sandoz, Taro, Mylan"),
+    (["Teva USA, Inc.", "Teva USA Inc", "Mylan"], "Teva USA, Inc., Mylan"),
+    (["N/A", "N/A"], "N/A"),
+])
+def test_union_entity_names(values, expected):
+    assert union_entity_names(values) == expected
+
+
+def test_union_entity_names_reads_back_name_for_name():
+    merged = union_entity_names(["Teva USA, Inc.", "Mylan N.V., Sandoz"])
+
+    assert split_entity_names(merged) == ["Teva USA, Inc.", "Mylan N.V.", "Sandoz"]
+    assert union_entity_names([merged, "Sandoz"]) == merged
+
+
+def test_merge_near_duplicate_allegations_combines_cites_and_names():
+    summary = "Sandoz and Taro agreed to raise clobetasol prices in 2014"
+    rows = [row(summary + ".", "2", "5"),
+            row("Mylan allocated digoxin customers with Lannett.", "3", "7", "Mylan", product="Digoxin"),
+            row(summary + " and 2015.", "4", "9, 10", "Taro Pharmaceuticals U.S.A., Inc."),
+            row(summary + ".", "2", "6", "sandoz")]
+
+    merged, merged_away = merge_near_duplicate_allegations(rows)
+
+    assert merged_away == 2
+    assert [r["Product_Name"] for r in merged] == ["Clobetasol", "Digoxin"]
+    clobetasol = merged[0]
+    assert clobetasol["Specific_Allegation_Summary"] == summary + " and 2015."
+    assert (clobetasol["Pin_Cite_Page"], clobetasol["Pin_Cite_Paragraph"]) == ("2; 4", "5, 6; 9, 10")
+    assert clobetasol["Involved_Defendants_CoConspirators"] == "Sandoz, Taro Pharmaceuticals U.S.A., Inc."
+
+
+def test_merge_near_duplicate_allegations_keeps_distinct_products_and_placeholders():
+    rows = [row("Prices rose.", "1", "1"), row("Prices rose.", "1", "1", product="Digoxin"),
+            row("", "2", "N/A", product="N/A"), row("", "2", "N/A", product="N/A")]
+
+    assert merge_near_duplicate_allegations(rows) == (rows, 0)
@@ -0,0 +1,68 @@
+import pytest
+
+import clients
+import gemini_extraction
+from chunk_planning import segment_marker
+from gemini_extraction import analyze_text_chunk_with_gemini, chunk_segments, resolve_pin_cite_pages
+from llm_cache import LLMResultCache
+from offline_backends import FakeGeminiBackend
+
+PAGE_7 = "1. Mylan and Lannett allocated digoxin customers."
+PAGE_8 = "2. Teva raised the price of carbamazepine in 2014."
+
+
+def packed(*pages):
+    return "\n".join(f"{segment_marker(f'S{number}')}\n{text}" for number, text in enumerate(pages, start=1))
+
+
+class CountingBackend(FakeGeminiBackend):
+    def __init__(self):
+        super().__init__(latency_ms=1, latency_sigma=0.0, seed=1)
+        self.calls = 0
+
+    def generate_content(self, prompt, timeout=None, **kwargs):
+        self.calls += 1
+        return super().generate_content(prompt, timeout=timeout, **kwargs)
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    """Fake backend behind an enabled, empty result cache."""
+    backend = CountingBackend()
+    monkeypatch.setattr(clients, "gemini_backend_global", backend)
+    monkeypatch.setattr(gemini_extraction, "llm_result_cache", LLMResultCache(
+        str(tmp_path / "llm_cache.sqlite3"), memory_entries=16, max_bytes=1024 * 1024, max_age_days=30))
+    return backend
+
+
+def test_segment_ids_resolve_to_page_labels():
+    allegations = [{"Pin_Cite_Page": "S2"}, {"Pin_Cite_Page": "s1"}, {"Pin_Cite_Page": "page 9"}]
+
+    resolved = resolve_pin_cite_pages(allegations, "7-8", {"S1": "7", "S2": "8"})
+
+    assert [item["Pin_Cite_Page"] for item in resolved] == ["8", "7", "7-8"] # Unknown cites fall back to the chunk
+    assert resolve_pin_cite_pages([{"Pin_Cite_Page": "S5"}], "3 (part 1/2)", {"S1": "3"})[0]["Pin_Cite_Page"] == "3"
+
+
+def test_chunk_segments_split_on_markers():
+    assert chunk_segments(packed(PAGE_7, PAGE_8)) == [("S1", PAGE_7), ("S2", PAGE_8)]
+    assert chunk_segments(PAGE_7) == [(None, PAGE_7)]
+
+
+def test_cached_segments_are_reused_under_new_packing(backend):
+    first = analyze_text_chunk_with_gemini(packed(PAGE_7, PAGE_8), "7-8", "complaint", segment_labels={"S1": "7", "S2": "8"})
+    assert {(item["Product_Name"], item["Pin_Cite_Page"]) for item in first} == {("Digoxin", "7"), ("Carbamazepine", "8")}
+
+    # The same pages packed in the other order, at other page numbers, come from the cache
+    again = analyze_text_chunk_with_gemini(packed(PAGE_8, PAGE_7), "20-21", "complaint",
+                                           segment_labels={"S1": "20", "S2": "21"})
+
+    assert backend.calls == 1
+    assert {(item["Product_Name"], item["Pin_Cite_Page"]) for item in again} == {("Carbamazepine", "20"), ("Digoxin", "21")}
+
+
+def test_use_cache_false_calls_the_model_again(backend):
+    analyze_text_chunk_with_gemini(PAGE_7, "7", "complaint")
+    analyze_text_chunk_with_gemini(PAGE_7, "7", "complaint", use_cache=False)
+
+    assert backend.calls == 2
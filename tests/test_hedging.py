@@ -0,0 +1,147 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import clients
+import gemini_extraction
+import hedging as hedging_module
+from hedging import GeminiDeadlineExceeded, GeminiHedger, generate_with_deadline
+from scheduling import GeminiScheduler
+
+
+class ScriptedBackend:
+    """Backend whose n-th call takes delays[n] seconds (less once released), timing out like the SDK."""
+
+    def __init__(self, delays, text='{"allegations": []}'):
+        self.delays = list(delays)
+        self.text = text
+        self.calls = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, timeout=None):
+        with self._lock:
+            delay = self.delays[min(self.calls, len(self.delays) - 1)]
+            self.calls += 1
+        if timeout is not None and delay > timeout:
+            if not self.release.wait(timeout):
+                raise TimeoutError("504 Deadline Exceeded")
+        else:
+            self.release.wait(delay)
+        return SimpleNamespace(text=self.text, prompt_feedback=None, candidates=[])
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    """Fresh scheduler and hedger (hedging after 50 ms, up to one hedge in flight) around a scripted backend."""
+    scheduler = GeminiScheduler(max_concurrency=8, min_concurrency=1, initial_concurrency=2,
+                                requests_per_minute=0, tokens_per_minute=0)
+    hedger = GeminiHedger(percentile=95, window=10, min_samples=1, budget_fraction=1.0, min_delay=0.05,
+                          max_in_flight=1)
+    hedger.record_latency(0.05)
+    for module in (gemini_extraction, hedging_module): # Calls are queued in one and hedged in the other
+        monkeypatch.setattr(module, "gemini_scheduler", scheduler)
+    monkeypatch.setattr(hedging_module, "gemini_hedger", hedger)
+    monkeypatch.setattr(hedging_module, "GEMINI_HEDGE_ENABLED", True)
+    monkeypatch.setattr(hedging_module, "GEMINI_CALL_TIMEOUT_SECONDS", 2.0)
+
+    def use(backend):
+        monkeypatch.setattr(clients, "gemini_backend_global", backend)
+        return backend
+
+    yield SimpleNamespace(scheduler=scheduler, hedger=hedger, use=use)
+
+
+def test_hedge_delay_is_percentile_of_recent_latencies():
+    hedger = GeminiHedger(percentile=90, window=20, min_samples=5, budget_fraction=0.1, min_delay=0.5,
+                          max_in_flight=1)
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        hedger.record_latency(seconds)
+    assert hedger.hedge_delay() is None # Too little history
+
+    hedger.record_latency(0.3)
+    assert hedger.hedge_delay() == 0.5 # Never below min_delay
+
+    # The threshold is only re-sorted every THRESHOLD_REFRESH_SAMPLES calls
+    for seconds in range(1, GeminiHedger.THRESHOLD_REFRESH_SAMPLES + 1):
+        hedger.record_latency(float(seconds))
+    assert hedger.hedge_delay() == 15.0
+
+
+def test_try_spend_respects_token_budget_and_in_flight_cap():
+    hedger = GeminiHedger(percentile=95, window=10, min_samples=1, budget_fraction=0.5, min_delay=0.0,
+                          max_in_flight=1)
+    hedger.record_primary(1000)
+
+    assert not hedger.try_spend(600) # Over half the primary tokens
+    assert hedger.try_spend(400)
+    assert not hedger.try_spend(50) # One hedge is already in flight
+
+    snapshot = hedger.snapshot()
+    assert (snapshot["hedges"], snapshot["skipped_budget"], snapshot["skipped_in_flight"]) == (1, 1, 1)
+    assert snapshot["in_flight"] == 1
+
+
+def test_hedge_wins_and_holds_its_slot_until_the_loser_ends(hedging):
+    backend = hedging.use(ScriptedBackend([1.5, 0.0]))
+
+    response = generate_with_deadline("prompt", "7", None, 100)
+
+    assert response.text == '{"allegations": []}'
+    assert backend.calls == 2
+    assert hedging.hedger.snapshot()["hedge_wins"] == 1
+    # The primary is still running after the call returned, so the hedge still counts
+    assert hedging.hedger.in_flight() == 1
+    backend.release.set()
+    wait_for(lambda: hedging.hedger.in_flight() == 0)
+
+
+def test_no_second_hedge_while_one_is_in_flight(hedging):
+    backend = hedging.use(ScriptedBackend([1.5, 0.0, 0.3, 0.0]))
+    generate_with_deadline("prompt", "1", None, 100) # Leaves its losing primary running
+
+    generate_with_deadline("prompt", "2", None, 100)
+
+    assert backend.calls == 3 # The second call went without a hedge
+    assert hedging.hedger.snapshot()["skipped_in_flight"] == 1
+    backend.release.set()
+    wait_for(lambda: hedging.hedger.in_flight() == 0)
+
+
+def test_deadline_exceeded(hedging, monkeypatch):
+    monkeypatch.setattr(hedging_module, "GEMINI_CALL_TIMEOUT_SECONDS", 0.2)
+    backend = hedging.use(ScriptedBackend([5.0]))
+
+    with pytest.raises(GeminiDeadlineExceeded):
+        generate_with_deadline("prompt", "3", None, 100)
+
+    assert hedging.hedger.snapshot()["deadlines_exceeded"] == 1
+    backend.release.set()
+    wait_for(lambda: hedging.hedger.in_flight() == 0)
+
+
+@pytest.mark.parametrize("response, grows", [
+    (SimpleNamespace(text='{"allegations": []}', prompt_feedback=None, candidates=[]), True),
+    (SimpleNamespace(text='{"allegations": [{"Product_Name": "Digox', prompt_feedback=None, candidates=[]), True),
+    (SimpleNamespace(text="", prompt_feedback=None, candidates=[]), False),
+    (SimpleNamespace(text="", prompt_feedback=SimpleNamespace(block_reason=SimpleNamespace(name="SAFETY")),
+                     candidates=[]), False),
+    (SimpleNamespace(text="Sorry, I can't help with that.", prompt_feedback=None, candidates=[]), False),
+])
+def test_only_well_formed_answers_grow_the_concurrency_limit(hedging, monkeypatch, response, grows):
+    monkeypatch.setattr(hedging_module, "GEMINI_HEDGE_ENABLED", False)
+    monkeypatch.setattr(gemini_extraction, "GEMINI_CONTINUATION_MAX_DEPTH", 0)
+    hedging.use(SimpleNamespace(generate_content=lambda prompt, timeout=None: response))
+
+    gemini_extraction.request_allegations("1. Text.", "4")
+
+    assert (hedging.scheduler._limit > 2.0) is grows
@@ -0,0 +1,86 @@
+import pytest
+
+from chunk_planning import PlannedChunk
+from job_store import JobStore
+
+PAGES = [["1. Sandoz and Taro agreed to raise clobetasol prices in 2014."],
+         ["2. Mylan allocated digoxin customers with Lannett."]]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_job_is_claimed_once_and_tracks_progress(store):
+    store.create("job", "complaint.pdf", "job_complaint.pdf", {"report_format": "csv"})
+
+    assert store.claim("job") is True
+    assert store.claim("job") is False # Another worker lost the race
+    store.update("job", pages_total=3)
+    store.increment("job", pages_submitted=3, pages_collected=2)
+    store.increment("job", pages_collected=1, errors=1)
+    store.merge_stats("job", packing={"calls": 1})
+    store.increment_stats("job", "json_salvage", repaired=2)
+    store.increment_stats("job", "json_salvage", repaired=1)
+
+    job = store.get("job")
+    assert (job["status"], job["pages_total"], job["pages_collected"], job["errors"]) == ("running", 3, 3, 1)
+    assert job["options"] == {"report_format": "csv"}
+    assert job["stats"] == {"packing": {"calls": 1}, "json_salvage": {"repaired": 3}}
+    assert store.get("missing") is None
+
+
+def test_unknown_fields_are_rejected(store):
+    store.create("job", "complaint.pdf", "job_complaint.pdf")
+
+    with pytest.raises(ValueError):
+        store.update("job", original_filename="other.pdf")
+    with pytest.raises(ValueError):
+        store.increment("job", pages_total=1)
+
+
+def test_page_results_are_reassembled_in_page_order(store):
+    store.create("job", "complaint.pdf", "job_complaint.pdf")
+    store.record_page_result("job", "10", [{"Product_Name": "Digoxin"}])
+    store.record_page_result("job", "2-3", [{"Product_Name": "Clobetasol"}])
+    store.record_page_result("job", "4", [{"Product_Name": "ERROR"}])
+
+    assert [row["Product_Name"] for row in store.job_rows("job")] == ["Clobetasol", "ERROR", "Digoxin"]
+    assert store.settled_page_ids("job") == {"10", "2-3"} # ERROR rows are retried on resume
+
+
+def test_chunk_plan_marks_each_page_final_once(store):
+    store.create("job", "complaint.pdf", "job_complaint.pdf")
+    store.record_chunk("job", 0, PlannedChunk("3 (part 1/2)", "a", {"S1": "3"}, ["3"], 10, []))
+    store.record_chunk("job", 1, PlannedChunk("3 (part 2/2)", "b", {"S1": "3"}, ["3"], 10, ["3"]))
+    store.record_chunk("job", 2, PlannedChunk("4", "c", {"S1": "4"}, ["4"], 10, ["4"]))
+
+    chunks = store.planned_chunks("job")
+
+    assert [chunk.chunk_id for chunk in chunks] == ["3 (part 1/2)", "3 (part 2/2)", "4"]
+    assert [chunk.final_pages for chunk in chunks] == [[], ["3"], ["4"]]
+
+
+def test_interrupted_running_jobs_are_requeued(store):
+    store.create("running", "a.pdf", "running_a.pdf")
+    store.create("queued", "b.pdf", "queued_b.pdf")
+    store.claim("running")
+    store.increment("running", pages_submitted=2, pages_collected=1)
+
+    assert store.requeue_interrupted(stale_seconds=3600) == ["queued"] # Still making progress
+    assert store.requeue_interrupted(stale_seconds=-1) == ["running", "queued"]
+    job = store.get("running")
+    assert (job["status"], job["pages_submitted"], job["pages_collected"]) == ("queued", 0, 0)
+
+
+def test_analyze_job_lifecycle(client, run_job):
+    job = run_job(PAGES)
+
+    status = client.get(f"/jobs/{job['job_id']}").get_json()
+    assert status["job_status"] == "succeeded"
+    assert status["progress"]["pages_total"] == status["progress"]["pages_collected"] == 2
+    assert status["excel_filename"]
+    assert status["results"] and all(row["Product_Name"] != "ERROR" for row in status["results"])
+    assert "results" not in client.get(f"/jobs/{job['job_id']}?include_results=0").get_json()
+    assert client.get("/jobs/no-such-job").status_code == 404
@@ -0,0 +1,66 @@
+import json
+from functools import partial
+
+import pytest
+
+import analysis_jobs
+from job_store import job_store
+
+FILLER = " The increase was coordinated in calls and meetings among the defendants' sales executives." * 4
+PAGES = [["1. Sandoz and Taro agreed to raise clobetasol prices in 2014." + FILLER],
+         ["2. Mylan allocated digoxin customers with Lannett." + FILLER],
+         ["3. Teva followed the carbamazepine price increase." + FILLER]]
+
+
+def read_events(response):
+    """[(event, id, data)] from a finished text/event-stream response."""
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields["event"], fields.get("id"), json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture(autouse=True)
+def page_per_chunk(monkeypatch):
+    """Sends each (roughly 100-token) page on its own, so each one is a separate page event."""
+    monkeypatch.setattr(analysis_jobs, "ChunkPlanner", partial(analysis_jobs.ChunkPlanner, token_budget=150))
+
+
+def test_stream_sends_each_page_once_with_an_id(client, run_job):
+    job = run_job(PAGES)
+
+    events = read_events(client.get(f"/jobs/{job['job_id']}/stream"))
+
+    pages = [(int(event_id), data["page_id"]) for event, event_id, data in events if event == "page"]
+    assert sorted(page_id for _, page_id in pages) == ["1", "2", "3"]
+    assert [seq for seq, _ in pages] == sorted(seq for seq, _ in pages)
+    assert events[-1][0] == "complete" and events[-1][2]["job_status"] == "succeeded"
+
+
+def test_stream_resumes_after_last_event_id(client, run_job):
+    job = run_job(PAGES)
+    seqs = [seq for seq, _, _ in job_store.page_results_since(job["job_id"])]
+
+    events = read_events(client.get(f"/jobs/{job['job_id']}/stream", headers={"Last-Event-ID": str(seqs[0])}))
+
+    assert [int(event_id) for event, event_id, _ in events if event == "page"] == seqs[1:]
+    assert events[-1][0] == "complete"
+
+
+def test_rerun_page_is_sent_again_under_a_new_id(client, run_job):
+    # The page's earlier rows are replaced, so the client swaps its preview rows by page_id
+    job = run_job(PAGES)
+    last_seq = job_store.page_results_since(job["job_id"])[-1][0]
+    job_store.record_page_result(job["job_id"], "1", [{"Product_Name": "Clobetasol"}])
+
+    events = read_events(client.get(f"/jobs/{job['job_id']}/stream", headers={"Last-Event-ID": str(last_seq)}))
+
+    pages = [(int(event_id), data["page_id"]) for event, event_id, data in events if event == "page"]
+    assert len(pages) == 1 and pages[0][0] > last_seq and pages[0][1] == "1"
+    assert [page_id for _, page_id, _ in job_store.page_results_since(job["job_id"])].count("1") == 1
+
+
+def test_stream_for_unknown_job_is_404(client):
+    assert client.get("/jobs/no-such-job/stream").status_code == 404
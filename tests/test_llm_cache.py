@@ -0,0 +1,71 @@
+import pytest
+
+import llm_cache
+from llm_cache import LLMResultCache
+
+ALLEGATIONS = [{"Product_Name": "Digoxin", "Pin_Cite_Page": "S1"}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResultCache(str(tmp_path / "llm_cache.sqlite3"), memory_entries=2, max_bytes=1024 * 1024, max_age_days=30)
+
+
+def test_key_covers_text_model_and_prompt_version():
+    key = LLMResultCache.make_key("1. Mylan raised digoxin prices.", "model-a", "v1")
+
+    assert key == LLMResultCache.make_key("1. Mylan raised digoxin prices.", "model-a", "v1")
+    assert key != LLMResultCache.make_key("1. Mylan raised digoxin prices!", "model-a", "v1")
+    assert key != LLMResultCache.make_key("1. Mylan raised digoxin prices.", "model-b", "v1")
+    assert key != LLMResultCache.make_key("1. Mylan raised digoxin prices.", "model-a", "v2")
+
+
+def test_hits_come_from_memory_then_disk(cache, tmp_path):
+    cache.put("key", ALLEGATIONS)
+
+    assert cache.get("key") == ALLEGATIONS
+    assert cache.get("missing") is None
+    # A new process starts with an empty memory tier but the same file
+    reopened = LLMResultCache(cache.db_path, memory_entries=2, max_bytes=1024 * 1024, max_age_days=30)
+    assert reopened.get("key") == ALLEGATIONS
+
+    assert (cache.stats()["memory_hits"], cache.stats()["misses"]) == (1, 1)
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_invalidate_stale_keeps_current_prompt_version(cache, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(llm_cache, "PROMPT_TEMPLATE_VERSION", "old-prompt")
+        cache.put("old", ALLEGATIONS)
+    cache.put("current", ALLEGATIONS)
+
+    assert cache.invalidate(stale_only=True) == 1
+    assert cache.get("old") is None
+    assert cache.get("current") == ALLEGATIONS
+
+    assert cache.invalidate(stale_only=False) == 1
+    assert cache.get("current") is None
+
+
+def test_prune_evicts_least_recently_used_over_the_size_limit(tmp_path):
+    cache = LLMResultCache(str(tmp_path / "llm_cache.sqlite3"), memory_entries=0, max_bytes=150, max_age_days=30)
+    for key in ("a", "b", "c"):
+        cache.put(key, ALLEGATIONS) # About 60 bytes each
+
+    assert cache.prune() >= 1
+    assert cache.get("a") is None
+    assert cache.get("c") == ALLEGATIONS
+
+
+def test_disabled_cache_never_stores(tmp_path):
+    cache = LLMResultCache(str(tmp_path / "llm_cache.sqlite3"), memory_entries=2, max_bytes=1024, max_age_days=30,
+                           enabled=False)
+    cache.put("key", ALLEGATIONS)
+
+    assert cache.get("key") is None
+
+
+def test_cache_routes(client):
+    assert client.get("/cache/stats").get_json()["cache"]["prompt_version"] == llm_cache.PROMPT_TEMPLATE_VERSION
+    assert client.post("/cache/invalidate", data={"scope": "everything"}).status_code == 400
+    assert client.post("/cache/invalidate", json={"scope": "all"}).get_json()["scope"] == "all"
@@ -0,0 +1,48 @@
+from observability import MetricsRegistry, StageTimings
+
+PAGES = [["1. Mylan and Lannett allocated digoxin customers."],
+         ["2. Teva raised the price of carbamazepine in 2014."]]
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "Calls by outcome.")
+    registry.histogram("call_seconds", "Call latency.", buckets=(0.1, 1))
+    registry.inc("calls_total", outcome="success")
+    registry.inc("calls_total", 2, outcome="success")
+    registry.observe("call_seconds", 0.5, outcome='say "hi"')
+
+    lines = registry.render({"queue_depth": ("Calls waiting.", 3)}).splitlines()
+
+    assert "# TYPE calls_total counter" in lines
+    assert 'calls_total{outcome="success"} 3' in lines
+    assert 'call_seconds_bucket{outcome="say \\"hi\\"",le="0.1"} 0' in lines
+    assert 'call_seconds_bucket{outcome="say \\"hi\\"",le="1"} 1' in lines
+    assert 'call_seconds_bucket{outcome="say \\"hi\\"",le="+Inf"} 1' in lines
+    assert 'call_seconds_count{outcome="say \\"hi\\""} 1' in lines
+    assert lines[-3:] == ["# HELP queue_depth Calls waiting.", "# TYPE queue_depth gauge", "queue_depth 3"]
+
+
+def test_stage_timings_sum_repeated_stages():
+    timings = StageTimings()
+    timings.add("gemini_call", 0.25)
+    timings.add("gemini_call", 0.5)
+    timings.add("dedupe", 0.1)
+
+    assert timings.summary() == {"gemini_call": {"seconds": 0.75, "count": 2}, "dedupe": {"seconds": 0.1, "count": 1}}
+
+
+def test_job_reports_its_stage_breakdown_and_metrics_are_scraped(client, run_job):
+    job = run_job(PAGES)
+
+    timings = client.get(f"/jobs/{job['job_id']}", query_string={"include_results": 0}).get_json()["stats"]["timings"]
+    assert {"pdf_extraction", "gemini_call", "report_write_upload"} <= set(timings)
+    assert timings["gemini_call"]["count"] >= 1
+
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert 'gemini_calls_total{outcome="success"}' in text
+    assert 'analyzer_stage_seconds_count{stage="report_write_upload"}' in text
+    assert 'analysis_jobs_total{status="succeeded"}' in text
+    assert "analysis_jobs_running 0" in text
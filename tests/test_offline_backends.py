@@ -0,0 +1,64 @@
+import json
+
+import pytest
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+from allegation_prompt import ALLEGATION_PROMPT_TEMPLATE
+from chunk_planning import segment_marker
+from offline_backends import DeadlineExceeded, FakeGeminiBackend, InMemoryBlobServiceClient, ResourceExhausted
+
+CHUNK = (f"{segment_marker('S1')}\n1. Mylan and Lannett allocated digoxin customers.\n"
+         f"{segment_marker('S2')}\n2. Teva raised the price of carbamazepine and digoxin in 2014.\n"
+         "3. Venue is proper in this District.")
+
+
+def fake(**kwargs):
+    return FakeGeminiBackend(**dict(dict(latency_ms=1, latency_sigma=0.0, seed=1), **kwargs))
+
+
+def test_fake_gemini_cites_each_drug_to_its_paragraph_and_segment():
+    response = fake().generate_content(ALLEGATION_PROMPT_TEMPLATE.format(text_chunk=CHUNK))
+
+    allegations = json.loads(response.text)["allegations"]
+    assert [(item["Product_Name"], item["Pin_Cite_Page"], item["Pin_Cite_Paragraph"]) for item in allegations] == [
+        ("Digoxin", "S1", "1"), ("Carbamazepine", "S2", "2"), ("Digoxin", "S2", "2")]
+    assert allegations[0]["Involved_Defendants_CoConspirators"] == "Mylan, Lannett"
+    assert allegations[1]["Allegation_Category"] == "Price Fixing"
+
+
+def test_fake_gemini_failure_modes():
+    prompt = ALLEGATION_PROMPT_TEMPLATE.format(text_chunk=CHUNK)
+
+    with pytest.raises(ResourceExhausted) as throttled:
+        fake(throttle_rate=1.0).generate_content(prompt)
+    assert throttled.value.code == 429
+    with pytest.raises(DeadlineExceeded):
+        fake(latency_ms=500).generate_content(prompt, timeout=0.01)
+    truncated = fake(truncate_rate=1.0).generate_content(prompt).text
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(truncated)
+
+
+def test_in_memory_blob_storage_round_trip():
+    service = InMemoryBlobServiceClient.from_connection_string("memory")
+    service.create_container("outputs")
+    with pytest.raises(ResourceExistsError):
+        service.create_container("outputs")
+    blob = service.get_blob_client("outputs", "job_report.xlsx")
+
+    blob.upload_blob(iter([b"report ", b"bytes"]))
+    with pytest.raises(ResourceExistsError):
+        blob.upload_blob(b"again")
+    blob.upload_blob(b"report bytes v2", overwrite=True)
+
+    assert blob.download_blob().readall() == b"report bytes v2"
+    assert blob.download_blob(offset=7, length=5).readall() == b"bytes"
+    assert blob.get_blob_properties().size == 15
+    assert [item.name for item in service.get_container_client("outputs").list_blobs(name_starts_with="job_")] == \
+        ["job_report.xlsx"]
+    blob.delete_blob()
+    assert not blob.exists()
+    with pytest.raises(ResourceNotFoundError):
+        blob.download_blob()
+    with pytest.raises(ResourceNotFoundError):
+        service.get_blob_client("missing", "blob").upload_blob(b"data")
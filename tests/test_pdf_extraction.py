@@ -0,0 +1,71 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+import pdf_extraction
+import pdf_pool
+from pdf_extraction import iter_page_batches, plan_batches
+from synthetic_complaints import write_pdf
+
+PAGES = [[f"{number}. Defendants raised the price of Digoxin on page {number}."] for number in range(1, 6)]
+
+
+@pytest.fixture(scope="module")
+def pdf_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pdf") / "complaint.pdf")
+    write_pdf(PAGES, path)
+    return path
+
+
+def page_numbers(batches):
+    return sorted(number for batch in batches for number, _ in batch)
+
+
+def test_plan_batches_covers_every_page_once():
+    assert plan_batches(5, 2) == [(0, 2), (2, 4), (4, 5)]
+    assert plan_batches(3, 0) == [(0, 1), (1, 2), (2, 3)] # At least one page per batch
+    assert plan_batches(0, 8) == []
+
+
+def test_inline_extraction_yields_pages_in_order(pdf_path):
+    batches = list(iter_page_batches(pdf_path, 5, batch_pages=2))
+
+    assert [[number for number, _ in batch] for batch in batches] == [[1, 2], [3, 4], [5]]
+    assert "page 3" in dict(batches[1])[3]
+
+
+def test_process_pool_matches_inline_extraction(pdf_path):
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pooled = list(iter_page_batches(pdf_path, 5, pool=pool, batch_pages=2))
+
+    inline = list(iter_page_batches(pdf_path, 5, batch_pages=2))
+    assert sorted(page for batch in pooled for page in batch) == sorted(page for batch in inline for page in batch)
+
+
+class CountingPool(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=4)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+def test_max_pending_bounds_batches_ahead_of_the_consumer(monkeypatch):
+    monkeypatch.setattr(pdf_extraction, "extract_page_range", lambda path, start, end: [(start + 1, "")])
+
+    with CountingPool() as pool:
+        batches = iter_page_batches("complaint.pdf", 6, pool=pool, batch_pages=1, max_pending=2)
+        first = next(batches)
+        assert pool.submitted == 2 # Nothing more starts until the first batch has been handled
+        rest = list(batches)
+
+    assert page_numbers([first] + rest) == [1, 2, 3, 4, 5, 6]
+
+
+def test_single_process_setting_extracts_inline(monkeypatch):
+    monkeypatch.setattr(pdf_pool, "PDF_EXTRACTION_PROCESSES", 1)
+
+    assert pdf_pool.get_pdf_extraction_pool() is None
@@ -0,0 +1,83 @@
+import pytest
+
+import analysis_jobs
+import relevance_prefilter
+from job_store import job_store
+from relevance_prefilter import PREFILTER_DRUG_NAMES_PATH, RelevancePrefilter, format_page_ranges
+
+BOILERPLATE = ["1. This Court has subject matter jurisdiction under 28 U.S.C. 1331. Venue is proper in this District.",
+               "2. Plaintiffs demand a trial by jury on all claims so triable."]
+# Neither in the drug-name dictionary nor matched by a stem or dosage form
+UNKNOWN_PRODUCT = ["3. Sandoz and Taro agreed to raise the price of Zorvatrin in 2014."]
+
+
+@pytest.fixture(scope="module")
+def prefilter():
+    return RelevancePrefilter(PREFILTER_DRUG_NAMES_PATH, threshold=0.25, mode="enforce")
+
+
+@pytest.mark.parametrize("text, relevant", [
+    ("Sandoz and Taro conspired to fix the price of Clobetasol.", True), # Dictionary name
+    ("Mylan and Lannett allocated customers for Zorvatrin 20 mg tablets.", True), # Dosage form
+    ("Defendants agreed to raise the price of Zorvatrin, a generic drug.", True), # Introduced as a drug
+    (" ".join(BOILERPLATE), False),
+])
+def test_score_relevance(prefilter, text, relevant):
+    assert prefilter.score([text])[0].relevant is relevant
+
+
+def test_score_reports_dictionary_terms(prefilter):
+    scores = prefilter.score(["Taro raised Clobetasol and Digoxin prices.", "Venue is proper."])
+
+    assert scores[0].drug_terms == ["clobetasol", "digoxin"]
+    assert scores[1].drug_terms == []
+
+
+@pytest.mark.parametrize("page_ids, expected", [
+    (["3", "4", "5", "9"], "3-5, 9"),
+    (["9", "3", "4"], "3-4, 9"),
+    (["DOCX_Chunk_2", "7"], "7, DOCX_Chunk_2"),
+    ([], ""),
+])
+def test_format_page_ranges(page_ids, expected):
+    assert format_page_ranges(page_ids) == expected
+
+
+def test_audit_mode_sends_out_of_dictionary_product_page(run_job):
+    assert relevance_prefilter.PREFILTER_MODE == "audit" # The default
+
+    job = run_job([BOILERPLATE, UNKNOWN_PRODUCT])
+
+    assert job["status"] == "succeeded"
+    # Scored below the threshold and reported, but still sent to the LLM
+    assert job["stats"]["prefilter"]["mode"] == "audit"
+    assert job["stats"]["prefilter"]["pages_skipped"] == 0
+    assert job["stats"]["prefilter"]["flagged_page_ranges"] == "1-2"
+    assert [record["Pre-filter Action"] for record in job["stats"]["prefilter_skipped_pages"]] == \
+        ["Analyzed (audit only)"] * 2
+    sent_text = "".join(chunk.text for chunk in job_store.planned_chunks(job["job_id"]))
+    assert "Zorvatrin" in sent_text
+    assert job["pages_collected"] == job["pages_total"] == 2
+
+
+def test_enforce_mode_records_skipped_page_ranges(run_job, prefilter, monkeypatch):
+    monkeypatch.setattr(analysis_jobs, "get_relevance_prefilter", lambda: prefilter)
+
+    job = run_job([BOILERPLATE, ["4. Teva and Mylan agreed to raise the price of Digoxin."], BOILERPLATE])
+
+    assert job["stats"]["prefilter"]["pages_skipped"] == 2
+    assert job["stats"]["prefilter"]["skipped_page_ranges"] == "1, 3"
+    sent_text = "".join(chunk.text for chunk in job_store.planned_chunks(job["job_id"]))
+    assert "Digoxin" in sent_text and "jurisdiction" not in sent_text
+
+
+def test_amendment_mode_bypasses_prefilter(run_job, prefilter, monkeypatch):
+    monkeypatch.setattr(analysis_jobs, "get_relevance_prefilter", lambda: prefilter)
+    baseline = run_job([BOILERPLATE, ["3. Teva and Mylan agreed to raise the price of Digoxin."]])
+
+    amended = run_job([BOILERPLATE, UNKNOWN_PRODUCT], baseline_job_id=baseline["job_id"])
+
+    assert amended["status"] == "succeeded"
+    assert amended["stats"]["prefilter"]["enabled"] is False
+    sent_text = "".join(chunk.text for chunk in job_store.planned_chunks(amended["job_id"]))
+    assert "Zorvatrin" in sent_text
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import routes
+from report_cache import ReportFileCache
+
+PAGES = [["1. Mylan and Lannett allocated digoxin customers."],
+         ["2. Teva raised the price of carbamazepine in 2014."]]
+
+
+def cache_report(cache, blob_name, data, etag):
+    path = cache.reserve()
+    with open(path, "wb") as report:
+        report.write(data)
+    cache.commit(blob_name, path, etag)
+
+
+def test_committed_reports_survive_a_new_process(tmp_path):
+    cache = ReportFileCache(str(tmp_path), max_bytes=1024)
+    cache_report(cache, "job_complaint-analysis.csv", b"a,b\n1,2\n", '"etag-1"')
+
+    reopened = ReportFileCache(str(tmp_path), max_bytes=1024)
+    entry = reopened.get("job_complaint-analysis.csv")
+
+    assert (entry.size, entry.etag) == (8, '"etag-1"')
+    with open(entry.path, "rb") as report:
+        assert report.read() == b"a,b\n1,2\n"
+    assert reopened.get("other.csv") is None
+
+
+def test_least_recently_used_reports_are_evicted(tmp_path):
+    cache = ReportFileCache(str(tmp_path), max_bytes=250)
+    cache_report(cache, "a.csv", b"a" * 100, None)
+    cache_report(cache, "b.csv", b"b" * 100, None)
+    cache.get("a.csv") # Now more recent than b
+    cache_report(cache, "c.csv", b"c" * 100, None)
+
+    assert cache.get("b.csv") is None
+    assert cache.get("a.csv") and cache.get("c.csv")
+    cache_report(cache, "huge.csv", b"h" * 1000, None)
+    assert cache.get("huge.csv") # The newest report is always kept
+
+
+def test_report_removed_by_another_process_is_a_miss(tmp_path):
+    cache = ReportFileCache(str(tmp_path), max_bytes=1024)
+    cache_report(cache, "a.csv", b"report", None)
+    os.remove(cache.get("a.csv").path)
+
+    assert cache.get("a.csv") is None
+
+
+@pytest.fixture(params=["report cache", "blob storage"])
+def report(request, run_job, monkeypatch):
+    """A finished job's CSV report, served from the local report cache or straight from blob storage."""
+    job = run_job(PAGES, report_format="csv")
+    if request.param == "blob storage":
+        monkeypatch.setattr(routes, "report_cache", None)
+    return job["excel_filename"]
+
+
+def test_download_report_honours_range_and_etag(client, report):
+    full = client.get(f"/download_report/{report}")
+    assert full.status_code == 200 and full.mimetype == "text/csv"
+    assert full.headers["Content-Disposition"].endswith("complaint-analysis.csv")
+    body, etag = full.get_data(), full.headers["ETag"]
+
+    partial = client.get(f"/download_report/{report}", headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.get_data() == body[:10]
+    assert partial.headers["Content-Range"] == f"bytes 0-9/{len(body)}"
+
+    assert client.get(f"/download_report/{report}", headers={"If-None-Match": etag}).status_code == 304
+    # A stale If-Range gets the whole file rather than a mismatched piece
+    assert client.get(f"/download_report/{report}", headers={"Range": "bytes=0-9", "If-Range": '"old"'}).status_code == 200
@@ -0,0 +1,104 @@
+import csv
+import io
+
+import pytest
+
+import reports
+from offline_backends import InMemoryBlobServiceClient
+from reports import (
+    REPORT_COLUMNS, report_sort_order, stream_report_to_blob, unique_sheet_name, upload_report_streaming,
+    write_batch_xlsx_report
+)
+
+HEADERS = [header for _, header in REPORT_COLUMNS]
+SKIPPED = [{"Page/Chunk": "1", "Pre-filter Action": "Skipped", "Relevance Score": 0.02, "Drug Terms Found": "",
+            "Text Snippet": "Venue is proper."}]
+
+
+def row(product, page, paragraph="1"):
+    return {"Product_Name": product, "Allegation_Category": "Price Fixing", "Specific_Allegation_Summary": "Summary",
+            "Complaint_Name": "Complaint", "Involved_Defendants_CoConspirators": "Teva", "Other_Named_Entities": "N/A",
+            "Pin_Cite_Page": page, "Pin_Cite_Paragraph": paragraph}
+
+
+ROWS = [row("Digoxin", "10"), row("Clobetasol", "DOCX_Chunk_1"), row("Digoxin", "9"), row("Clobetasol", "2")]
+
+
+@pytest.fixture
+def blob():
+    service = InMemoryBlobServiceClient()
+    service.create_container("outputs")
+    return service.get_blob_client("outputs", "job_complaint-analysis")
+
+
+def test_rows_sort_by_product_then_page_number():
+    order = report_sort_order(ROWS)
+
+    assert [(ROWS[i]["Product_Name"], ROWS[i]["Pin_Cite_Page"]) for i in order] == [
+        ("Clobetasol", "2"), ("Clobetasol", "DOCX_Chunk_1"), ("Digoxin", "9"), ("Digoxin", "10")]
+
+
+def test_csv_report_carries_skipped_pages_as_marked_rows(blob):
+    size = upload_report_streaming(blob, "csv", ROWS, SKIPPED, "Complaint")
+
+    data = blob.download_blob().readall()
+    assert len(data) == size and data.startswith(b"\xef\xbb\xbf") # BOM for Excel
+    lines = list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+    assert lines[0] == HEADERS
+    assert [line[6] for line in lines[1:5]] == ["2", "DOCX_Chunk_1", "9", "10"]
+    assert lines[5][1] == "Skipped by relevance pre-filter" and lines[5][6] == "1"
+
+
+def test_parquet_report_round_trips(blob, monkeypatch):
+    import pandas as pd
+    monkeypatch.setattr(reports, "REPORT_BATCH_ROWS", 2) # Several row groups
+
+    upload_report_streaming(blob, "parquet", ROWS, SKIPPED, "Complaint")
+
+    table = pd.read_parquet(io.BytesIO(blob.download_blob().readall()))
+    assert list(table.columns) == HEADERS
+    assert list(table["Pin Cite (Page/Chunk)"]) == ["2", "DOCX_Chunk_1", "9", "10", "1"]
+
+
+def test_xlsx_report_has_a_skipped_pages_sheet(blob):
+    from openpyxl import load_workbook
+
+    upload_report_streaming(blob, "xlsx", ROWS, SKIPPED, "Complaint")
+
+    workbook = load_workbook(io.BytesIO(blob.download_blob().readall()), read_only=True)
+    assert workbook.sheetnames == ["Sheet1", "Skipped Pages"]
+    sheet_rows = list(workbook["Sheet1"].values)
+    assert list(sheet_rows[0]) == HEADERS and len(sheet_rows) == 5
+
+
+def test_batch_workbook_sheets():
+    from openpyxl import load_workbook
+    documents = [dict(complaint_name=name, original_filename=f"{name}.pdf", status="succeeded", pages=2, errors=0,
+                      message=None, rows=[dict(entry, Complaint_Name=name) for entry in ROWS[:2]])
+                 for name in ("In re: Generic Drugs [Teva]", "In re: Generic Drugs [Teva]")]
+    stream = io.BytesIO()
+
+    write_batch_xlsx_report(stream, documents)
+
+    workbook = load_workbook(io.BytesIO(stream.getvalue()), read_only=True)
+    assert workbook.sheetnames == ["Batch Summary", "All Complaints", "In re_ Generic Drugs _Teva_",
+                                   "In re_ Generic Drugs _Teva_ (2)"]
+    assert len(list(workbook["All Complaints"].values)) == 5
+
+
+def test_unique_sheet_name_fits_excel_limits():
+    used = {"batch summary"}
+
+    assert unique_sheet_name("Batch Summary", used) == "Batch Summary (2)"
+    assert len(unique_sheet_name("x" * 40, used)) == 31
+    assert unique_sheet_name("x" * 40, used) == "x" * 27 + " (2)"
+
+
+def test_failed_writer_leaves_no_blob(blob):
+    def write_report(stream):
+        stream.write(b"partial")
+        raise RuntimeError("writer failed")
+
+    with pytest.raises(RuntimeError):
+        stream_report_to_blob(blob, "text/csv", write_report)
+    assert not blob.exists()
@@ -0,0 +1,105 @@
+import pytest
+
+from response_parsing import continuation_chunks, salvage_allegations, strip_code_fence
+
+FIRST = '{"Product_Name": "Clobetasol", "Pin_Cite_Page": "S1", "Pin_Cite_Paragraph": "1"}'
+SECOND = '{"Product_Name": "Digoxin", "Pin_Cite_Page": "S1", "Pin_Cite_Paragraph": "2"}'
+
+
+@pytest.mark.parametrize("response, products, list_closed, malformed", [
+    # Valid JSON still salvages to the same objects
+    (f'{{"allegations": [{FIRST}, {SECOND}]}}', ["Clobetasol", "Digoxin"], True, 0),
+    # Truncated mid-object: the complete objects before it are kept
+    (f'{{"allegations": [{FIRST}, {{"Product_Name": "Digox', ["Clobetasol"], False, 0),
+    # Truncated inside a string that contains braces
+    (f'{{"allegations": [{FIRST}, {{"Product_Name": "Digoxin {{tablets', ["Clobetasol"], False, 0),
+    # Cut off between objects
+    (f'{{"allegations": [{FIRST},', ["Clobetasol"], False, 0),
+    (f'{{"allegations": [{FIRST}, {SECOND}\n', ["Clobetasol", "Digoxin"], False, 0),
+    # Trailing comma inside an object is cleaned up for that object only
+    (f'{{"allegations": [{{"Product_Name": "Clobetasol", "Pin_Cite_Page": "S1",}}, {SECOND}]}}',
+     ["Clobetasol", "Digoxin"], True, 0),
+    # An object that is still invalid after cleanup is counted and skipped
+    (f'{{"allegations": [{{"Product_Name": Clobetasol}}, {SECOND}]}}', ["Digoxin"], True, 1),
+    # Garbage where the next object should start
+    (f'{{"allegations": [{FIRST} oops {SECOND}]}}', ["Clobetasol"], False, 0),
+    # An empty list
+    ('{"allegations": []}', [], True, 0),
+])
+def test_salvage_allegations(response, products, list_closed, malformed):
+    allegations, closed, bad = salvage_allegations(response)
+
+    assert [item["Product_Name"] for item in allegations] == products
+    assert (closed, bad) == (list_closed, malformed)
+
+
+@pytest.mark.parametrize("response", [
+    '{"results": [{"Product_Name": "Clobetasol"}]}',
+    '[{"Product_Name": "Clobetasol"}]',
+    "I could not find any allegations on this page.",
+    "",
+])
+def test_salvage_allegations_without_allegations_key(response):
+    assert salvage_allegations(response) == (None, False, 0)
+
+
+@pytest.mark.parametrize("response, expected", [
+    (f'```json\n{{"allegations": [{FIRST}]}}\n```', f'{{"allegations": [{FIRST}]}}'),
+    (f'```\n{{"allegations": [{FIRST}]}}```', f'{{"allegations": [{FIRST}]}}'),
+    # Unclosed fence: the response was cut off before the closing backticks
+    (f'```json\n{{"allegations": [{FIRST}, {{"Product', f'{{"allegations": [{FIRST}, {{"Product'),
+    ("```json", ""),
+    (f'{{"allegations": [{FIRST}]}}', f'{{"allegations": [{FIRST}]}}'),
+])
+def test_strip_code_fence(response, expected):
+    assert strip_code_fence(response) == expected
+
+
+def test_salvage_after_unclosed_code_fence():
+    response = strip_code_fence(f'```json\n{{"allegations": [{FIRST}, {SECOND}, {{"Product_Name": "Dig')
+
+    allegations, closed, _ = salvage_allegations(response)
+
+    assert [item["Product_Name"] for item in allegations] == ["Clobetasol", "Digoxin"]
+    assert closed is False
+
+
+MULTI_SEGMENT = ("=== SEGMENT S1 ===\n1. Sandoz and Taro fixed prices.\n2. Prices rose.\n"
+                 "=== SEGMENT S2 ===\n3. Mylan allocated customers.\n4. Lannett followed.\n5. Purchasers overpaid.")
+UNMARKED = "1. Sandoz and Taro fixed prices.\n2. Prices rose.\n3. Mylan allocated customers.\n4. Lannett followed."
+
+
+def cite(page, paragraph):
+    return {"Product_Name": "Clobetasol", "Pin_Cite_Page": page, "Pin_Cite_Paragraph": paragraph}
+
+
+@pytest.mark.parametrize("text_chunk, recovered, expected", [
+    # Resume inside a later segment, at the last recovered paragraph, under its own marker
+    (MULTI_SEGMENT, [cite("S1", "1"), cite("S2", "4")],
+     ["=== SEGMENT S2 ===\n4. Lannett followed.\n5. Purchasers overpaid."]),
+    # Segment IDs are matched case-insensitively; the latest segment wins regardless of order
+    (MULTI_SEGMENT, [cite("s2", "3"), cite("S1", "2")],
+     ["=== SEGMENT S2 ===\n3. Mylan allocated customers.\n4. Lannett followed.\n5. Purchasers overpaid."]),
+    # Resume inside the first segment keeps its marker and the rest of the chunk
+    (MULTI_SEGMENT, [cite("S1", "2")],
+     ["=== SEGMENT S1 ===\n2. Prices rose.\n=== SEGMENT S2 ===\n3. Mylan allocated customers.\n4. Lannett followed.\n5. Purchasers overpaid."]),
+    # A later segment with no usable paragraph cite restarts at the segment
+    (MULTI_SEGMENT, [cite("S2", "N/A")],
+     ["=== SEGMENT S2 ===\n3. Mylan allocated customers.\n4. Lannett followed.\n5. Purchasers overpaid."]),
+    # No progress point: split at the segment boundary
+    (MULTI_SEGMENT, [],
+     ["=== SEGMENT S1 ===\n1. Sandoz and Taro fixed prices.\n2. Prices rose.",
+      "=== SEGMENT S2 ===\n3. Mylan allocated customers.\n4. Lannett followed.\n5. Purchasers overpaid."]),
+    # Text without segment markers resumes at the paragraph, whatever page is cited
+    (UNMARKED, [cite("12", "3")], ["3. Mylan allocated customers.\n4. Lannett followed."]),
+    (UNMARKED, [cite("12", "1-2")], ["2. Prices rose.\n3. Mylan allocated customers.\n4. Lannett followed."]),
+    # ...and is split at the line nearest the middle without one
+    (UNMARKED, [], ["1. Sandoz and Taro fixed prices.\n2. Prices rose.",
+                    "\n3. Mylan allocated customers.\n4. Lannett followed."]),
+    (UNMARKED, [cite("12", "1")], ["1. Sandoz and Taro fixed prices.\n2. Prices rose.",
+                                   "\n3. Mylan allocated customers.\n4. Lannett followed."]),
+    # A single line can't be narrowed any further
+    ("1. Sandoz and Taro fixed prices.", [], []),
+])
+def test_continuation_chunks(text_chunk, recovered, expected):
+    assert continuation_chunks(text_chunk, recovered) == expected
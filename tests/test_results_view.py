@@ -0,0 +1,73 @@
+import gzip
+import json
+
+import pytest
+
+import results_view
+from results_view import ResultsViewCache
+
+PAGES = [[f"{n}. Teva and Mylan raised the price of digoxin again in 20{n:02d}." for n in range(1, 13)],
+         ["13. Sandoz and Taro agreed to raise the price of carbamazepine.",
+          "14. Lannett allocated digoxin customers with Mylan."]]
+
+
+def finished_job(rows, job_id="job", finished_at=1.0):
+    return {"job_id": job_id, "finished_at": finished_at, "results_json": json.dumps(rows)}
+
+
+def test_groups_are_sorted_with_errors_and_unnamed_products_last():
+    rows = [{"Product_Name": "ERROR", "Pin_Cite_Page": "4"}, {"Product_Name": "", "Pin_Cite_Page": "1"},
+            {"Product_Name": "digoxin", "Pin_Cite_Page": "DOCX_Chunk_2"}, {"Product_Name": "digoxin", "Pin_Cite_Page": "12"},
+            {"Product_Name": "Clobetasol", "Pin_Cite_Page": "3"}, {"Product_Name": "No Data", "Pin_Cite_Page": "5"}]
+
+    groups = ResultsViewCache(2).get(finished_job(rows))
+
+    assert list(groups) == ["Clobetasol", "digoxin", "ERROR", results_view.NO_PRODUCT_GROUP]
+    assert [row["Pin_Cite_Page"] for row in groups["digoxin"]] == ["12", "DOCX_Chunk_2"]
+
+
+def test_view_is_rebuilt_when_a_resumed_job_finishes_again():
+    cache = ResultsViewCache(2)
+    first = cache.get(finished_job([{"Product_Name": "Digoxin"}]))
+
+    assert cache.get(finished_job([])) is first
+    assert cache.get(finished_job([], finished_at=2.0)) == {}
+
+
+def test_results_are_paged_per_product(client, run_job):
+    job = run_job(PAGES)
+    url = f"/jobs/{job['job_id']}/results"
+
+    summary = client.get(url).get_json()
+    assert [(group["product_name"], group["count"]) for group in summary["groups"]] == [("Carbamazepine", 1),
+                                                                                       ("Digoxin", 13)]
+    page = client.get(url, query_string={"product": "Digoxin", "page": 2, "page_size": 5}).get_json()
+    assert (page["total"], page["pages"], len(page["results"])) == (13, 3, 5)
+    assert [row["Pin_Cite_Paragraph"] for row in page["results"]] == ["6", "7", "8", "9", "10"]
+    assert client.get(url, query_string={"product": "Aspirin"}).status_code == 404
+    assert client.get(url, query_string={"product": "Digoxin", "page": "x"}).status_code == 400
+
+
+def test_large_json_is_gzipped_when_accepted(client, run_job):
+    job = run_job(PAGES)
+    url = f"/jobs/{job['job_id']}"
+
+    plain = client.get(url)
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert json.loads(gzip.decompress(compressed.get_data()))["job_id"] == job["job_id"]
+    small = client.get("/jobs/no-such-job", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers # Below COMPRESSION_MIN_BYTES
+
+
+@pytest.mark.skipif(results_view.brotli is None, reason="brotli is not installed")
+def test_brotli_is_preferred_when_installed(client, run_job):
+    job = run_job(PAGES)
+
+    response = client.get(f"/jobs/{job['job_id']}", headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(results_view.brotli.decompress(response.get_data()))["job_id"] == job["job_id"]
@@ -0,0 +1,60 @@
+import time
+from functools import partial
+
+import pytest
+
+import analysis_jobs
+from conftest import JOB_TIMEOUT_SECONDS
+from job_store import job_store
+
+FILLER = " The increase was coordinated in calls and meetings among the defendants' sales executives." * 4
+PAGES = [["1. Sandoz and Taro agreed to raise clobetasol prices in 2014." + FILLER],
+         ["2. Mylan allocated digoxin customers with Lannett." + FILLER],
+         ["3. Teva followed the carbamazepine price increase." + FILLER]]
+
+
+@pytest.fixture
+def sent_chunks(monkeypatch):
+    """Sends each page on its own and records the chunk ids that reach the LLM."""
+    monkeypatch.setattr(analysis_jobs, "ChunkPlanner", partial(analysis_jobs.ChunkPlanner, token_budget=150))
+    sent = []
+    analyze_chunk = analysis_jobs.analyze_text_chunk_with_gemini
+
+    def recording_analyze_chunk(text_chunk, chunk_id, *args, **kwargs):
+        sent.append(chunk_id)
+        return analyze_chunk(text_chunk, chunk_id, *args, **kwargs)
+
+    monkeypatch.setattr(analysis_jobs, "analyze_text_chunk_with_gemini", recording_analyze_chunk)
+    return sent
+
+
+def wait_for_job(job_id):
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while job_store.get(job_id)["status"] not in ("succeeded", "failed"):
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.02)
+    return job_store.get(job_id)
+
+
+def test_resume_only_resends_errored_pages(client, run_job, sent_chunks):
+    job = run_job(PAGES)
+    assert sorted(sent_chunks) == ["1", "2", "3"]
+    job_store.record_page_result(job["job_id"], "2", [{"Product_Name": "ERROR", "Pin_Cite_Page": "2"}])
+    sent_chunks.clear()
+
+    response = client.post(f"/jobs/{job['job_id']}/resume")
+
+    assert response.status_code == 202
+    assert response.get_json()["chunks_to_retry"] == 1 and response.get_json()["plan_complete"] is True
+    resumed = wait_for_job(job["job_id"])
+    assert resumed["status"] == "succeeded"
+    assert sent_chunks == ["2"] # Pages 1 and 3 come from the checkpoint
+    assert all(row["Product_Name"] != "ERROR" for row in job_store.job_rows(job["job_id"]))
+    assert resumed["pages_collected"] == resumed["pages_total"] == 3
+
+
+def test_resume_is_refused_until_the_job_has_finished(client):
+    job_store.create("queued-resume-job", "complaint.pdf", "queued-resume-job_complaint.pdf")
+
+    assert client.post("/jobs/queued-resume-job/resume").status_code == 409
+    assert client.post("/jobs/no-such-job/resume").status_code == 404
@@ -0,0 +1,158 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from amendment import AMENDMENT_CARRYOVER_PAGE_ID
+from chunk_ordering import estimate_chunk_cost, page_order_key, predicted_makespan
+from chunk_planning import ChunkPlanner
+from scheduling import GeminiScheduler, RequeueTask, TokenBucket, classify_gemini_error
+
+
+def make_scheduler(max_concurrency=1, initial_concurrency=1, **kwargs):
+    return GeminiScheduler(max_concurrency=max_concurrency, min_concurrency=1, initial_concurrency=initial_concurrency,
+                           **dict({"requests_per_minute": 0, "tokens_per_minute": 0}, **kwargs))
+
+
+def test_token_bucket_takes_releases_and_never_over_fills():
+    bucket = TokenBucket(3)
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    bucket.release(5)
+    assert bucket.available() == pytest.approx(3.0, abs=0.01)
+    assert TokenBucket(0).try_acquire(10**9) # 0 disables the limit
+
+
+class ApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+@pytest.mark.parametrize("error, kind", [
+    (Exception("429 Resource has been exhausted (e.g. check quota)."), "throttled"),
+    (type("ResourceExhausted", (Exception,), {})("rate limited"), "throttled"),
+    (ApiError(SimpleNamespace(value=503)), "server"), # grpc-style status enum
+    (type("ServiceUnavailable", (Exception,), {})("unavailable"), "server"),
+    (TimeoutError("read timed out"), "server"),
+    (ApiError(400), "other"),
+])
+def test_classify_gemini_error(error, kind):
+    assert classify_gemini_error(error) == kind
+
+
+def test_documents_are_served_round_robin_and_costliest_first():
+    scheduler = make_scheduler()
+    gate, order = threading.Event(), []
+
+    def task(name):
+        if name == "a1":
+            gate.wait(5)
+        order.append(name)
+
+    futures = [scheduler.submit("doc-a", task, "a1")]
+    time.sleep(0.05) # a1 is running and holds the only slot
+    futures += [scheduler.submit("doc-a", task, "a2", cost=1.0), scheduler.submit("doc-a", task, "a3", cost=5.0),
+                scheduler.submit("doc-b", task, "b1")]
+    gate.set()
+    for future in futures:
+        future.result(5)
+
+    assert order == ["a1", "a3", "b1", "a2"] # doc-b doesn't wait behind all of doc-a
+
+
+def test_backoff_halves_the_limit_once_per_cooldown_and_success_grows_it():
+    scheduler = make_scheduler(max_concurrency=16, initial_concurrency=8)
+
+    scheduler.record_backoff("throttled")
+    scheduler.record_backoff("throttled") # Same burst of 429s
+    assert scheduler.concurrency_limit() == 4
+
+    for _ in range(5):
+        scheduler.record_success() # +1/limit each, so about +1 per limit's worth of successes
+    assert scheduler.concurrency_limit() == 5
+    assert scheduler.snapshot()["throttled"] == 2
+
+
+def test_requeued_task_runs_again_with_new_arguments():
+    scheduler = make_scheduler()
+
+    def task(attempt=0):
+        if attempt == 0:
+            raise RequeueTask(0.01, attempt=1)
+        return attempt
+
+    assert scheduler.submit("doc", task).result(5) == 1
+    assert scheduler.snapshot()["requeued"] == 1
+
+
+def test_cancel_pending_drops_queued_tasks_only():
+    scheduler = make_scheduler()
+    gate = threading.Event()
+    running = scheduler.submit("doc", gate.wait, 5)
+    time.sleep(0.05)
+    queued = [scheduler.submit("doc", lambda: None) for _ in range(3)]
+
+    assert scheduler.cancel_pending("doc") == 3
+    gate.set()
+    assert running.result(5) is True
+    assert all(future.cancelled() for future in queued)
+
+
+@pytest.mark.parametrize("durations, slots, kwargs, expected", [
+    ([], 4, {}, 0.0),
+    ([5.0, 3.0, 3.0, 2.0, 2.0, 2.0], 2, {}, 9.0), # LPT: 5+2+2 and 3+3+2...
+    ([1.0, 1.0, 1.0], 8, {}, 1.0),
+    # A long chunk that arrives late finishes late, however many slots are idle
+    ([1.0, 1.0, 4.0], 8, {"arrivals": [0.0, 0.0, 6.0]}, 10.0),
+    # Slots idle until the first chunk arrives
+    ([2.0], 1, {"arrivals": [3.0]}, 5.0),
+    # Queued chunks are taken longest-first only among those that have arrived
+    ([1.0, 5.0, 1.0], 1, {"arrivals": [0.0, 0.5, 0.5]}, 7.0),
+    ([3.0, 1.0, 5.0], 1, {"arrivals": [0.0, 0.0, 0.0], "longest_first": False}, 9.0),
+    ([4.0, 1.0, 1.0, 1.0, 1.0], 2, {"arrivals": [0.0] * 5, "longest_first": False}, 4.0),
+    # Request budget binds: 200 calls at 100 per minute
+    ([1.0] * 200, 50, {"requests_per_minute": 100}, 60.0),
+    # ...and binds sooner when the bucket has already been drained by other work
+    ([1.0] * 200, 50, {"requests_per_minute": 100, "requests_available": 0}, 120.0),
+    ([1.0] * 50, 50, {"requests_per_minute": 100, "requests_available": 25}, 15.0),
+    ([1.0] * 10, 10, {"tokens_per_minute": 6000, "tokens": 10000, "tokens_available": 1000}, 90.0),
+    ([1.0] * 10, 10, {"tokens_per_minute": 6000, "tokens": 10000}, 40.0),
+])
+def test_predicted_makespan(durations, slots, kwargs, expected):
+    assert predicted_makespan(durations, slots, **kwargs) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("page_id, expected", [
+    ("12", (0, 12, 0)),
+    ("12-14", (0, 12, 0)),
+    ("12 (part 2/3)", (0, 12, 2)),
+    ("DOCX_Chunk_4", (0, 4, 0)),
+    (AMENDMENT_CARRYOVER_PAGE_ID, (-1, 0, 0)),
+])
+def test_page_order_key(page_id, expected):
+    assert page_order_key(page_id) == expected
+
+
+def test_chunk_cost_grows_with_numbered_paragraphs():
+    planner = ChunkPlanner()
+    prose = planner.pack_paragraphs(["The defendants met at trade association meetings. " * 20])[0]
+    numbered = planner.pack_paragraphs(["".join(f"{n}. Teva raised prices.\n" for n in range(1, 40))])[0]
+
+    prose_cost, numbered_cost = estimate_chunk_cost(prose), estimate_chunk_cost(numbered)
+    assert prose_cost.input_tokens > prose.tokens # Includes the prompt instructions
+    assert numbered_cost.output_tokens > prose_cost.output_tokens # One allegation per paragraph
+    assert numbered_cost.seconds > prose_cost.seconds
+
+
+def test_predicted_makespan_from_a_drained_scheduler_bucket():
+    scheduler = GeminiScheduler(max_concurrency=8, min_concurrency=1, initial_concurrency=8,
+                                requests_per_minute=60, tokens_per_minute=0)
+    while scheduler.try_acquire_rate(0):
+        pass # Another document has used this minute's requests
+
+    predicted = predicted_makespan([0.5] * 30, 8, requests_per_minute=60,
+                                   requests_available=scheduler.request_bucket.available())
+
+    assert predicted == pytest.approx(30.0, abs=0.5) # Every call waits for a refill, one per second
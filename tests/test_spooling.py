@@ -0,0 +1,31 @@
+import io
+import os
+
+import pytest
+
+import spooling
+from spooling import release_spooled_input, retain_spooled_input, spool_to_local_file
+
+
+def test_spool_copies_stream_and_enforces_max_bytes():
+    path = spool_to_local_file(io.BytesIO(b"%PDF-1.4 complaint"), suffix=".pdf")
+    with open(path, "rb") as spooled:
+        assert spooled.read() == b"%PDF-1.4 complaint"
+    assert path.startswith(spooling.SPOOL_DIR) and path.endswith(".pdf")
+    os.remove(path)
+
+    before = set(os.listdir(spooling.SPOOL_DIR))
+    with pytest.raises(ValueError):
+        spool_to_local_file(io.BytesIO(b"x" * 100), max_bytes=10)
+    assert set(os.listdir(spooling.SPOOL_DIR)) == before # The partial copy is removed
+
+
+def test_spooled_file_is_deleted_by_its_last_holder():
+    path = spool_to_local_file(io.BytesIO(b"complaint"))
+    retain_spooled_input(path, holders=2) # Archival upload and analysis job
+
+    release_spooled_input(path)
+    assert os.path.exists(path)
+    release_spooled_input(path)
+    assert not os.path.exists(path)
+    release_spooled_input(path) # Releasing a file that is already gone is harmless
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import REPO_ROOT
+
+CHECK_IMPORT = """
+import json, threading, time
+from job_store import JOB_DB_PATH, JobStore
+JobStore(JOB_DB_PATH).create("queued-job", "complaint.pdf", "queued-job_complaint.pdf", {})
+
+import app
+after_import = {
+    "threads": sorted(thread.name for thread in threading.enumerate()),
+    "clients_ready": app.clients_ready.is_set(),
+    "job_status": JobStore(JOB_DB_PATH).get("queued-job")["status"],
+}
+app.start_background_services()
+app.start_background_services()
+ready = app.clients_ready.wait(30)
+print("OUTCOME", json.dumps({"after_import": after_import, "ready": ready}))
+"""
+
+
+def test_import_starts_nothing_until_start_background_services(tmp_path):
+    env = dict(os.environ, LOCAL_STATE_DIR=str(tmp_path), GEMINI_BACKEND="fake", AZURE_STORAGE_BACKEND="memory")
+    child = subprocess.run([sys.executable, "-c", CHECK_IMPORT], cwd=REPO_ROOT, env=env,
+                           capture_output=True, text=True, timeout=120)
+    assert child.returncode == 0, child.stderr[-2000:]
+    outcome = json.loads(next(line for line in child.stdout.splitlines() if line.startswith("OUTCOME "))[8:])
+
+    after_import = outcome["after_import"]
+    assert not any(name in ("client-init", "allegation-index-backfill") or name.startswith("init-")
+                   for name in after_import["threads"])
+    assert after_import["clients_ready"] is False
+    assert after_import["job_status"] == "queued" # Not claimed by the import
+    assert outcome["ready"] is True
+
+
+def test_ready_reports_each_client_once_setup_finishes(client):
+    response = client.get("/ready")
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["status"] == "ready"
+    assert {name: status["state"] for name, status in body["clients"].items()} == {"blob_storage": "ready",
+                                                                                      "gemini": "ready"}
+    assert body["uptime_seconds"] > 0
@@ -0,0 +1,34 @@
+import json
+from functools import partial
+
+import pytest
+
+import analysis_jobs
+
+FILLER = " The increase was coordinated in calls and meetings among the defendants' sales executives." * 4
+DRUGS = ["digoxin", "clobetasol", "carbamazepine", "pravastatin", "doxycycline", "baclofen", "nystatin", "glyburide"]
+PAGES = [[f"{n}. Teva and Mylan raised the price of {drug} in 2014." + FILLER] for n, drug in enumerate(DRUGS, start=1)]
+
+
+def found(job):
+    return sorted((row["Product_Name"], row["Pin_Cite_Page"]) for row in json.loads(job["results_json"]))
+
+
+@pytest.fixture(autouse=True)
+def page_per_chunk(monkeypatch):
+    monkeypatch.setattr(analysis_jobs, "ChunkPlanner", partial(analysis_jobs.ChunkPlanner, token_budget=150))
+
+
+def test_streaming_keeps_pages_in_flight_under_the_window(run_job, monkeypatch):
+    buffered = run_job(PAGES)
+    monkeypatch.setattr(analysis_jobs, "STREAMING_EXTRACTION_MIN_PAGES", 0)
+    monkeypatch.setattr(analysis_jobs, "MAX_PAGES_IN_FLIGHT", 2)
+
+    streamed = run_job(PAGES)
+
+    assert streamed["status"] == "succeeded"
+    stats = streamed["stats"]["streaming"]
+    assert stats["enabled"] and stats["max_pages_in_flight"] == 2
+    assert 1 <= stats["peak_pages_in_flight"] <= 2
+    assert found(streamed) == found(buffered) and len(found(streamed)) == len(PAGES)
+    assert not buffered["stats"]["streaming"]["enabled"]